@@ -0,0 +1,367 @@
+# async_database.py
+import asyncio
+import contextlib
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (CACHE_SIZE, CACHE_TTL, FOLLOW_ALL_DEFAULT, DELIVERY_MAX_FAILURES, DB_SYNCHRONOUS,
+                    DB_GROUP_COMMIT_WINDOW, DB_GROUP_COMMIT_MAX)
+from database import Database
+from utils import metrics
+from utils.cache import TTLCache, MISSING
+
+# база, транзакция которой открыта в текущем контексте (задаче) — её записи идут без очереди
+_transaction = contextvars.ContextVar("db_transaction", default=None)
+# сбросы кешей, отложенные до COMMIT этой транзакции
+_after_commit = contextvars.ContextVar("db_after_commit", default=None)
+
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад над Database с теми же методами.
+    Запись идёт в одном выделенном потоке писателя, чтение — в небольшом пуле
+    потоков, у каждого из которых своё WAL-соединение только для чтения.
+    Хендлеры просто делают `await db.get_track(tid)` и не блокируют event loop.
+
+    Перед частыми чтениями (трек, артист, карточки пользователя, известные
+    пользователи) стоит read-through кеш, который сбрасывается пишущими методами.
+
+    `async with db.transaction():` объединяет несколько записей в одну транзакцию;
+    пока она открыта, записи из других задач ждут; кеши сбрасываются после её COMMIT.
+    С group_commit_window > 0 записи, пришедшие в пределах окна (секунд),
+    фиксируются одним COMMIT.
+    """
+
+    def __init__(self, path="database.db", readers=4, synchronous=DB_SYNCHRONOUS,
+                 group_commit_window=DB_GROUP_COMMIT_WINDOW, group_commit_max=DB_GROUP_COMMIT_MAX):
+        self.sync = Database(path, synchronous)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._write_lock = asyncio.Lock()
+        self.group_commit_window = group_commit_window
+        self.group_commit_max = group_commit_max
+        self._group = []
+        self._group_full = None
+
+        self.tracks = TTLCache(CACHE_SIZE, CACHE_TTL)
+        self.artists = TTLCache(CACHE_SIZE, CACHE_TTL)
+        self.user_artists = TTLCache(CACHE_SIZE, CACHE_TTL)
+        # подписки пользователя (frozenset id карточек): кнопка подписки на каждой странице артиста;
+        # в кластере апдейты пользователя идут в один процесс, так что кеш меняет только он
+        self.follows = TTLCache(CACHE_SIZE, CACHE_TTL)
+        self.known_users = TTLCache(CACHE_SIZE * 4, CACHE_TTL * 12)
+        # пользователи, про которых известно, что они не исключены из рассылок
+        self.reachable_users = TTLCache(CACHE_SIZE * 4, CACHE_TTL * 12)
+        # растёт при любом изменении артистов или общих треков; ключ для кеша клавиатур
+        self.catalog_version = 0
+
+    def _execute(self, executor, kind, name, fn, *args):
+        """Выполняет fn в потоке executor, замеряя ожидание потока и сам запрос."""
+        queued = time.perf_counter()
+
+        def timed():
+            # ожидание потока и сам запрос меряются отдельно: первое показывает очередь к писателю
+            started = time.perf_counter()
+            metrics.db_wait_seconds.observe(started - queued, kind)
+            try:
+                return fn(*args)
+            except Exception:
+                metrics.db_errors.inc(name)
+                raise
+            finally:
+                metrics.db_seconds.observe(time.perf_counter() - started, name)
+
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(executor, timed)
+
+    async def _run(self, name, *args, **kwargs):
+        """Выполняет метод Database в потоке писателя или в пуле читателей."""
+        method = getattr(self.sync, name)
+        kind = getattr(method, "db_kind", None)
+        if kind is None:
+            raise AttributeError(f"{name} не является методом запроса Database")
+        call = functools.partial(method, *args, **kwargs)
+        if kind == "read":
+            return await self._execute(self._readers, kind, name, call)
+        if _transaction.get() is self:
+            return await self._execute(self._writer, kind, name, call)
+        if self.group_commit_window:
+            return await self._grouped(name, method, args, kwargs)
+        async with self._write_lock:
+            return await self._execute(self._writer, kind, name, call)
+
+    async def _grouped(self, name, method, args, kwargs):
+        """Ставит запись в текущую группу; группа фиксируется через окно или когда наберётся."""
+        future = asyncio.get_running_loop().create_future()
+        self._group.append((name, method, args, kwargs, future))
+        if len(self._group) == 1:
+            self._group_full = asyncio.Event()
+            asyncio.create_task(self._commit_group(self._group_full))
+        elif len(self._group) >= self.group_commit_max:
+            self._group_full.set()
+        return await future
+
+    async def _commit_group(self, full):
+        try:
+            await asyncio.wait_for(full.wait(), self.group_commit_window)
+        except asyncio.TimeoutError:
+            pass
+        async with self._write_lock:
+            # пока ждали блокировку, группа могла пополниться — забираем всё, что есть
+            group, self._group = self._group, []
+            try:
+                results = await self._execute(self._writer, "write", "group_commit", self.sync.run_group,
+                                              [(m, a, k) for _, m, a, k, _ in group])
+            except Exception as e:
+                # не удался сам COMMIT — ошибка у всей группы
+                results = [(False, e)] * len(group)
+        metrics.db_group_size.observe(len(group))
+        for (name, _, _, _, future), (ok, value) in zip(group, results):
+            if not ok:
+                metrics.db_errors.inc(name)
+            if future.cancelled():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        Единица работы: записи внутри блока фиксируются одним COMMIT или откатываются вместе.
+        Чтения идут через соединения читателей и незафиксированных изменений блока не видят.
+        Вложенный блок становится частью внешнего.
+        """
+        if _transaction.get() is self:
+            yield self
+            return
+        async with self._write_lock:
+            token = _transaction.set(self)
+            actions = []
+            actions_token = _after_commit.set(actions)
+            try:
+                await self._execute(self._writer, "write", "begin", self.sync.begin)
+                try:
+                    yield self
+                except BaseException:
+                    await self._execute(self._writer, "write", "rollback", self.sync.end, False)
+                    raise
+                await self._execute(self._writer, "write", "commit", self.sync.end, True)
+            finally:
+                _after_commit.reset(actions_token)
+                _transaction.reset(token)
+        for action in actions:
+            action()
+
+    def _after_write(self, action):
+        """
+        Выполняет action (сброс кеша, новая версия каталога) после записи. Внутри transaction() —
+        только после COMMIT: иначе другая задача успела бы закешировать ещё не зафиксированное
+        состояние под новой версией; при откате действие отбрасывается вместе с записями.
+        """
+        actions = _after_commit.get()
+        if actions is not None and _transaction.get() is self:
+            actions.append(action)
+        else:
+            action()
+
+    def _bump_catalog(self):
+        self.catalog_version += 1
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+        if getattr(method, "db_kind", None) is None:
+            raise AttributeError(f"{name} не является методом запроса Database")
+
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self._run(name, *args, **kwargs)
+
+        # кешируем обёртку, чтобы __getattr__ не вызывался повторно
+        setattr(self, name, call)
+        return call
+
+    async def _cached(self, cache, key, name, *args):
+        value = cache.get(key)
+        if value is MISSING:
+            value = await self._run(name, *args)
+            # отсутствующие строки не кешируем: их id ещё могут появиться
+            if value is not None:
+                cache.set(key, value)
+        return value
+
+    # --- кешируемые чтения ---
+    async def get_track(self, track_id):
+        return await self._cached(self.tracks, track_id, "get_track", track_id)
+
+    async def get_artist(self, artist_id):
+        return await self._cached(self.artists, artist_id, "get_artist", artist_id)
+
+    async def get_user_artists(self, user_id):
+        return await self._cached(self.user_artists, user_id, "get_user_artists", user_id)
+
+    async def is_following(self, user_id, artist_id):
+        return artist_id in await self._cached(self.follows, user_id, "get_followed_artist_ids", user_id)
+
+    async def watch_catalog(self, interval):
+        """
+        Когда с базой работают несколько процессов: раз в interval секунд сверяет счётчики
+        изменений. Изменился каталог — сбрасывает кеши треков, артистов и клавиатур;
+        изменилась доставка (блокировки, в том числе из рассылок других процессов) —
+        кеш доступных пользователей.
+        """
+        epoch = await self._run("get_catalog_epoch")
+        delivery_epoch = await self._run("get_delivery_epoch")
+        while True:
+            await asyncio.sleep(interval)
+            current = await self._run("get_catalog_epoch")
+            if current != epoch:
+                epoch = current
+                self.tracks.clear()
+                self.artists.clear()
+                self.user_artists.clear()
+                self.catalog_version += 1
+            current = await self._run("get_delivery_epoch")
+            if current != delivery_epoch:
+                delivery_epoch = current
+                self.reachable_users.clear()
+
+    async def iter_deliverable_users(self, batch_size=500):
+        """Все пользователи, которым можно доставлять сообщения, — читаются из БД пачками."""
+        cursor = 0
+        while True:
+            batch = await self._run("get_deliverable_after", cursor, batch_size)
+            for uid in batch:
+                yield uid
+            if len(batch) < batch_size:
+                return
+            cursor = batch[-1]
+
+    async def iter_common_tracks(self, batch_size=500):
+        """Весь общий каталог, новые первыми, — читается из БД пачками, в памяти одна пачка."""
+        cursor = None
+        while True:
+            batch = await self._run("page_common_tracks", cursor, batch_size)
+            for track in batch[:batch_size]:
+                yield track
+            if len(batch) <= batch_size:
+                return
+            last = batch[batch_size - 1]
+            cursor = (last.created_at, last.id)
+
+    # --- записи с инвалидацией ---
+    async def add_user(self, telegram_id, name):
+        # для уже известного пользователя INSERT OR IGNORE ничего бы не изменил
+        if self.known_users.get(telegram_id) is not MISSING:
+            return
+        await self._run("add_user", telegram_id, name, FOLLOW_ALL_DEFAULT)
+        self._after_write(lambda: self.known_users.set(telegram_id, True))
+
+    async def ensure_reachable(self, telegram_id):
+        """Пользователь прислал апдейт — значит, бот ему снова доступен: вернуть его в рассылки."""
+        if self.reachable_users.get(telegram_id) is not MISSING:
+            return
+        state = await self._run("get_delivery_state", telegram_id)
+        if state and (state[0] != "active" or state[1]):
+            await self._run("set_delivery_blocked", telegram_id, False)
+        self._after_write(lambda: self.reachable_users.set(telegram_id, True))
+
+    async def set_delivery_blocked(self, telegram_id, blocked):
+        await self._run("set_delivery_blocked", telegram_id, blocked)
+        self._after_write(lambda: self.reachable_users.invalidate(telegram_id))
+
+    async def record_delivery(self, sent, blocked, failed, max_failures=DELIVERY_MAX_FAILURES):
+        await self._run("record_delivery", sent, blocked, failed, max_failures)
+
+        def invalidate():
+            for uid, _ in (*blocked, *failed):
+                self.reachable_users.invalidate(uid)
+        self._after_write(invalidate)
+
+    async def add_artist(self, user_id, name):
+        artist_id = await self._run("add_artist", user_id, name)
+        self._after_write(lambda: (self.user_artists.invalidate(user_id), self._bump_catalog()))
+        return artist_id
+
+    async def delete_artist(self, artist_id, user_id):
+        await self._run("delete_artist", artist_id, user_id)
+
+        def invalidate():
+            self.artists.invalidate(artist_id)
+            self.user_artists.invalidate(user_id)
+            self.follows.clear()  # вместе с карточкой удалены и подписки на неё
+            self._bump_catalog()
+        self._after_write(invalidate)
+
+    async def follow_artist(self, user_id, artist_id):
+        await self._run("follow_artist", user_id, artist_id)
+        self._after_write(lambda: self.follows.invalidate(user_id))
+
+    async def unfollow_artist(self, user_id, artist_id):
+        await self._run("unfollow_artist", user_id, artist_id)
+        self._after_write(lambda: self.follows.invalidate(user_id))
+
+    async def get_or_create_first_artist(self, user_id, username_fallback):
+        result = await self._run("get_or_create_first_artist", user_id, username_fallback)
+        self._after_write(lambda: (self.user_artists.invalidate(user_id), self._bump_catalog()))
+        return result
+
+    async def add_common_track(self, *args, **kwargs):
+        track_id = await self._run("add_common_track", *args, **kwargs)
+        self._after_write(self._bump_catalog)
+        return track_id
+
+    async def add_album(self, user_id, tracks, artist_id=None, **kwargs):
+        track_ids = await self._run("add_album", user_id, tracks, artist_id, **kwargs)
+        if artist_id is not None:
+            self._after_write(self._bump_catalog)
+        return track_ids
+
+    def _invalidate_tracks(self, track_ids):
+        def invalidate():
+            for track_id in track_ids or ():
+                self.tracks.invalidate(track_id)
+        self._after_write(invalidate)
+
+    async def set_track_storage(self, track_id, file_id, storage_message_id):
+        exists = await self._run("set_track_storage", track_id, file_id, storage_message_id)
+        self._invalidate_tracks((track_id,))
+        return exists
+
+    async def set_object_storage(self, file_unique_id, file_id, storage_message_id):
+        track_ids = await self._run("set_object_storage", file_unique_id, file_id, storage_message_id)
+        self._invalidate_tracks(track_ids)
+        return track_ids
+
+    async def copy_analysis(self, file_unique_id):
+        track_ids = await self._run("copy_analysis", file_unique_id)
+        self._invalidate_tracks(track_ids)
+        return track_ids
+
+    async def set_analysis(self, track_id, file_unique_id, result, duplicate_of=None):
+        track_ids = await self._run("set_analysis", track_id, file_unique_id, result, duplicate_of)
+        self._invalidate_tracks(track_ids)
+        return track_ids
+
+    async def delete_track(self, track_id):
+        orphan_message_id = await self._run("delete_track", track_id)
+        self._after_write(lambda: (self.tracks.invalidate(track_id), self._bump_catalog()))
+        return orphan_message_id
+
+    def cache_stats(self):
+        return {
+            "tracks": self.tracks.stats(),
+            "artists": self.artists.stats(),
+            "user_artists": self.user_artists.stats(),
+            "follows": self.follows.stats(),
+            "known_users": self.known_users.stats(),
+            "reachable_users": self.reachable_users.stats(),
+        }
+
+    def close(self):
+        self._readers.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
+        self.sync.close()
@@ -0,0 +1,109 @@
+# bench/audio_analysis.py
+"""
+Пропускная способность анализа аудио (utils/audio.py): файлы в секунду и МБ/с
+при разборе в пуле из N процессов, и скорость сравнения отпечатков при поиске
+почти-дубликатов. Файлы — аргументами; без них генерируются MP3 и WAV с тишиной.
+ffmpeg/fpcalc подключаются, если найдены (как в боте).
+
+    python -m bench.audio_analysis --processes 1,2,4 ~/Music/*.mp3
+    python -m bench.audio_analysis --files 200 --candidates 50
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import struct
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+
+from config import FFMPEG_PATH, FPCALC_PATH, DUPLICATE_THRESHOLD  # noqa: E402
+from utils import audio  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*", help="аудиофайлы; без них — синтетические")
+    parser.add_argument("--files", type=int, default=100, help="синтетических файлов")
+    parser.add_argument("--seconds", type=int, default=180, help="длительность синтетического файла")
+    parser.add_argument("--processes", default="1,2,4", help="размеры пула через запятую")
+    parser.add_argument("--candidates", type=int, default=50, help="кандидатов на один поиск дубликата")
+    parser.add_argument("--no-tools", action="store_true", help="не вызывать ffmpeg/fpcalc")
+    return parser.parse_args()
+
+
+def synthetic_mp3(seconds, title="Bench"):
+    """ID3v2 с названием и кадры MPEG-1 Layer III 128 кбит/с, 44.1 кГц без Xing — битрейт постоянный."""
+    text = b"\x03" + title.encode()
+    frame = b"TIT2" + struct.pack(">I", len(text)) + b"\x00\x00" + text
+    size = len(frame)
+    tag = b"ID3\x03\x00\x00" + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    mpeg = b"\xff\xfb\x90\x64" + bytes(413)  # 144 * 128000 / 44100 = 417 байт
+    return tag + frame + mpeg * int(seconds * 44100 / 1152)
+
+
+def synthetic_wav(seconds, rate=8000, channels=1):
+    data = bytes(seconds * rate * channels * 2)
+    fmt = struct.pack("<HHIIHH", 1, channels, rate, rate * channels * 2, channels * 2, 16)
+    return (b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE" + b"fmt " + struct.pack("<I", 16) + fmt
+            + b"data" + struct.pack("<I", len(data)) + data)
+
+
+def load(args):
+    """Пути к файлам: анализ, как и в боте, получает путь к скачанному файлу."""
+    if args.paths:
+        return args.paths
+    folder = tempfile.mkdtemp(prefix="bench-audio-")
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(folder, f"{i}.{'mp3' if i % 2 else 'wav'}")
+        with open(path, "wb") as f:
+            f.write(synthetic_mp3(args.seconds, f"Track {i}") if i % 2 else synthetic_wav(args.seconds))
+        paths.append(path)
+    return paths
+
+
+def bench_pool(files, processes, tools):
+    ffmpeg, fpcalc = (FFMPEG_PATH, FPCALC_PATH) if tools else (None, None)
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(os.path.getsize, files[:processes]))  # прогрев: запуск процессов
+        started = time.perf_counter()
+        results = list(pool.map(audio.analyze, files, [ffmpeg] * len(files), [fpcalc] * len(files)))
+        elapsed = time.perf_counter() - started
+    size = sum(map(os.path.getsize, files)) / 1e6
+    parsed = sum(1 for r in results if r.get("duration"))
+    print(f"процессов={processes}: {len(files) / elapsed:.1f} файлов/с, {size / elapsed:.1f} МБ/с "
+          f"(разобрано {parsed}/{len(files)})")
+    return results
+
+
+def bench_similarity(results, candidates):
+    """Поиск дубликата среди candidates отпечатков; без fpcalc — случайные отпечатки длины 60-секундного."""
+    rng = random.Random(1)
+    prints = [r["fingerprint"] for r in results if r.get("fingerprint")]
+    if len(prints) < 2:
+        prints = [struct.pack("<480I", *(rng.getrandbits(32) for _ in range(480))) for _ in range(candidates + 1)]
+    query, pool = prints[0], [(i, prints[i % len(prints)]) for i in range(1, candidates + 1)]
+    started = time.perf_counter()
+    audio.best_match(query, pool, DUPLICATE_THRESHOLD)
+    elapsed = time.perf_counter() - started
+    print(f"сравнение отпечатков: {candidates / elapsed:.0f} сравнений/с, "
+          f"поиск среди {candidates} кандидатов — {elapsed * 1000:.1f} мс")
+
+
+def main():
+    args = parse_args()
+    files = load(args)
+    tools = not args.no_tools and (FFMPEG_PATH or FPCALC_PATH)
+    print(f"файлов: {len(files)}, {sum(map(os.path.getsize, files)) / 1e6:.1f} МБ; ядер: {os.cpu_count()}; "
+          f"ffmpeg: {FFMPEG_PATH if tools else 'нет'}, fpcalc: {FPCALC_PATH if tools else 'нет'}")
+    results = []
+    for processes in (int(n) for n in args.processes.split(",")):
+        results = bench_pool(files, processes, tools)
+    bench_similarity(results, args.candidates)
+
+
+if __name__ == "__main__":
+    main()
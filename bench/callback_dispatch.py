@@ -0,0 +1,127 @@
+# bench/callback_dispatch.py
+"""
+Стоимость маршрутизации одного callback_query: прежняя цепочка фильтров
+(F.data.startswith / lambda по пяти роутерам, id разбирается split) против
+таблицы префиксов utils/callbacks.py. Хендлеры пустые, FSM выключен —
+замеряется только путь апдейта через Dispatcher до хендлера.
+
+    python -m bench.callback_dispatch --updates 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+
+from aiogram import Bot, Dispatcher, F, Router  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from bench.fake_telegram import FakeTelegramSession, callback_update  # noqa: E402
+from utils.callbacks import (CallbackTable, PlayTrack, ListenTrack, DeleteTrack, PublishTrack, CatalogPage,  # noqa: E402
+                             ArtistsPage, ArtistPage, FollowArtist, UploadArtist, MetadataArtist)
+
+# (роутер, фильтр прежнего формата, пример старого callback_data, фабрика или строка, пример нового)
+ROUTES = [
+    ("start", F.data == "about_bot", "about_bot", "about_bot", "about_bot"),
+    ("start", F.data == "back_main", "back_main", "back_main", "back_main"),
+    ("start", F.data.startswith("play_"), "play_4821", PlayTrack, PlayTrack(track_id=4821)),
+    ("start", F.data.startswith("listen_"), "listen_4821", ListenTrack, ListenTrack(track_id=4821)),
+    ("start", F.data.startswith("delete_"), "delete_4821", DeleteTrack, DeleteTrack(track_id=4821)),
+    ("start", F.data.startswith("make_public_"), "make_public_4821", PublishTrack, PublishTrack(track_id=4821)),
+    ("upload", F.data == "add_track", "add_track", "add_track", "add_track"),
+    ("upload", F.data == "cancel_upload", "cancel_upload", "cancel_upload", "cancel_upload"),
+    ("upload", F.data.in_(["save_personal", "save_common"]), "save_common", "save_common", "save_common"),
+    ("upload", F.data.startswith("choose_artist_"), "choose_artist_17", UploadArtist, UploadArtist(artist_id=17)),
+    ("playlists", lambda c: c.data == "my_catalog" or c.data.startswith("cat:"), "cat:n:sx0f5c.3r9",
+     CatalogPage, CatalogPage(nav="n", key="sx0f5c.3r9")),
+    ("artist", lambda c: c.data == "common_playlist" or c.data.startswith("arts:"), "arts:n:h1",
+     ArtistsPage, ArtistsPage(nav="n", key="h1")),
+    ("artist", lambda c: c.data.startswith("artist_") or c.data.startswith("at:"), "at:17:n:sx0f5c.3r9",
+     ArtistPage, ArtistPage(artist_id=17, nav="n", key="sx0f5c.3r9")),
+    ("artist", F.data.startswith("follow_") | F.data.startswith("unfollow_"), "follow_17",
+     FollowArtist, FollowArtist(artist_id=17, follow=True)),
+    ("artist", F.data.in_(["subscriptions", "subs_all"]), "subs_all", "subs_all", "subs_all"),
+    ("artist", lambda c: c.data == "my_artist", "my_artist", "my_artist", "my_artist"),
+    ("artist", lambda c: c.data == "create_artist_card", "create_artist_card", "create_artist_card",
+     "create_artist_card"),
+    ("metadata", F.data == "edit_metadata", "edit_metadata", "edit_metadata", "edit_metadata"),
+    ("metadata", F.data.startswith("meta_artist_"), "meta_artist_17", MetadataArtist, MetadataArtist(artist_id=17)),
+    ("metadata", F.data == "confirm_metadata", "confirm_metadata", "confirm_metadata", "confirm_metadata"),
+    ("metadata", F.data == "cancel_metadata", "cancel_metadata", "cancel_metadata", "cancel_metadata"),
+    ("search", F.data == "search", "search", "search", "search"),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=3, help="повторов, берётся лучший")
+    return parser.parse_args()
+
+
+def filter_chain():
+    """Прежняя схема: роутер на модуль, фильтры проверяются по очереди."""
+    dp = Dispatcher(disable_fsm=True)
+    routers = {}
+    for name, flt, _, _, _ in ROUTES:
+        router = routers.get(name)
+        if router is None:
+            router = routers[name] = Router(name=name)
+            dp.include_router(router)
+
+        async def handler(callback):
+            # как прежние хендлеры: id из хвоста callback_data
+            tail = callback.data.rsplit("_", 1)[-1].rsplit(":", 1)[-1]
+            return int(tail) if tail.isdigit() else None
+
+        router.callback_query.register(handler, flt)
+    return dp
+
+
+def prefix_table():
+    dp = Dispatcher(disable_fsm=True)
+    table = CallbackTable()
+    for _, _, _, target, _ in ROUTES:
+        @table.route(target)
+        async def handler(callback, callback_data=None):
+            return callback_data
+    dp.include_router(table.router)
+    return dp
+
+
+async def measure(dp, bot, updates, rounds):
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for update in updates:
+            await dp.feed_update(bot, update)
+        best = min(best, time.perf_counter() - started)
+    return best / len(updates)
+
+
+async def main():
+    args = parse_args()
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=FakeTelegramSession())
+    rng = random.Random(1)
+    picks = [rng.randrange(len(ROUTES)) for _ in range(args.updates)]
+    old = [Update(**callback_update(1, ROUTES[i][2])) for i in picks]
+    new = [Update(**callback_update(1, ROUTES[i][4] if isinstance(ROUTES[i][4], str) else ROUTES[i][4].pack()))
+           for i in picks]
+
+    chain = await measure(filter_chain(), bot, old, args.rounds)
+    table = await measure(prefix_table(), bot, new, args.rounds)
+    print(f"маршрутов: {len(ROUTES)}, апдейтов: {args.updates}")
+    print(f"цепочка фильтров: {chain * 1e6:.1f} мкс/апдейт")
+    print(f"таблица префиксов: {table * 1e6:.1f} мкс/апдейт ({chain / table:.1f}x)")
+
+    # худший случай прежней схемы — последний фильтр последнего роутера
+    last = ROUTES[-1]
+    chain_last = await measure(filter_chain(), bot, [Update(**callback_update(1, last[2]))] * 2000, args.rounds)
+    table_last = await measure(prefix_table(), bot, [Update(**callback_update(1, last[4]))] * 2000, args.rounds)
+    print(f"последний маршрут: {chain_last * 1e6:.1f} против {table_last * 1e6:.1f} мкс/апдейт")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
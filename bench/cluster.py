@@ -0,0 +1,87 @@
+# bench/cluster.py
+"""
+Пропускная способность многопроцессного режима: Front раздаёт апдейты
+N процессам-обработчикам (cluster.py) с подменённым Bot API, замеряется
+время от первого апдейта до завершения всех обработчиков.
+Имеет смысл сравнивать на машине с числом ядер не меньше N.
+
+    python -m bench.cluster --workers 1,2,4 --updates 4000 --users 400
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "cluster.db"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4", help="числа обработчиков через запятую")
+    parser.add_argument("--updates", type=int, default=4000)
+    parser.add_argument("--users", type=int, default=400, help="разных пользователей в потоке апдейтов")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, секунд")
+    return parser.parse_args()
+
+
+def bench_worker(index, port):
+    """Процесс-обработчик с подменённым Bot API (target для cluster.Front)."""
+    from aiogram import Bot
+    import cluster
+    from bench.fake_telegram import FakeTelegramSession
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=FakeTelegramSession(latency=float(os.environ["BENCH_LATENCY"])))
+    asyncio.run(cluster.run_worker(bot, index, port))
+
+
+def make_updates(path, count, users, seed=1):
+    """Апдейты сценария просмотра: /start, общий плейлист, страница артиста, прослушивание."""
+    from bench.fake_telegram import message_update, callback_update
+    from bench.seed import SEED_USER_BASE
+    from utils.callbacks import ArtistsPage, ArtistPage, ListenTrack
+    conn = sqlite3.connect(path)
+    pairs = conn.execute(
+        "SELECT artist_id, id FROM tracks WHERE is_common = 1 AND artist_id IS NOT NULL LIMIT 500"
+    ).fetchall()
+    conn.close()
+    rng = random.Random(seed)
+    updates = []
+    while len(updates) < count:
+        uid = SEED_USER_BASE + rng.randrange(users)
+        artist_id, track_id = rng.choice(pairs)
+        updates += [message_update(uid, "/start"), callback_update(uid, ArtistsPage().pack()),
+                    callback_update(uid, ArtistPage(artist_id=artist_id).pack()),
+                    callback_update(uid, ListenTrack(track_id=track_id).pack())]
+    return updates[:count]
+
+
+async def run(workers, updates):
+    import cluster
+    front = cluster.Front(workers, target=bench_worker)
+    await front.start()
+    started = time.perf_counter()
+    for update in updates:
+        await front.dispatch(update)
+    await front.stop()
+    elapsed = time.perf_counter() - started
+    print(f"обработчиков={workers}: {len(updates)} апдейтов за {elapsed:.2f}s — {len(updates) / elapsed:.0f}/с")
+
+
+async def main():
+    args = parse_args()
+    os.environ["BENCH_LATENCY"] = str(args.latency)
+    from bench.seed import seed
+    path = os.environ["DATABASE_PATH"]
+    seed(path, users=max(args.users, 1000), artists=500, tracks=20_000)
+    updates = make_updates(path, args.updates, args.users)
+    print(f"ядер: {os.cpu_count()}, задержка API {args.latency}s")
+    for workers in (int(n) for n in args.workers.split(",")):
+        await run(workers, updates)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+# bench/db_writes.py
+"""
+Пропускная способность записи в БД через AsyncDatabase: конкурентные задачи
+вставляют треки, замеряются вставки в секунду и задержка одной записи.
+Сравниваются synchronous=FULL/NORMAL и групповой коммит с разными окнами.
+
+    python -m bench.db_writes --writes 5000 --concurrency 64
+    python -m bench.db_writes --modes FULL:0,NORMAL:0,NORMAL:0.002
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+
+from async_database import AsyncDatabase  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64, help="одновременно пишущих задач")
+    parser.add_argument("--modes", default="FULL:0,NORMAL:0,FULL:0.002,NORMAL:0.002",
+                        help="synchronous:окно группового коммита в секундах, через запятую")
+    return parser.parse_args()
+
+
+async def run(mode, window, writes, concurrency):
+    path = os.path.join(tempfile.mkdtemp(), "writes.db")
+    db = AsyncDatabase(path, synchronous=mode, group_commit_window=window)
+    latencies = []
+    counter = iter(range(writes))
+
+    async def writer(worker):
+        for n in counter:
+            started = time.perf_counter()
+            await db.add_user_track(user_id=worker, file_id=f"f{n}", title=f"Track {n}", performer="Bench")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    count = db.sync.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+    db.close()
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{mode:6s} окно={window * 1000:4.1f}мс  {writes / elapsed:8.0f} вставок/с  "
+          f"p50={statistics.median(latencies) * 1000:6.2f}мс p99={p99 * 1000:6.2f}мс  строк={count}")
+
+
+async def main():
+    args = parse_args()
+    for item in args.modes.split(","):
+        mode, window = item.split(":")
+        await run(mode, float(window), args.writes, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
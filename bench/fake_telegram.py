@@ -0,0 +1,150 @@
+# bench/fake_telegram.py
+"""
+Локальная подмена Telegram Bot API для бенчмарков.
+FakeTelegramSession подключается к Bot(session=...) и отвечает на методы API
+без сети: с настраиваемой задержкой, инъекцией RetryAfter и очередью апдейтов
+для getUpdates. Все вызовы считаются по методам.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from aiogram.client.session.base import BaseSession
+
+BOT_USER = {"id": 42, "is_bot": True, "first_name": "GarageLib", "username": "garagelib_bot"}
+
+
+class FakeTelegramSession(BaseSession):
+    def __init__(self, latency=0.0, retry_after_rate=0.0, retry_after=1, on_call=None):
+        super().__init__()
+        self.latency = latency
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.on_call = on_call
+        self.calls = Counter()
+        self.retry_afters = 0
+        self._message_ids = itertools.count(1)
+        self._updates = asyncio.Queue()
+
+    # --- апдейты для getUpdates ---
+    def push_update(self, update: dict):
+        self._updates.put_nowait(update)
+
+    async def _get_updates(self, method):
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self._updates.get(), timeout=method.timeout or 0.1))
+        except asyncio.TimeoutError:
+            return []
+        while not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    # --- ответы API ---
+    def _message(self, chat_id, **extra):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **extra,
+        }
+
+    def _audio(self, file_id):
+        return {"file_id": f"{file_id}-stored", "file_unique_id": f"u-{file_id}", "duration": 180}
+
+    async def _result(self, name, method):
+        if name == "getUpdates":
+            return await self._get_updates(method)
+        if name == "getMe":
+            return BOT_USER
+        if name in ("sendMessage", "editMessageText"):
+            return self._message(getattr(method, "chat_id", None) or 0, text=method.text)
+        if name == "sendAudio":
+            audio = method.audio if isinstance(method.audio, str) else "upload"
+            return self._message(method.chat_id, audio=self._audio(audio))
+        if name == "sendMediaGroup":
+            return [self._message(method.chat_id, audio=self._audio(m.media)) for m in method.media]
+        if name == "getFile":
+            return {"file_id": method.file_id, "file_unique_id": f"u-{method.file_id}", "file_path": "music/file.mp3"}
+        return True
+
+    async def make_request(self, bot, method, timeout=None):
+        name = method.__api_method__
+        self.calls[name] += 1
+        if name != "getUpdates":
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.on_call:
+                self.on_call(name, method)
+            if self.retry_after_rate and random.random() < self.retry_after_rate:
+                self.retry_afters += 1
+                payload = {"ok": False, "error_code": 429, "description": "Too Many Requests",
+                           "parameters": {"retry_after": self.retry_after}}
+                return self.check_response(bot, method, 429, json.dumps(payload)).result
+        payload = {"ok": True, "result": await self._result(name, method)}
+        return self.check_response(bot, method, 200, json.dumps(payload)).result
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+# --- конструкторы апдейтов ---
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def message_update(user_id, text=None, **extra):
+    message = {
+        "message_id": next(_update_ids),
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": _user(user_id),
+        **extra,
+    }
+    if text is not None:
+        message["text"] = text
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def audio_update(user_id, file_id, title="Demo", performer="Artist", media_group_id=None):
+    extra = {"audio": {"file_id": file_id, "file_unique_id": f"u-{file_id}", "duration": 180,
+                       "title": title, "performer": performer}}
+    if media_group_id:
+        extra["media_group_id"] = media_group_id
+    return message_update(user_id, **extra)
+
+
+def inline_query_update(user_id, query, offset=""):
+    return {
+        "update_id": next(_update_ids),
+        "inline_query": {"id": str(next(_update_ids)), "from": _user(user_id), "query": query, "offset": offset},
+    }
+
+
+def callback_update(user_id, data):
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": "menu",
+            },
+        },
+    }
@@ -0,0 +1,213 @@
+# bench/load.py
+"""
+Нагрузочный тест всего бота: настоящий Dispatcher со всеми роутерами,
+подменённый Bot API (bench.fake_telegram) и база, наполненная bench.seed.
+Сценарии (пути пользователя) запускаются с заданной частотой, по каждому
+печатаются пропускная способность, p50/p99 шагов и сценария целиком и
+число исходящих вызовов API на один сценарий.
+
+    python -m bench.load --db /tmp/load.db --rate 50 --duration 30
+    python -m bench.load --db /tmp/load.db --mix browse=1 --latency 0.05 --retry-after-rate 0.01
+
+Вызовы API из фоновых задач (рассылка outbox, архивация) идут в строку background.
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+SCENARIOS = ("upload", "browse", "search")
+
+_scenario = contextvars.ContextVar("scenario", default="background")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="путь к базе; пустая база будет наполнена (по умолчанию временная)")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--artists", type=int, default=5_000)
+    parser.add_argument("--tracks", type=int, default=200_000)
+    parser.add_argument("--rate", type=float, default=20, help="новых сценариев в секунду")
+    parser.add_argument("--duration", type=float, default=20, help="сколько секунд запускать сценарии")
+    parser.add_argument("--mix", default="upload=1,browse=3,search=1", help="веса сценариев")
+    parser.add_argument("--think", type=float, default=0.0, help="пауза пользователя между шагами, секунд")
+    parser.add_argument("--latency", type=float, default=0.03, help="задержка ответа Bot API, секунд")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="доля вызовов, получающих 429")
+    parser.add_argument("--no-background", action="store_true", help="не запускать outbox и архиватор")
+    parser.add_argument("--metrics-port", type=int, default=0, help="поднять /metrics на этом порту")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class Recorder:
+    def __init__(self):
+        self.steps = defaultdict(list)
+        self.journeys = defaultdict(list)
+        self.calls = defaultdict(Counter)
+        self.errors = Counter()
+
+    def on_call(self, name, method):
+        self.calls[_scenario.get()][name] += 1
+
+    def report(self, elapsed):
+        print(f"\n{'сценарий':22s} {'n':>6s} {'в сек':>7s} {'p50, мс':>9s} {'p99, мс':>9s} {'ошибок':>7s}")
+        for scenario, samples in sorted(self.journeys.items()):
+            print(f"{scenario:22s} {len(samples):6d} {len(samples) / elapsed:7.1f} "
+                  f"{statistics.median(samples) * 1000:9.1f} {percentile(samples, 0.99) * 1000:9.1f} "
+                  f"{self.errors[scenario]:7d}")
+            for step, step_samples in self.steps.items():
+                if step[0] == scenario:
+                    print(f"  {step[1]:20s} {len(step_samples):6d} {'':7s} "
+                          f"{statistics.median(step_samples) * 1000:9.1f} "
+                          f"{percentile(step_samples, 0.99) * 1000:9.1f}")
+        print("\nисходящие вызовы API на сценарий (background — всего):")
+        for scenario, calls in sorted(self.calls.items()):
+            n = len(self.journeys[scenario]) if scenario in self.journeys else 1
+            per = ", ".join(f"{name}={count / n:g}" for name, count in calls.most_common())
+            print(f"  {scenario:20s} всего {sum(calls.values()):6d}: {per}")
+
+
+def load_fixtures(path):
+    """Данные для сценариев: пары (артист, его общий трек) и слова для поиска."""
+    conn = sqlite3.connect(path)
+    pairs = conn.execute(
+        "SELECT artist_id, id FROM tracks WHERE is_common = 1 AND artist_id IS NOT NULL ORDER BY random() LIMIT 2000"
+    ).fetchall()
+    words = [r[0].split()[0] for r in conn.execute("SELECT title FROM tracks ORDER BY random() LIMIT 500")]
+    user_ids = [r[0] for r in conn.execute("SELECT telegram_id FROM users")]
+    # загружают пользователи без карточек или с одной — иначе сценарий упрётся в выбор карточки
+    uploaders = [r[0] for r in conn.execute("""
+        SELECT u.telegram_id FROM users u LEFT JOIN artists a ON a.user_id = u.telegram_id
+        GROUP BY u.telegram_id HAVING COUNT(a.id) <= 1
+    """)]
+    conn.close()
+    return pairs, words, user_ids, uploaders
+
+
+async def main():
+    args = parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(), "load.db")
+    os.environ.setdefault("BOT_TOKEN", "42:LOAD")
+    os.environ["DATABASE_PATH"] = path
+    os.environ.setdefault("STORAGE_CHAT_ID", "-1000000000001")
+    os.environ["METRICS_PORT"] = str(args.metrics_port)
+
+    from bench.seed import seed
+    started = time.perf_counter()
+    counts = seed(path, args.users, args.artists, args.tracks, seed=args.seed)
+    print(f"база {path}: users={counts[0]} artists={counts[1]} tracks={counts[2]} "
+          f"({time.perf_counter() - started:.1f}s)")
+
+    # конфиг читает окружение при импорте, поэтому бот импортируется после настройки
+    from aiogram import Bot
+    from aiogram.methods import TelegramMethod
+    from aiogram.types import Update
+    import bot as bot_module
+    from bench.fake_telegram import (FakeTelegramSession, message_update, callback_update, audio_update,
+                                     inline_query_update)
+    from utils.callbacks import ArtistsPage, ArtistPage, ListenTrack
+    from utils.instrumentation import instrument_bot, register_runtime_gauges
+    from utils.metrics import start_metrics_server
+    from utils.outbox import outbox
+    from utils.storage_queue import archiver
+    from db_instance import db
+
+    rng = random.Random(args.seed)
+    pairs, words, user_ids, uploaders = load_fixtures(path)
+    recorder = Recorder()
+    session = FakeTelegramSession(latency=args.latency, retry_after_rate=args.retry_after_rate,
+                                  on_call=recorder.on_call)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    instrument_bot(bot)
+    dp = bot_module.build_dispatcher()
+
+    background = []
+    if not args.no_background:
+        background = [asyncio.create_task(outbox.run(bot)), asyncio.create_task(archiver.run(bot))]
+    metrics_runner = None
+    if args.metrics_port:
+        register_runtime_gauges(dp.storage)
+        metrics_runner = await start_metrics_server("127.0.0.1", args.metrics_port)
+
+    async def step(scenario, label, update):
+        began = time.perf_counter()
+        # как при polling: метод, возвращённый хендлером, выполняется отдельным запросом
+        result = await dp.feed_update(bot, Update(**update))
+        if isinstance(result, TelegramMethod):
+            await bot(result)
+        recorder.steps[(scenario, label)].append(time.perf_counter() - began)
+        if args.think:
+            await asyncio.sleep(args.think)
+
+    uploads = Counter()
+
+    async def upload(uid):
+        uploads[uid] += 1
+        await step("upload", "start", message_update(uid, "/start"))
+        await step("upload", "add_track", callback_update(uid, "add_track"))
+        await step("upload", "audio", audio_update(uid, f"load-{uid}-{uploads[uid]}",
+                                                   title=f"Demo {uploads[uid]}", performer=f"user{uid}"))
+        await step("upload", "save_common", callback_update(uid, "save_common"))
+
+    async def browse(uid):
+        artist_id, track_id = rng.choice(pairs)
+        await step("browse", "start", message_update(uid, "/start"))
+        await step("browse", "common_playlist", callback_update(uid, ArtistsPage().pack()))
+        await step("browse", "artist", callback_update(uid, ArtistPage(artist_id=artist_id).pack()))
+        await step("browse", "listen", callback_update(uid, ListenTrack(track_id=track_id).pack()))
+
+    async def search(uid):
+        word = rng.choice(words)
+        await step("search", "search", message_update(uid, f"/search {word}"))
+        await step("search", "inline", inline_query_update(uid, word[:4]))
+
+    journeys = {"upload": (upload, uploaders), "browse": (browse, user_ids), "search": (search, user_ids)}
+    weights = dict(item.split("=") for item in args.mix.split(","))
+    names = [n for n in SCENARIOS if float(weights.get(n, 0)) > 0]
+
+    async def run_journey(scenario):
+        _scenario.set(scenario)
+        fn, population = journeys[scenario]
+        began = time.perf_counter()
+        try:
+            await fn(rng.choice(population))
+        except Exception as e:
+            recorder.errors[scenario] += 1
+            if recorder.errors[scenario] == 1:
+                print(f"{scenario}: {type(e).__name__}: {e}")
+            return
+        recorder.journeys[scenario].append(time.perf_counter() - began)
+
+    print(f"сценарии {args.mix} с частотой {args.rate}/с в течение {args.duration}с, задержка API {args.latency}с")
+    tasks = []
+    started = time.perf_counter()
+    while time.perf_counter() - started < args.duration:
+        scenario = rng.choices(names, [float(weights[n]) for n in names])[0]
+        tasks.append(asyncio.create_task(run_journey(scenario)))
+        # открытая модель нагрузки: новые сценарии приходят по расписанию, не дожидаясь старых
+        await asyncio.sleep(max(0.0, started + len(tasks) / args.rate - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    recorder.report(elapsed)
+
+    for task in background:
+        task.cancel()
+    await dp.storage.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
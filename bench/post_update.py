@@ -0,0 +1,32 @@
+# bench/post_update.py
+"""
+Отправляет записанный Update (JSON) на локально запущенный вебхук.
+
+    BOT_MODE=webhook WEBHOOK_BASE_URL=https://example.com python bot.py
+    python -m bench.post_update bench/updates/start.json --url http://127.0.0.1:8080/webhook
+"""
+import argparse
+import asyncio
+import json
+import os
+import aiohttp
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    args = parser.parse_args()
+
+    async with aiohttp.ClientSession() as session:
+        for path in args.files:
+            with open(path, encoding="utf-8") as f:
+                update = json.load(f)
+            async with session.post(args.url, json=update,
+                                    headers={"X-Telegram-Bot-Api-Secret-Token": args.secret}) as resp:
+                print(path, resp.status, await resp.text())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+# bench/row_models.py
+"""
+Стоимость строк на путях просмотра: прежние запросы (SELECT * и кортежи)
+против проекций с моделями из models.py. Для каждого запроса — время
+выполнения с декодированием и пиковая память (tracemalloc) на результат.
+После анализа аудио у трека есть отпечаток (~2 КБ), который SELECT * тащил
+в каждую карточку трека и в кеш; --fingerprints задаёт долю таких треков.
+
+    python -m bench.row_models --tracks 50000 --fingerprints 1.0
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+
+from bench.seed import seed  # noqa: E402
+from database import Database  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="готовая база; по умолчанию создаётся и наполняется временная")
+    parser.add_argument("--tracks", type=int, default=50_000)
+    parser.add_argument("--fingerprints", type=float, default=1.0, help="доля треков с отпечатком")
+    parser.add_argument("--lookups", type=int, default=5000, help="карточек трека в замере get_track")
+    return parser.parse_args()
+
+
+def add_fingerprints(db, share, rng):
+    ids = [r[0] for r in db.conn.execute("SELECT id FROM tracks WHERE fingerprint IS NULL")]
+    picked = [(rng.randbytes(1920), tid) for tid in ids if rng.random() < share]
+    db.conn.executemany("UPDATE tracks SET fingerprint = ?, analysis_state = 'done' WHERE id = ?", picked)
+    db.conn.commit()
+
+
+def measure(fn):
+    """(секунды, пик памяти в байтах) одного вызова; результат держится до конца замера."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def report(name, old, new):
+    (old_t, old_m), (new_t, new_m) = old, new
+    print(f"{name:28s} {old_t * 1000:9.1f} → {new_t * 1000:7.1f} мс   "
+          f"{old_m / 1e6:8.2f} → {new_m / 1e6:6.2f} МБ")
+
+
+def main():
+    args = parse_args()
+    path = args.db or os.path.join(tempfile.mkdtemp(), "rows.db")
+    if not args.db:
+        seed(path, users=5000, artists=500, tracks=args.tracks)
+    db = Database(path)
+    rng = random.Random(1)
+    add_fingerprints(db, args.fingerprints, rng)
+    conn = db._reader()
+    track_ids = [r[0] for r in conn.execute("SELECT id FROM tracks")]
+    lookups = [rng.choice(track_ids) for _ in range(args.lookups)]
+    artist_id = conn.execute(
+        "SELECT artist_id FROM tracks WHERE is_common = 1 GROUP BY artist_id ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()[0]
+    user_id = conn.execute("SELECT user_id FROM tracks GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+
+    print(f"база {path}: треков {len(track_ids)}, с отпечатком {args.fingerprints:.0%}")
+    print(f"{'':28s} {'SELECT *':>9s}   {'модели':>7s}")
+    # карточки трека — то, что копится в LRU-кеше AsyncDatabase.tracks
+    report(f"get_track ×{len(lookups)}",
+           measure(lambda: [conn.execute("SELECT * FROM tracks WHERE id = ?", (i,)).fetchone() for i in lookups]),
+           measure(lambda: [db.get_track(i) for i in lookups]))
+    report("get_user_tracks",
+           measure(lambda: conn.execute("SELECT * FROM tracks WHERE user_id = ? ORDER BY created_at DESC",
+                                        (user_id,)).fetchall()),
+           measure(lambda: db.get_user_tracks(user_id)))
+    report("get_common_tracks",
+           measure(lambda: conn.execute("SELECT * FROM tracks WHERE is_common = 1 ORDER BY created_at DESC").fetchall()),
+           measure(lambda: db.get_common_tracks()))
+    # тот же каталог потоком: в памяти одна пачка моделей, а не список на все треки
+    report("iter_common_tracks",
+           measure(lambda: sum(1 for _ in conn.execute("SELECT * FROM tracks WHERE is_common = 1 "
+                                                       "ORDER BY created_at DESC, id DESC"))),
+           measure(lambda: sum(1 for _ in db.iter_common_tracks())))
+    report("get_artist_common_tracks",
+           measure(lambda: conn.execute("SELECT * FROM tracks WHERE artist_id = ? AND is_common = 1 "
+                                        "ORDER BY created_at DESC", (artist_id,)).fetchall()),
+           measure(lambda: db.get_artist_common_tracks(artist_id)))
+    report("page_artist_tracks ×1000",
+           measure(lambda: [conn.execute("SELECT * FROM tracks WHERE artist_id = ? AND is_common = 1 "
+                                         "ORDER BY created_at DESC, id DESC LIMIT 11", (artist_id,)).fetchall()
+                            for _ in range(1000)]),
+           measure(lambda: [db.page_artist_tracks(artist_id) for _ in range(1000)]))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench/seed.py
+"""
+Наполняет базу синтетическими данными для нагрузочных тестов.
+Telegram id пользователей — SEED_USER_BASE + n, у артистов и треков
+правдоподобные имена, треки уже «заархивированы» (storage_state='stored').
+
+    python -m bench.seed /tmp/load.db --users 50000 --artists 5000 --tracks 200000
+"""
+import argparse
+import random
+import time
+from database import Database
+from migrations import search_key
+
+SEED_USER_BASE = 10_000_000
+_SYLLABLES = ["ra", "mo", "ki", "lu", "ne", "sa", "to", "vi", "da", "go", "re", "mi", "zu", "fa", "no", "la"]
+_EPOCH = 1_600_000_000
+
+
+def _word(rng):
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def _ts(seconds):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(_EPOCH + seconds))
+
+
+def seed(path, users=50_000, artists=5_000, tracks=200_000, common_share=0.8, seed=1):
+    """Создаёт (или дополняет пустую) базу по пути path. Возвращает число пользователей, артистов и треков."""
+    rng = random.Random(seed)
+    db = Database(path)
+    conn = db.conn
+    if conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]:
+        counts = tuple(conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("users", "artists", "tracks"))
+        db.close()
+        return counts
+
+    conn.executemany("INSERT INTO users (telegram_id, name) VALUES (?, ?)",
+                     ((SEED_USER_BASE + n, f"{_word(rng)} {_word(rng)}") for n in range(users)))
+    # карточки у первых пользователей, у некоторых по несколько
+    artist_rows = [(SEED_USER_BASE + rng.randrange(max(1, users // 4)), f"{_word(rng)} {_word(rng)}")
+                   for _ in range(artists)]
+    conn.executemany("INSERT INTO artists (user_id, name, name_key) VALUES (?, ?, ?)",
+                     ((user_id, name, search_key(name)) for user_id, name in artist_rows))
+    artist_ids = [r[0] for r in conn.execute("SELECT id FROM artists ORDER BY id")]
+    names = {r[0]: (r[1], r[2]) for r in conn.execute("SELECT id, user_id, name FROM artists")}
+
+    def track_rows():
+        for n in range(tracks):
+            title = " ".join(_word(rng) for _ in range(rng.randint(1, 3)))
+            if rng.random() < common_share:
+                aid = rng.choice(artist_ids)
+                owner, performer = names[aid]
+                common = 1
+            else:
+                owner, aid, performer, common = SEED_USER_BASE + rng.randrange(users), None, _word(rng), 0
+            yield (owner, aid, title, performer, f"seed-{n}", n + 1, common, _ts(n * 60), "stored",
+                   search_key(title), search_key(performer))
+
+    conn.executemany("""
+        INSERT INTO tracks (user_id, artist_id, title, performer, file_id, storage_message_id, is_common,
+                            created_at, storage_state, title_key, performer_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, track_rows())
+    conn.commit()
+    conn.execute("ANALYZE")
+    db.close()
+    return users, artists, tracks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--artists", type=int, default=5_000)
+    parser.add_argument("--tracks", type=int, default=200_000)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    counts = seed(args.path, args.users, args.artists, args.tracks)
+    print(f"users={counts[0]} artists={counts[1]} tracks={counts[2]} за {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
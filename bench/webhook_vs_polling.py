@@ -0,0 +1,96 @@
+# bench/webhook_vs_polling.py
+"""
+Сравнение сквозной задержки polling и webhook на подменённом Bot API.
+Задержка — от появления апдейта до ответа пользователю (исходящий вызов API
+или ответ на вебхук с методом внутри).
+
+    python -m bench.webhook_vs_polling --updates 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("BOT_TOKEN", "42:BENCH")
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("WEBHOOK_SECRET", "bench-secret")
+
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+from aiogram import Bot  # noqa: E402
+import bot as bot_module  # noqa: E402
+from bench.fake_telegram import FakeTelegramSession, callback_update  # noqa: E402
+from config import WEBHOOK_PATH, WEBHOOK_SECRET  # noqa: E402
+from utils.callbacks import ArtistsPage  # noqa: E402
+
+SCENARIO = ArtistsPage().pack()
+
+
+def summary(name, samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name:8s} n={len(samples)} p50={statistics.median(samples) * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+
+
+async def bench_polling(dp, n, latency):
+    pushed, samples = {}, []
+    done = asyncio.Event()
+
+    def on_call(name, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id in pushed:
+            samples.append(time.perf_counter() - pushed.pop(chat_id))
+            if len(samples) == n:
+                done.set()
+
+    session = FakeTelegramSession(latency=latency, on_call=on_call)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    for uid in range(1, n + 1):
+        pushed[uid] = time.perf_counter()
+        # Telegram отдаёт апдейт в ответ на висящий getUpdates — это ещё один сетевой переход
+        await asyncio.sleep(latency / 2)
+        session.push_update(callback_update(uid, SCENARIO))
+        await asyncio.sleep(0.005)
+    await asyncio.wait_for(done.wait(), 30)
+    await dp.stop_polling()
+    await polling
+    return samples
+
+
+async def bench_webhook(dp, n, latency):
+    session = FakeTelegramSession(latency=latency)
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=session)
+    client = TestClient(TestServer(bot_module.build_webhook_app(dp, bot)))
+    await client.start_server()
+    samples = []
+    try:
+        for uid in range(1, n + 1):
+            started = time.perf_counter()
+            # доставка апдейта от Telegram и ответ обратно — по половине RTT
+            await asyncio.sleep(latency / 2)
+            resp = await client.post(WEBHOOK_PATH, json=callback_update(uid, SCENARIO),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET})
+            await resp.read()
+            await asyncio.sleep(latency / 2)
+            samples.append(time.perf_counter() - started)
+    finally:
+        await client.close()
+    return samples
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="RTT до Bot API, секунд")
+    args = parser.parse_args()
+
+    # роутеры — синглтоны модулей, поэтому диспетчер один на оба режима
+    dp = bot_module.build_dispatcher()
+    summary("polling", await bench_polling(dp, args.updates, args.latency))
+    summary("webhook", await bench_webhook(dp, args.updates, args.latency))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,44 +1,161 @@
 ﻿import asyncio
+import functools
 import logging
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN, BOT_VERSION
-from handlers import start, upload, playlists, artist, metadata
-from utils.notify import broadcast
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (BOT_TOKEN, BOT_VERSION, BOT_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+                    WEBAPP_HOST, WEBAPP_PORT, METRICS_HOST, METRICS_PORT, BOT_WORKERS)
+from handlers import start, upload, playlists, artist, metadata, search, admin
+from utils.callbacks import callbacks
+from utils.delivery import ReachabilityMiddleware
+from utils.scheduler import scheduler, PollingBackpressure
+from utils.campaigns import campaigns
+from utils.outbox import outbox
+from utils.analysis import analyzer
+from utils.storage_queue import archiver
+from utils.fsm_storage import SQLiteStorage
+from utils.instrumentation import instrument_dispatcher, instrument_bot, register_runtime_gauges
+from utils.metrics import start_metrics_server
 from db_instance import db
+import cluster
 
 logging.basicConfig(level=logging.INFO)
 
 
-async def main():
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
+def build_dispatcher():
+    storage = SQLiteStorage()
     dp = Dispatcher(storage=storage)
+    # планировщик — до FSM-middleware: состояние пользователя читается, когда подошла его очередь
+    dp.update.outer_middleware.unregister(dp.fsm)
+    dp.update.outer_middleware(scheduler)
+    dp.update.outer_middleware(dp.fsm)
+    dp.update.outer_middleware(ReachabilityMiddleware())
 
     dp.include_router(start.router)
     dp.include_router(upload.router)
     dp.include_router(playlists.router)
     dp.include_router(artist.router)
     dp.include_router(metadata.router)
+    dp.include_router(search.router)
+    dp.include_router(admin.router)
+    # все callback_query — через таблицу префиксов (utils/callbacks.py)
+    dp.include_router(callbacks.router)
+    instrument_dispatcher(dp)
+    return dp
+
+
+def build_webhook_app(dp, bot):
+    """
+    aiohttp-приложение с обработчиком вебхука.
+    Апдейт обрабатывается прямо в запросе: если хендлер вернул метод API
+    (например, edit_text без await), он уходит в ответе на вебхук без отдельного запроса.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET,
+        handle_in_background=False,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
 
-    # 🚀 Проверяем, отправлялось ли уведомление об обновлении
-    if not db.has_version_been_sent(BOT_VERSION):
-        users = db.get_all_users()
-        if users:
-            message = (
-                f"🔔 *GarageLib обновлён до {BOT_VERSION}!*\n\n"
-                "🆕 Новые возможности:\n"
-                "• Исправлены уведомления и рассылки\n"
-                "• Повышена стабильность\n\n"
-            )
-            failed = await broadcast(bot, users, message, parse_mode="Markdown", delay=0.05)
-            print(f"✅ Уведомление об обновлении {BOT_VERSION} разослано ({len(users) - len(failed)}/{len(users)} успешно).")
-
-        db.mark_version_as_sent(BOT_VERSION)
-
-    print("🚀 Бот запущен...")
+async def run_polling(dp, bot):
+    # если раньше работали через вебхук, Telegram не отдаст getUpdates, пока он установлен
+    await bot.delete_webhook(drop_pending_updates=False)
+    bot.session.middleware(PollingBackpressure(scheduler))
     await dp.start_polling(bot)
 
 
+async def run_webhook(dp, bot):
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_BASE_URL")
+    app = build_webhook_app(dp, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+    await site.start()
+    await bot.set_webhook(
+        url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_cluster(dp, bot):
+    """Принимающий процесс: апдейты уходят BOT_WORKERS процессам-обработчикам (см. cluster.py)."""
+    allowed_updates = dp.resolve_used_update_types()
+    if BOT_MODE == "webhook":
+        receive = functools.partial(cluster.webhook_into, bot=bot, allowed_updates=allowed_updates)
+    else:
+        await bot.delete_webhook(drop_pending_updates=False)
+        receive = functools.partial(cluster.poll_into, bot=bot, allowed_updates=allowed_updates)
+    try:
+        await cluster.run_front(cluster.Front(BOT_WORKERS), receive)
+    finally:
+        await bot.session.close()
+
+
+def start_background(bot, primary=True):
+    """
+    Фоновые задачи: рассылка уведомлений из outbox и кампаний, архивация треков в канал-хранилище,
+    анализ загруженного аудио. Из нескольких процессов обход БД, outbox и кампании работают
+    только в основном (primary), очереди архивации и анализа своих загрузок — в каждом.
+    """
+    tasks = [asyncio.create_task(archiver.run(bot, sweep=primary)),
+             asyncio.create_task(analyzer.run(bot, sweep=primary))]
+    if primary:
+        tasks.append(asyncio.create_task(outbox.run(bot)))
+        tasks.append(asyncio.create_task(campaigns.run(bot)))
+    return tasks
+
+
+async def main():
+    bot = Bot(token=BOT_TOKEN)
+    instrument_bot(bot)
+    dp = build_dispatcher()
+
+    # 🚀 Объявление о новой версии — кампания: создаётся один раз на версию и рассылается
+    # в фоне параллельно с работой бота, после рестарта продолжается с того же места
+    await db.create_campaign(
+        f"version:{BOT_VERSION}",
+        f"🔔 *GarageLib обновлён до {BOT_VERSION}!*\n\n"
+        "🆕 Новые возможности:\n"
+        "• Исправлены уведомления и рассылки\n"
+        "• Повышена стабильность\n\n",
+        parse_mode="Markdown",
+    )
+
+    if BOT_WORKERS > 1:
+        print(f"🚀 Бот запущен ({BOT_MODE}, обработчиков: {BOT_WORKERS})...")
+        await run_cluster(dp, bot)
+        return
+
+    metrics_runner = None
+    if METRICS_PORT:
+        register_runtime_gauges(dp.storage)
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+    background = start_background(bot)
+
+    print(f"🚀 Бот запущен ({BOT_MODE})...")
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await run_polling(dp, bot)
+    finally:
+        for task in background:
+            task.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
 if __name__ == "__main__":
     asyncio.run(main())
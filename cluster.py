@@ -0,0 +1,223 @@
+# cluster.py
+"""
+Режим нескольких процессов (BOT_WORKERS > 1).
+Принимающий процесс (Front) получает апдейты через polling или вебхук и
+раздаёт их процессам-обработчикам по from_user.id: все апдейты одного
+пользователя попадают в один процесс и обрабатываются в нём строго по
+очереди (utils/scheduler.py), поэтому FSM-сценарии загрузки и правки метаданных не ломаются.
+Обработчики — обычный Dispatcher со всеми роутерами над общей SQLite (WAL).
+Фоновые задачи (outbox, кампании, обход архивации) работают в обработчике 0.
+
+Апдейты передаются по локальному TCP строками JSON.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import secrets
+from aiohttp import web
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import TelegramMethod
+from config import (BOT_TOKEN, CACHE_SYNC_INTERVAL, METRICS_HOST, METRICS_PORT, WEBHOOK_BASE_URL, WEBHOOK_PATH,
+                    WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT)
+from db_instance import db
+
+logger = logging.getLogger(__name__)
+
+STREAM_LIMIT = 16 * 1024 * 1024  # максимальный размер одного апдейта в байтах
+
+
+def partition_key(update):
+    """Id пользователя, от которого пришёл апдейт (или чата; 0 — если нет ни того, ни другого)."""
+    for name, event in update.items():
+        if name == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+# --- процесс-обработчик ---
+async def _handle(dp, bot, update):
+    try:
+        result = await dp.feed_raw_update(bot, update)
+        # как при polling: метод, возвращённый хендлером, выполняется отдельным запросом
+        if isinstance(result, TelegramMethod):
+            await dp.silent_call_request(bot, result)
+    except Exception:
+        logger.exception("Ошибка обработки апдейта %s", update.get("update_id"))
+
+
+async def run_worker(bot, index, port):
+    """Принимает апдейты от Front по TCP и обрабатывает их, пока Front не закроет соединение."""
+    from bot import build_dispatcher, start_background
+    from utils.instrumentation import instrument_bot, register_runtime_gauges
+    from utils.metrics import start_metrics_server
+    from utils.scheduler import scheduler
+
+    instrument_bot(bot)
+    dp = build_dispatcher()
+    metrics_runner = None
+    if METRICS_PORT:
+        register_runtime_gauges(dp.storage)
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + index)
+    tasks = start_background(bot, primary=index == 0)
+    tasks.append(asyncio.create_task(db.watch_catalog(CACHE_SYNC_INTERVAL)))
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=STREAM_LIMIT)
+    writer.write(json.dumps({"worker": index}).encode() + b"\n")
+    await writer.drain()
+    handling = set()
+    try:
+        while True:
+            # планировщик полон — не читаем сокет: Front упрётся в drain() и перестанет принимать апдейты
+            await scheduler.wait_room()
+            line = await reader.readline()
+            if not line:
+                break
+            task = asyncio.create_task(_handle(dp, bot, json.loads(line)))
+            handling.add(task)
+            task.add_done_callback(handling.discard)
+            # апдейт занимает место в планировщике до следующего чтения
+            await asyncio.sleep(0)
+        if handling:
+            await asyncio.wait(handling)
+    finally:
+        writer.close()
+        for task in tasks:
+            task.cancel()
+        await dp.storage.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+        db.close()
+
+
+def worker_main(index, port):
+    logging.basicConfig(level=logging.INFO, format=f"[worker {index}] %(levelname)s:%(name)s:%(message)s",
+                        force=True)
+    asyncio.run(run_worker(Bot(token=BOT_TOKEN), index, port))
+
+
+# --- принимающий процесс ---
+class Front:
+    """
+    Запускает count процессов-обработчиков (target(index, port)) и раздаёт им апдейты.
+    dispatch() ждёт, пока апдейт уйдёт в сокет: медленный обработчик тормозит приём.
+    """
+
+    def __init__(self, count, target=worker_main):
+        self.count = count
+        self.target = target
+        self._writers = [None] * count
+        self._connected = asyncio.Event()
+        self._processes = []
+        self._server = None
+
+    async def _accept(self, reader, writer):
+        hello = json.loads(await reader.readline())
+        self._writers[hello["worker"]] = writer
+        if all(self._writers):
+            self._connected.set()
+
+    async def start(self, timeout=60):
+        self._server = await asyncio.start_server(self._accept, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        # spawn: обработчики не наследуют event loop, соединения с БД и потоки этого процесса
+        ctx = multiprocessing.get_context("spawn")
+        for index in range(self.count):
+            process = ctx.Process(target=self.target, args=(index, port), name=f"bot-worker-{index}")
+            process.start()
+            self._processes.append(process)
+        await asyncio.wait_for(self._connected.wait(), timeout)
+        logger.info("Запущено обработчиков: %s", self.count)
+
+    def alive(self):
+        return all(p.is_alive() for p in self._processes)
+
+    async def dispatch(self, update):
+        writer = self._writers[partition_key(update) % self.count]
+        writer.write(json.dumps(update, ensure_ascii=False).encode() + b"\n")
+        await writer.drain()
+
+    async def stop(self):
+        """Закрывает соединения; обработчики доделывают принятые апдейты и завершаются."""
+        for writer in self._writers:
+            if writer is not None:
+                writer.close()
+        if self._server is not None:
+            self._server.close()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, p.join) for p in self._processes))
+
+
+async def _watch(front):
+    # упавший обработчик — остановка всего бота: его пользователи иначе остались бы без ответа
+    while front.alive():
+        await asyncio.sleep(1)
+    raise RuntimeError("Процесс-обработчик завершился")
+
+
+async def poll_into(front, bot, allowed_updates):
+    """Long polling: апдейты передаются обработчикам, а не обрабатываются здесь."""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=allowed_updates)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            continue
+        except TelegramNetworkError:
+            logger.warning("Сетевая ошибка getUpdates, повтор через 5 с")
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            await front.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+
+async def webhook_into(front, bot, allowed_updates):
+    """
+    Вебхук: апдейт передаётся обработчику, Telegram сразу получает пустой ответ.
+    Ответить методом в теле ответа, как в однопроцессном режиме, здесь нельзя — ответ готовит другой процесс.
+    """
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для BOT_MODE=webhook нужен WEBHOOK_BASE_URL")
+
+    async def receive(request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if WEBHOOK_SECRET and not secrets.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=401)
+        await front.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, receive)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT).start()
+    await bot.set_webhook(url=WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                          allowed_updates=allowed_updates)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_front(front, receive):
+    """Запускает обработчики и receive(front) (polling или вебхук), пока не упадёт один из них."""
+    await front.start()
+    tasks = [asyncio.create_task(receive(front)), asyncio.create_task(_watch(front))]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await front.stop()
@@ -1,5 +1,6 @@
 # config.py
 import os
+import shutil
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,3 +8,94 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 STORAGE_CHAT_ID = int(os.getenv("STORAGE_CHAT_ID")) if os.getenv("STORAGE_CHAT_ID") else None
 BOT_VERSION = os.getenv("BOT_VERSION", "v1.1")
+DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
+
+# глобальный лимит рассылок, сообщений в секунду (Telegram допускает ~30)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "30"))
+
+# кеш сущностей БД: максимум записей на таблицу и время жизни, секунд
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "2048"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+
+# SQLite: synchronous для WAL (NORMAL — без fsync на каждый коммит, FULL — с ним)
+# и групповой коммит: записи, пришедшие в пределах окна (секунд), фиксируются вместе;
+# DB_GROUP_COMMIT_WINDOW=0 — каждая запись коммитится сама
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_GROUP_COMMIT_WINDOW = float(os.getenv("DB_GROUP_COMMIT_WINDOW", "0"))
+DB_GROUP_COMMIT_MAX = int(os.getenv("DB_GROUP_COMMIT_MAX", "256"))
+
+# фоновые рассылки-кампании (объявления о версиях): сообщений в секунду —
+# меньше BROADCAST_RATE, чтобы оставить лимит Telegram на ответы и уведомления
+CAMPAIGN_RATE = float(os.getenv("CAMPAIGN_RATE", "10"))
+
+# telegram_id администраторов через запятую (команда /campaigns)
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x}
+
+# FSM: через сколько секунд без изменений брошенная сессия удаляется,
+# сколько сессий держать в памяти и как часто сбрасывать изменения в БД
+FSM_TTL = float(os.getenv("FSM_TTL", str(24 * 3600)))
+FSM_HOT_SIZE = int(os.getenv("FSM_HOT_SIZE", "10000"))
+FSM_FLUSH_INTERVAL = float(os.getenv("FSM_FLUSH_INTERVAL", "1.0"))
+
+# BOT_WORKERS > 1 — принимающий процесс раздаёт апдейты N процессам-обработчикам по from_user.id;
+# кеши каталога и доставки в обработчиках сверяются с БД раз в CACHE_SYNC_INTERVAL секунд
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+CACHE_SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "1.0"))
+
+# режим получения апдейтов: polling или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")  # например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+
+# планировщик апдейтов: одновременно обрабатывается не больше SCHEDULER_CONCURRENCY апдейтов,
+# апдейты одного пользователя — строго по очереди; нажатий кнопок в его очереди не больше SCHEDULER_USER_QUEUE;
+# когда ждут обработки SCHEDULER_MAX_PENDING апдейтов, новые нажатия отбрасываются, а приём апдейтов притормаживается
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", "32"))
+SCHEDULER_USER_QUEUE = int(os.getenv("SCHEDULER_USER_QUEUE", "20"))
+SCHEDULER_MAX_PENDING = int(os.getenv("SCHEDULER_MAX_PENDING", "1000"))
+
+# архивация треков в канал-хранилище: размер очереди, параллельность, число попыток
+STORAGE_QUEUE_SIZE = int(os.getenv("STORAGE_QUEUE_SIZE", "500"))
+STORAGE_WORKERS = int(os.getenv("STORAGE_WORKERS", "3"))
+STORAGE_MAX_ATTEMPTS = int(os.getenv("STORAGE_MAX_ATTEMPTS", "5"))
+
+# анализ загруженного аудио в пуле процессов: размер очереди, число процессов
+# (0 — анализ выключен), максимальный размер файла (Bot API отдаёт файлы до 20 МБ)
+# и число попыток скачать файл при сетевых ошибках;
+# громкость считается при наличии ffmpeg, акустический отпечаток — при наличии fpcalc (Chromaprint)
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "200"))
+ANALYSIS_PROCESSES = int(os.getenv("ANALYSIS_PROCESSES", "2"))
+ANALYSIS_MAX_BYTES = int(os.getenv("ANALYSIS_MAX_BYTES", str(20 * 1024 * 1024)))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "5"))
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+FPCALC_PATH = os.getenv("FPCALC_PATH") or shutil.which("fpcalc")
+# почти-дубликат: доля совпадающих бит отпечатков не ниже порога (у разных записей ~0.5)
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.85"))
+
+# альбом (media group) собирается, пока между его сообщениями меньше ALBUM_WINDOW секунд
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "1.0"))
+
+# уведомления о новых треках: digest — копить DIGEST_WINDOW секунд (или до DIGEST_MAX_ITEMS
+# событий) и присылать одной сводкой, instant — сразу по событию
+NOTIFY_MODE = os.getenv("NOTIFY_MODE", "digest")
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "300"))
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "10"))
+
+# получают ли новые пользователи уведомления обо всех новых треках или только о подписках
+# (по умолчанию — только о подписках); пользователи, зарегистрированные до появления
+# подписок, получают все новинки, пока сами не выключат их в «Подписках»
+FOLLOW_ALL_DEFAULT = os.getenv("FOLLOW_ALL_DEFAULT", "0") == "1"
+
+# после стольких постоянных ошибок доставки подряд пользователь исключается из рассылок
+# (заблокировавшие бота исключаются сразу); любое его сообщение боту возвращает рассылки
+DELIVERY_MAX_FAILURES = int(os.getenv("DELIVERY_MAX_FAILURES", "5"))
+
+# локальный эндпоинт /metrics в формате Prometheus; METRICS_PORT=0 — выключен
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+# сколько секунд Telegram может кешировать ответ на инлайн-поиск
+SEARCH_CACHE_TIME = int(os.getenv("SEARCH_CACHE_TIME", "60"))
@@ -1,187 +1,1012 @@
 ﻿# database.py
+import contextlib
+import functools
+import json
+import re
 import sqlite3
+import threading
+from itertools import starmap
+
+from migrations import migrate, search_key
+from models import columns, User, Artist, TrackListItem, TrackPlayback, Track
+
+
+# нечёткий поиск: сколько последних совпадений по триграммам ранжировать в FTS, сколько лучших
+# из них оценивать в Python и насколько слово должно быть похоже
+FUZZY_SCAN = 1000
+FUZZY_CANDIDATES = 50
+FUZZY_MIN_SIMILARITY = 0.5
+# верхняя граница диапазона для поиска по префиксу: больше любого символа Unicode
+PREFIX_END = "\U0010ffff"
+
+# колонки tracks с результатом анализа аудио и соответствующие ключи словаря из utils/audio.py
+ANALYSIS_FIELDS = (("audio_format", "format"), ("duration", "duration"), ("bitrate", "bitrate"),
+                   ("sample_rate", "sample_rate"), ("channels", "channels"), ("loudness", "loudness"),
+                   ("tag_title", "title"), ("tag_artist", "artist"), ("tag_album", "album"),
+                   ("fingerprint", "fingerprint"))
+
+# строки декодируются в модели пачками: сырые кортежи всего результата не держатся в памяти разом
+FETCH_SIZE = 256
+
+
+def _iter(cur, model, size=FETCH_SIZE):
+    """Модели по мере чтения: в памяти только текущая пачка строк, а не весь результат."""
+    while chunk := cur.fetchmany(size):
+        yield from starmap(model, chunk)
+
+
+def _fetch(cur, model, size=FETCH_SIZE):
+    return list(_iter(cur, model, size))
+
+
+def _fetch_one(cur, model):
+    row = cur.fetchone()
+    return model(*row) if row else None
+
+
+def _trigrams(word):
+    # с отступами по краям, как в pg_trgm: совпадение начала и конца слова весит больше
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(words, text):
+    """
+    Средняя по словам запроса лучшая похожесть (коэффициент Дайса по триграммам) на слово из text.
+    words — триграммы слов запроса (_trigrams), посчитанные один раз на запрос.
+    """
+    targets = [_trigrams(w) for w in re.findall(r"\w+", text.lower())]
+    if not targets:
+        return 0.0
+    total = 0.0
+    for grams in words:
+        total += max(2 * len(grams & t) / (len(grams) + len(t)) for t in targets)
+    return total / len(words)
+
+
+def reads(method):
+    """Помечает метод как читающий: AsyncDatabase выполнит его в пуле читателей."""
+    method.db_kind = "read"
+    return method
+
+
+def writes(method):
+    """
+    Помечает метод как пишущий: AsyncDatabase выполнит его в потоке писателя.
+    Если метод упал вне transaction(), всё, что он успел записать, откатывается —
+    иначе недописанные строки зафиксировал бы следующий пишущий вызов.
+    """
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        except BaseException:
+            self._rollback()
+            raise
+
+    call.db_kind = "write"
+    return call
+
 
 class Database:
-    def __init__(self, path="database.db"):
-        self.conn = sqlite3.connect(path, check_same_thread=False)
-        self.cur = self.conn.cursor()
-        self._create_tables()
-        self._ensure_columns()
-
-    def _create_tables(self):
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                telegram_id INTEGER UNIQUE,
-                name TEXT
-            )
-        ''')
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS artists (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                name TEXT
-            )
-        ''')
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS tracks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                artist_id INTEGER,
-                title TEXT,
-                performer TEXT,
-                file_id TEXT,
-                storage_message_id INTEGER,
-                is_common INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS bot_meta (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            )
-        ''')
+    """
+    Синхронный слой доступа к SQLite.
+    Пишущие методы работают через единственное соединение писателя (self.conn),
+    читающие — через отдельное соединение текущего потока (WAL позволяет
+    читать параллельно с записью). Каждый вызов получает собственный курсор.
 
-        self.cur.execute('''
-            CREATE TABLE IF NOT EXISTS sent_updates (
-                version TEXT PRIMARY KEY
-            )
-        ''')
+    Пишущий метод сам фиксирует свои изменения, если не вызван внутри
+    transaction() — тогда всё фиксируется одним COMMIT в конце блока.
+    synchronous=NORMAL в режиме WAL не делает fsync на каждый коммит (только на
+    checkpoint): при сбое питания теряются последние транзакции, но база цела.
+    """
+
+    def __init__(self, path="database.db", synchronous="NORMAL"):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+        self._reader_conns = []
+        self._depth = 0
+        self.conn = self._connect()
+        self.schema_version = migrate(self.conn)
+
+    def _connect(self, readonly=False):
+        # писатель начинает неявные транзакции с BEGIN IMMEDIATE: если в ту же базу пишут
+        # другие процессы, он дождётся блокировки (busy_timeout), а не получит SQLITE_BUSY посреди транзакции
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               isolation_level=None if readonly else "IMMEDIATE")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA busy_timeout=5000")
+        if readonly:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
 
-        self.conn.commit()
+    # транзакции
+    def _commit(self):
+        if not self._depth:
+            self.conn.commit()
+
+    def _rollback(self):
+        # внутри transaction() откатывает весь блок — исключение дойдёт до него
+        if not self._depth:
+            self.conn.rollback()
+
+    def begin(self):
+        if not self._depth:
+            # IMMEDIATE сразу берёт блокировку записи, а не на первом INSERT
+            self.conn.execute("BEGIN IMMEDIATE")
+        self._depth += 1
 
+    def end(self, commit=True):
+        """Закрывает begin(); изменения фиксируются или откатываются на самом внешнем уровне."""
+        self._depth -= 1
+        if not self._depth:
+            if commit:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
 
-    def _ensure_columns(self):
+    @contextlib.contextmanager
+    def transaction(self):
+        """Единица работы: пишущие методы внутри блока фиксируются вместе или не фиксируются вовсе."""
+        self.begin()
         try:
-            self.cur.execute("PRAGMA table_info(tracks)")
-            cols = [r[1] for r in self.cur.fetchall()]
-            if "artist_id" not in cols:
-                try:
-                    self.cur.execute("ALTER TABLE tracks ADD COLUMN artist_id INTEGER")
-                except Exception:
-                    pass
-            if "storage_message_id" not in cols:
+            yield self
+        except BaseException:
+            self.end(commit=False)
+            raise
+        self.end()
+
+    @contextlib.contextmanager
+    def _unit(self):
+        """
+        Неделимая группа записей внутри пишущего метода (строка и её событие в outbox).
+        Вне transaction() — своя транзакция; внутри чужого блока или группового
+        коммита — SAVEPOINT: при ошибке откатывается только эта группа, даже если
+        вызывающий код перехватит исключение и продолжит блок.
+        """
+        if not self._depth:
+            with self.transaction():
+                yield
+            return
+        self.conn.execute("SAVEPOINT unit")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK TO unit")
+            self.conn.execute("RELEASE unit")
+            raise
+        self.conn.execute("RELEASE unit")
+
+    def run_group(self, calls):
+        """
+        Групповой коммит: выполняет пишущие вызовы [(метод, args, kwargs)] одной транзакцией.
+        Каждый вызов — в своём SAVEPOINT, так что ошибка одного откатывает только его.
+        Возвращает [(успех, результат или исключение)] в том же порядке.
+        """
+        results = []
+        with self.transaction():
+            for method, args, kwargs in calls:
+                self.conn.execute("SAVEPOINT call")
                 try:
-                    self.cur.execute("ALTER TABLE tracks ADD COLUMN storage_message_id INTEGER")
-                except Exception:
-                    pass
-            self.conn.commit()
-        except Exception:
-            pass
+                    results.append((True, method(*args, **kwargs)))
+                except Exception as e:
+                    self.conn.execute("ROLLBACK TO call")
+                    results.append((False, e))
+                self.conn.execute("RELEASE call")
+        return results
+
+    def _reader(self):
+        """Соединение для чтения, привязанное к текущему потоку."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect(readonly=True)
+            self._reader_conns.append(conn)
+        return conn
+
+    def _keyset_page(self, sql, params, keys, cursor, backward, limit, descending, model):
+        """
+        Keyset-пагинация: строки строго после (или до, если backward) cursor
+        в порядке keys. Возвращает до limit + 1 моделей в порядке показа —
+        лишняя строка говорит о том, что в этом направлении есть ещё страница.
+        """
+        ascending = descending == backward
+        params = list(params)
+        if cursor is not None:
+            op = ">" if ascending else "<"
+            sql += f" AND ({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})"
+            params.extend(cursor)
+        order = "ASC" if ascending else "DESC"
+        sql += " ORDER BY " + ", ".join(f"{k} {order}" for k in keys) + " LIMIT ?"
+        params.append(limit + 1)
+        rows = _fetch(self._reader().execute(sql, params), model)
+        if backward:
+            rows.reverse()
+        return rows
+
+    def close(self):
+        for conn in self._reader_conns:
+            conn.close()
+        self.conn.close()
 
     # users
-    def add_user(self, telegram_id, name):
-        self.cur.execute("INSERT OR IGNORE INTO users (telegram_id, name) VALUES (?, ?)", (telegram_id, name))
-        self.conn.commit()
+    @writes
+    def add_user(self, telegram_id, name, follow_all=False):
+        self.conn.execute("INSERT OR IGNORE INTO users (telegram_id, name, follow_all) VALUES (?, ?, ?)",
+                          (telegram_id, name, int(follow_all)))
+        self._commit()
 
+    @reads
     def get_user(self, telegram_id):
-        self.cur.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
-        return self.cur.fetchone()
-
-    def get_all_users(self):
-        self.cur.execute("SELECT telegram_id FROM users")
-        rows = [row[0] for row in self.cur.fetchall()]
-        # приводим к int и фильтруем None
-        clean = []
-        for r in rows:
-            try:
-                clean.append(int(r))
-            except Exception:
-                continue
-        return clean
+        cur = self._reader().execute(f"SELECT {columns(User)} FROM users WHERE telegram_id = ?", (telegram_id,))
+        return _fetch_one(cur, User)
+
+    @reads
+    def get_deliverable_after(self, cursor, limit=500, upper_bound=None):
+        """
+        Следующая пачка telegram_id после cursor (и не больше upper_bound, если задан),
+        которым можно доставлять сообщения (по возрастанию).
+        """
+        cur = self._reader().execute(
+            "SELECT telegram_id FROM users WHERE delivery_state = 'active' AND telegram_id > ? "
+            "AND (? IS NULL OR telegram_id <= ?) ORDER BY telegram_id LIMIT ?",
+            (cursor, upper_bound, upper_bound, limit)
+        )
+        return [r[0] for r in cur]
+
+    @reads
+    def get_delivery_state(self, telegram_id):
+        row = self._reader().execute(
+            "SELECT delivery_state, failure_count FROM users WHERE telegram_id = ?", (telegram_id,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    @writes
+    def record_delivery(self, sent, blocked, failed, max_failures):
+        """
+        Итоги рассылки одной транзакцией.
+        sent — доставлено (счётчик ошибок обнуляется), blocked — [(id, ошибка)] заблокировавших бота,
+        failed — [(id, ошибка)] постоянных ошибок: после max_failures подряд пользователь unreachable.
+        """
+        self.conn.executemany(
+            "UPDATE users SET delivery_state = 'active', failure_count = 0 "
+            "WHERE telegram_id = ? AND (failure_count > 0 OR delivery_state != 'active')",
+            [(uid,) for uid in sent]
+        )
+        self.conn.executemany("""
+            UPDATE users SET delivery_state = 'blocked', failure_count = failure_count + 1,
+                             last_failure_at = CURRENT_TIMESTAMP, last_failure_error = ?
+            WHERE telegram_id = ?
+        """, [(error, uid) for uid, error in blocked])
+        self.conn.executemany("""
+            UPDATE users SET failure_count = failure_count + 1,
+                             delivery_state = CASE WHEN failure_count + 1 >= ? AND delivery_state = 'active'
+                                                   THEN 'unreachable' ELSE delivery_state END,
+                             last_failure_at = CURRENT_TIMESTAMP, last_failure_error = ?
+            WHERE telegram_id = ?
+        """, [(max_failures, error, uid) for uid, error in failed])
+        self._commit()
+
+    @writes
+    def set_delivery_blocked(self, telegram_id, blocked):
+        """Пользователь сам заблокировал (blocked=True) или разблокировал бота."""
+        if blocked:
+            self.conn.execute(
+                "UPDATE users SET delivery_state = 'blocked', last_failure_at = CURRENT_TIMESTAMP "
+                "WHERE telegram_id = ?", (telegram_id,)
+            )
+        else:
+            self.conn.execute(
+                "UPDATE users SET delivery_state = 'active', failure_count = 0 WHERE telegram_id = ?",
+                (telegram_id,)
+            )
+        self._commit()
 
 
     # artists
+    @writes
     def add_artist(self, user_id, name):
-        self.cur.execute("INSERT INTO artists (user_id, name) VALUES (?, ?)", (user_id, name))
-        self.conn.commit()
-        return self.cur.lastrowid
+        cur = self.conn.execute("INSERT INTO artists (user_id, name, name_key) VALUES (?, ?, ?)",
+                                (user_id, name, search_key(name)))
+        self._commit()
+        return cur.lastrowid
 
+    @reads
     def get_all_artists(self):
-        self.cur.execute("SELECT id, user_id, name FROM artists ORDER BY name ASC")
-        return self.cur.fetchall()
+        cur = self._reader().execute(f"SELECT {columns(Artist)} FROM artists ORDER BY name ASC")
+        return _fetch(cur, Artist)
 
+    @reads
     def get_artist(self, artist_id):
-        self.cur.execute("SELECT id, user_id, name FROM artists WHERE id = ?", (artist_id,))
-        return self.cur.fetchone()
+        cur = self._reader().execute(f"SELECT {columns(Artist)} FROM artists WHERE id = ?", (artist_id,))
+        return _fetch_one(cur, Artist)
 
+    @reads
     def get_user_artists(self, user_id):
-        self.cur.execute("SELECT id, name FROM artists WHERE user_id = ?", (user_id,))
-        return self.cur.fetchall()
+        cur = self._reader().execute(f"SELECT {columns(Artist)} FROM artists WHERE user_id = ?", (user_id,))
+        return _fetch(cur, Artist)
+
+    @reads
+    def page_artists(self, after_id=None, backward=False, limit=10):
+        """Страница справочника артистов по (name, id); курсор — id граничного артиста."""
+        cursor = None
+        if after_id is not None:
+            row = self._reader().execute("SELECT name, id FROM artists WHERE id = ?", (after_id,)).fetchone()
+            cursor = tuple(row) if row else None
+        return self._keyset_page(f"SELECT {columns(Artist)} FROM artists WHERE 1", (),
+                                 ("name", "id"), cursor, backward, limit, descending=False, model=Artist)
 
+    @writes
     def delete_artist(self, artist_id, user_id):
-        self.cur.execute("DELETE FROM artists WHERE id = ? AND user_id = ?", (artist_id, user_id))
-        self.conn.commit()
+        cur = self.conn.execute("DELETE FROM artists WHERE id = ? AND user_id = ?", (artist_id, user_id))
+        if cur.rowcount:
+            self.conn.execute("DELETE FROM follows WHERE artist_id = ?", (artist_id,))
+        self._commit()
 
+    @writes
     def get_or_create_first_artist(self, user_id, username_fallback):
-        artists = self.get_user_artists(user_id)
+        # читаем через соединение писателя, чтобы проверка и вставка шли в одном потоке
+        artists = self.conn.execute("SELECT id, name FROM artists WHERE user_id = ?", (user_id,)).fetchall()
         if artists:
             return artists[0][0], artists[0][1]
         name = (username_fallback or f"artist_{user_id}")[:128]
         aid = self.add_artist(user_id, name)
         return aid, name
 
+    # follows
+    @writes
+    def follow_artist(self, user_id, artist_id):
+        self.conn.execute("INSERT OR IGNORE INTO follows (artist_id, user_id) VALUES (?, ?)", (artist_id, user_id))
+        self._commit()
+
+    @writes
+    def unfollow_artist(self, user_id, artist_id):
+        self.conn.execute("DELETE FROM follows WHERE artist_id = ? AND user_id = ?", (artist_id, user_id))
+        self._commit()
+
+    @reads
+    def get_followed_artist_ids(self, user_id):
+        """Id карточек, на которые подписан пользователь."""
+        cur = self._reader().execute("SELECT artist_id FROM follows WHERE user_id = ?", (user_id,))
+        return frozenset(r[0] for r in cur)
+
+    @reads
+    def page_user_follows(self, user_id, after_id=None, backward=False, limit=10):
+        """Страница карточек, на которые подписан пользователь, по (name, id); курсор — id карточки."""
+        cursor = None
+        if after_id is not None:
+            row = self._reader().execute("SELECT name, id FROM artists WHERE id = ?", (after_id,)).fetchone()
+            cursor = tuple(row) if row else None
+        return self._keyset_page(f"""
+            SELECT {columns(Artist, "a")} FROM follows f JOIN artists a ON a.id = f.artist_id
+            WHERE f.user_id = ?""", (user_id,),
+            ("a.name", "a.id"), cursor, backward, limit, descending=False, model=Artist)
+
+    @writes
+    def set_follow_all(self, user_id, enabled):
+        self.conn.execute("UPDATE users SET follow_all = ? WHERE telegram_id = ?", (int(enabled), user_id))
+        self._commit()
+
+    @reads
+    def get_follow_all(self, user_id):
+        row = self._reader().execute("SELECT follow_all FROM users WHERE telegram_id = ?", (user_id,)).fetchone()
+        return bool(row and row[0])
+
+    @reads
+    def get_subscribers_after(self, artist_ids, cursor, limit=100):
+        """
+        Следующая пачка получателей новинок artist_ids после telegram_id cursor:
+        подписчики этих артистов и пользователи с follow_all, кроме недоставляемых.
+        Возвращает [(telegram_id, follow_all, {artist_id, ...})] по возрастанию telegram_id.
+        Каждый источник читается по своему индексу с места курсора (не больше limit
+        строк), и результаты сливаются — цена пачки не зависит от числа пользователей
+        и подписчиков.
+        """
+        conn = self._reader()
+        sources = [(None, conn.execute(
+            "SELECT telegram_id FROM users WHERE follow_all = 1 AND delivery_state = 'active' AND telegram_id > ? "
+            "ORDER BY telegram_id LIMIT ?",
+            (cursor, limit)
+        ).fetchall())]
+        for artist_id in artist_ids:
+            sources.append((artist_id, conn.execute(
+                "SELECT f.user_id FROM follows f JOIN users u ON u.telegram_id = f.user_id "
+                "WHERE f.artist_id = ? AND f.user_id > ? AND u.delivery_state = 'active' "
+                "ORDER BY f.user_id LIMIT ?",
+                (artist_id, cursor, limit)
+            ).fetchall()))
+        # за последним id полной выборки у источника могут быть ещё строки — дальше него не заходим
+        bound = min((rows[-1][0] for _, rows in sources if len(rows) == limit), default=None)
+        recipients = {}
+        for artist_id, rows in sources:
+            for (uid,) in rows:
+                if bound is not None and uid > bound:
+                    break
+                entry = recipients.setdefault(uid, [False, set()])
+                if artist_id is None:
+                    entry[0] = True
+                else:
+                    entry[1].add(artist_id)
+        return [(uid, *recipients[uid]) for uid in sorted(recipients)[:limit]]
+
     # tracks
-    def add_user_track(self, user_id, file_id, title, performer, artist_id=None, storage_message_id=None):
-        self.cur.execute("""
-            INSERT INTO tracks (user_id, artist_id, title, performer, file_id, storage_message_id, is_common)
-            VALUES (?, ?, ?, ?, ?, ?, 0)
-        """, (user_id, artist_id, title, performer, file_id, storage_message_id))
-        self.conn.commit()
-        return self.cur.lastrowid
-
-    def add_common_track(self, user_id, file_id, title, performer, artist_id=None, storage_message_id=None):
-        self.cur.execute("""
-            INSERT INTO tracks (user_id, artist_id, title, performer, file_id, storage_message_id, is_common)
-            VALUES (?, ?, ?, ?, ?, ?, 1)
-        """, (user_id, artist_id, title, performer, file_id, storage_message_id))
-        self.conn.commit()
-        return self.cur.lastrowid
+    def _insert_track(self, user_id, file_id, title, performer, artist_id, storage_message_id, is_common,
+                      file_unique_id):
+        """
+        Вставка трека без commit. Если известен file_unique_id, трек ссылается на
+        объект хранилища: уже заархивированное аудио переиспользуется без новой загрузки.
+        """
+        if file_unique_id:
+            self.conn.execute("""
+                INSERT INTO storage_objects (file_unique_id, file_id, storage_message_id, state, refcount)
+                VALUES (?, ?, ?, ?, 1)
+                ON CONFLICT (file_unique_id) DO UPDATE SET refcount = refcount + 1
+            """, (file_unique_id, file_id, storage_message_id, "stored" if storage_message_id else "pending"))
+            file_id, storage_message_id = self.conn.execute(
+                "SELECT file_id, storage_message_id FROM storage_objects WHERE file_unique_id = ?",
+                (file_unique_id,)
+            ).fetchone()
+            # состояние хранит объект, поштучный обход треков его не трогает
+            storage_state = "object"
+        else:
+            # без storage_message_id трек ждёт фоновой архивации в канал-хранилище
+            storage_state = "stored" if storage_message_id else "pending"
+        cur = self.conn.execute("""
+            INSERT INTO tracks (user_id, artist_id, title, performer, file_id, storage_message_id, is_common,
+                                storage_state, file_unique_id, title_key, performer_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (user_id, artist_id, title, performer, file_id, storage_message_id, is_common,
+              storage_state, file_unique_id, search_key(title), search_key(performer)))
+        return cur.lastrowid
+
+    @writes
+    def add_user_track(self, user_id, file_id, title, performer, artist_id=None, storage_message_id=None,
+                       file_unique_id=None):
+        track_id = self._insert_track(user_id, file_id, title, performer, artist_id, storage_message_id, 0,
+                                      file_unique_id)
+        self._commit()
+        return track_id
+
+    @writes
+    def add_common_track(self, user_id, file_id, title, performer, artist_id=None, storage_message_id=None,
+                         notify=True, file_unique_id=None):
+        """Добавляет трек в общий плейлист и в той же транзакции кладёт событие в outbox."""
+        with self._unit():
+            track_id = self._insert_track(user_id, file_id, title, performer, artist_id, storage_message_id, 1,
+                                          file_unique_id)
+            if notify:
+                self._enqueue_outbox("new_track", {
+                    "track_id": track_id,
+                    "sender": user_id,
+                    "artist_id": artist_id,
+                    "artist_name": performer,
+                    "title": title,
+                })
+        return track_id
 
+    @writes
+    def add_album(self, user_id, tracks, artist_id=None, notify=True):
+        """
+        Сохраняет альбом одной транзакцией; tracks — список (file_id, title, performer, file_unique_id).
+        С artist_id треки попадают в общий плейлист, и в outbox кладётся одно
+        событие на весь релиз. Возвращает id треков в порядке tracks.
+        """
+        is_common = 0 if artist_id is None else 1
+        with self._unit():
+            self.conn.executemany("""
+                INSERT INTO storage_objects (file_unique_id, file_id, state, refcount) VALUES (?, ?, 'pending', 1)
+                ON CONFLICT (file_unique_id) DO UPDATE SET refcount = refcount + 1
+            """, [(uid, file_id) for file_id, _, _, uid in tracks if uid])
+            # уже заархивированное аудио берём из объекта хранилища, как в _insert_track
+            self.conn.executemany("""
+                INSERT INTO tracks (user_id, artist_id, title, performer, file_id, storage_message_id, is_common,
+                                    storage_state, file_unique_id, title_key, performer_key)
+                SELECT ?, ?, ?, ?, COALESCE(o.file_id, ?), o.storage_message_id, ?,
+                       CASE WHEN o.file_unique_id IS NULL THEN 'pending' ELSE 'object' END, ?, ?, ?
+                FROM (SELECT 1) LEFT JOIN storage_objects o ON o.file_unique_id = ?
+            """, [(user_id, artist_id, title, performer, file_id, is_common, uid,
+                   search_key(title), search_key(performer), uid)
+                  for file_id, title, performer, uid in tracks])
+            # писатель один, а id с AUTOINCREMENT внутри транзакции идут подряд
+            last_id = self.conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            track_ids = list(range(last_id - len(tracks) + 1, last_id + 1))
+            if is_common and notify:
+                self._enqueue_outbox("new_release", {
+                    "track_ids": track_ids,
+                    "sender": user_id,
+                    "artist_id": artist_id,
+                    "artist_name": tracks[0][2],
+                    "titles": [t[1] for t in tracks],
+                })
+        return track_ids
+
+    @reads
     def get_user_tracks(self, user_id):
-        self.cur.execute("SELECT * FROM tracks WHERE user_id = ? ORDER BY created_at DESC", (user_id,))
-        return self.cur.fetchall()
+        """Полные записи треков пользователя, новые первыми."""
+        cur = self._reader().execute(f"SELECT {columns(Track)} FROM tracks WHERE user_id = ? ORDER BY created_at DESC",
+                                     (user_id,))
+        return _fetch(cur, Track)
 
+    @reads
     def get_common_tracks(self):
-        self.cur.execute("SELECT * FROM tracks WHERE is_common = 1 ORDER BY created_at DESC")
-        return self.cur.fetchall()
+        cur = self._reader().execute(f"SELECT {columns(Track)} FROM tracks WHERE is_common = 1 ORDER BY created_at DESC")
+        return _fetch(cur, Track)
+
+    def iter_common_tracks(self):
+        """
+        Весь общий каталог, новые первыми, без списка на все треки. Генератор читает
+        соединением своего потока, поэтому он для синхронного кода (скрипты, бенчмарки);
+        в боте — AsyncDatabase.iter_common_tracks, пачками через page_common_tracks.
+        """
+        cur = self._reader().execute(f"SELECT {columns(Track)} FROM tracks WHERE is_common = 1 "
+                                     "ORDER BY created_at DESC, id DESC")
+        yield from _iter(cur, Track)
+
+    @reads
+    def page_common_tracks(self, cursor=None, limit=500):
+        """Пачка общего каталога после cursor — (created_at, id) последнего трека предыдущей пачки."""
+        return self._keyset_page(f"SELECT {columns(Track)} FROM tracks WHERE is_common = 1", (),
+                                 ("created_at", "id"), cursor, False, limit, descending=True, model=Track)
 
+    @reads
+    def get_artist_common_tracks(self, artist_id):
+        cur = self._reader().execute(
+            f"SELECT {columns(TrackListItem)} FROM tracks WHERE artist_id = ? AND is_common = 1 ORDER BY created_at DESC",
+            (artist_id,)
+        )
+        return _fetch(cur, TrackListItem)
+
+    @reads
+    def page_user_tracks(self, user_id, cursor=None, backward=False, limit=10):
+        """Страница личного каталога; cursor — (created_at, id) граничного трека."""
+        return self._keyset_page(f"SELECT {columns(TrackListItem)} FROM tracks WHERE user_id = ?", (user_id,),
+                                 ("created_at", "id"), cursor, backward, limit, descending=True, model=TrackListItem)
+
+    @reads
+    def page_artist_tracks(self, artist_id, cursor=None, backward=False, limit=10):
+        """Страница общих треков артиста; cursor — (created_at, id) граничного трека."""
+        return self._keyset_page(
+            f"SELECT {columns(TrackListItem)} FROM tracks WHERE artist_id = ? AND is_common = 1",
+            (artist_id,), ("created_at", "id"), cursor, backward, limit, descending=True, model=TrackListItem
+        )
+
+    @reads
     def get_track(self, track_id):
-        self.cur.execute("SELECT * FROM tracks WHERE id = ?", (track_id,))
-        return self.cur.fetchone()
+        cur = self._reader().execute(f"SELECT {columns(TrackPlayback)} FROM tracks WHERE id = ?", (track_id,))
+        return _fetch_one(cur, TrackPlayback)
 
+    @writes
     def delete_track(self, track_id):
-        self.cur.execute("DELETE FROM tracks WHERE id = ?", (track_id,))
-        self.conn.commit()
+        """
+        Удаляет трек и снимает ссылку на объект хранилища.
+        Возвращает storage_message_id, который больше никому не нужен и должен
+        быть удалён из канала-хранилища, иначе None.
+        """
+        row = self.conn.execute("SELECT file_unique_id, storage_message_id FROM tracks WHERE id = ?",
+                                (track_id,)).fetchone()
+        if row is None:
+            return None
+        file_unique_id, orphan_message_id = row
+        self.conn.execute("DELETE FROM tracks WHERE id = ?", (track_id,))
+        if file_unique_id:
+            orphan_message_id = None
+            self.conn.execute("UPDATE storage_objects SET refcount = refcount - 1 WHERE file_unique_id = ?",
+                              (file_unique_id,))
+            obj = self.conn.execute(
+                "SELECT refcount, storage_message_id FROM storage_objects WHERE file_unique_id = ?",
+                (file_unique_id,)
+            ).fetchone()
+            if obj and obj[0] <= 0:
+                self.conn.execute("DELETE FROM storage_objects WHERE file_unique_id = ?", (file_unique_id,))
+                orphan_message_id = obj[1]
+        self._commit()
+        return orphan_message_id
+
+    # поиск
+    def _fts_search(self, fts, sql, prefix_sql, params, query, offset, limit, model, row_text):
+        """
+        Выполняет sql по индексу fts (параметры: выражение MATCH, наименьший rowid,
+        params, LIMIT и OFFSET). Сначала ищет все слова запроса как
+        подстроки; если так не нашлось ничего, берёт кандидатов по любым триграммам
+        запроса и оставляет строки, где каждое слово запроса похоже на какое-то
+        слово строки — это переживает опечатку или пропущенную букву.
+        Запрос без слов из 3 букв триграммы не найдут — его ищет prefix_sql
+        (параметры: начало и конец диапазона ключа, params, LIMIT и OFFSET)
+        как начало названия.
+        """
+        words = [w for w in re.findall(r"\w+", query.lower()) if len(w) >= 3]
+        conn = self._reader()
+        if not words:
+            key = search_key(query.strip())
+            if not key:
+                return []
+            return _fetch(conn.execute(prefix_sql, (key, key + PREFIX_END, *params, limit, offset)), model)
+        exact = " AND ".join(f'"{w}"' for w in words)
+        rows = _fetch(conn.execute(sql, (exact, 0, *params, limit, offset)), model)
+        if rows or (offset and conn.execute(sql, (exact, 0, *params, 1, 0)).fetchone()):
+            return rows
+
+        grams = {w[i:i + 3] for w in words for i in range(len(w) - 2)}
+        fuzzy = " OR ".join(f'"{g}"' for g in sorted(grams))
+        # bm25 считается для каждого совпадения, а частые триграммы есть в тысячах строк —
+        # ранжируются только FUZZY_SCAN последних, в Python оцениваются FUZZY_CANDIDATES лучших
+        floor = conn.execute(f"SELECT rowid FROM {fts} WHERE {fts} MATCH ? ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                             (fuzzy, FUZZY_SCAN - 1)).fetchone()
+        word_grams = [_trigrams(w) for w in words]
+        scored = []
+        cur = conn.execute(sql, (fuzzy, floor[0] if floor else 0, *params, FUZZY_CANDIDATES, 0))
+        for row in _fetch(cur, model):
+            score = _similarity(word_grams, row_text(row))
+            if score >= FUZZY_MIN_SIMILARITY:
+                scored.append((score, row))
+        scored.sort(key=lambda s: s[0], reverse=True)  # sort стабилен — при равенстве остаётся порядок bm25
+        return [row for _, row in scored[offset:offset + limit]]
+
+    @reads
+    def search_tracks(self, query, user_id, offset=0, limit=20):
+        """Общие треки и личные треки user_id по названию и исполнителю."""
+        sql = f"""
+            SELECT {columns(TrackPlayback, "t")} FROM tracks_fts
+            JOIN tracks t ON t.id = tracks_fts.rowid
+            WHERE tracks_fts MATCH ? AND tracks_fts.rowid >= ? AND (t.is_common = 1 OR t.user_id = ?)
+            ORDER BY tracks_fts.rank LIMIT ? OFFSET ?
+        """
+        # два диапазона по индексам сливаются в порядке ключа без сортировки; OR в одном WHERE
+        # собрал бы и отсортировал все совпадения, а у однобуквенного запроса их тысячи
+        playback = columns(TrackPlayback)
+        prefix_sql = f"""
+            SELECT {playback} FROM (
+                SELECT {playback}, title_key AS sort_key FROM tracks
+                WHERE title_key >= ?1 AND title_key < ?2 AND (is_common = 1 OR user_id = ?3)
+                UNION ALL
+                SELECT {playback}, performer_key FROM tracks
+                WHERE performer_key >= ?1 AND performer_key < ?2 AND (is_common = 1 OR user_id = ?3)
+                  AND (title_key IS NULL OR title_key < ?1 OR title_key >= ?2)
+                ORDER BY sort_key LIMIT ?4 OFFSET ?5
+            )
+        """
+        return self._fts_search("tracks_fts", sql, prefix_sql, (user_id,), query, offset, limit, TrackPlayback,
+                                lambda t: f"{t.title or ''} {t.performer or ''}")
+
+    @reads
+    def search_artists(self, query, offset=0, limit=10):
+        """Карточки артистов по имени."""
+        sql = f"""
+            SELECT {columns(Artist, "a")} FROM artists_fts
+            JOIN artists a ON a.id = artists_fts.rowid
+            WHERE artists_fts MATCH ? AND artists_fts.rowid >= ?
+            ORDER BY artists_fts.rank LIMIT ? OFFSET ?
+        """
+        prefix_sql = f"""
+            SELECT {columns(Artist)} FROM artists
+            WHERE name_key >= ? AND name_key < ?
+            ORDER BY name_key LIMIT ? OFFSET ?
+        """
+        return self._fts_search("artists_fts", sql, prefix_sql, (), query, offset, limit, Artist,
+                                lambda a: a.name or "")
+
+    # архивация в канал-хранилище
+    @reads
+    def get_pending_storage(self, limit=100):
+        cur = self._reader().execute(
+            "SELECT id, file_id, title, performer FROM tracks WHERE storage_state = 'pending' ORDER BY id LIMIT ?",
+            (limit,)
+        )
+        return cur.fetchall()
+
+    @writes
+    def set_track_storage(self, track_id, file_id, storage_message_id):
+        """Отмечает трек заархивированным. Возвращает False, если трека уже нет."""
+        cur = self.conn.execute("""
+            UPDATE tracks SET file_id = ?, storage_message_id = ?, storage_state = 'stored'
+            WHERE id = ?
+        """, (file_id, storage_message_id, track_id))
+        self._commit()
+        return cur.rowcount > 0
+
+    @writes
+    def fail_track_storage(self, track_id, max_attempts, permanent=False):
+        """Учитывает неудачную попытку; после max_attempts (или сразу при permanent) — 'failed'."""
+        self.conn.execute("""
+            UPDATE tracks SET storage_attempts = storage_attempts + 1,
+                storage_state = CASE WHEN ? OR storage_attempts + 1 >= ? THEN 'failed' ELSE storage_state END
+            WHERE id = ?
+        """, (permanent, max_attempts, track_id))
+        self._commit()
+
+    @reads
+    def get_storage_object(self, file_unique_id):
+        cur = self._reader().execute(
+            "SELECT file_unique_id, file_id, storage_message_id, state, refcount FROM storage_objects "
+            "WHERE file_unique_id = ?", (file_unique_id,)
+        )
+        return cur.fetchone()
+
+    @reads
+    def get_pending_objects(self, limit=100):
+        """Объекты, ждущие архивации, с подписью по одному из ссылающихся треков."""
+        cur = self._reader().execute("""
+            SELECT o.file_unique_id, o.file_id,
+                   (SELECT performer || ' — ' || title FROM tracks t WHERE t.file_unique_id = o.file_unique_id LIMIT 1)
+            FROM storage_objects o WHERE o.state = 'pending' LIMIT ?
+        """, (limit,))
+        return cur.fetchall()
+
+    @writes
+    def set_object_storage(self, file_unique_id, file_id, storage_message_id):
+        """
+        Отмечает объект заархивированным и проставляет file_id/storage_message_id
+        всем ссылающимся трекам. Возвращает id этих треков или None, если объекта уже нет.
+        """
+        cur = self.conn.execute("""
+            UPDATE storage_objects SET file_id = ?, storage_message_id = ?, state = 'stored'
+            WHERE file_unique_id = ?
+        """, (file_id, storage_message_id, file_unique_id))
+        if cur.rowcount == 0:
+            self._commit()
+            return None
+        track_ids = [r[0] for r in self.conn.execute(
+            "SELECT id FROM tracks WHERE file_unique_id = ?", (file_unique_id,)
+        ).fetchall()]
+        self.conn.execute("UPDATE tracks SET file_id = ?, storage_message_id = ? WHERE file_unique_id = ?",
+                          (file_id, storage_message_id, file_unique_id))
+        self._commit()
+        return track_ids
+
+    @writes
+    def fail_object_storage(self, file_unique_id, max_attempts, permanent=False):
+        self.conn.execute("""
+            UPDATE storage_objects SET attempts = attempts + 1,
+                state = CASE WHEN ? OR attempts + 1 >= ? THEN 'failed' ELSE state END
+            WHERE file_unique_id = ?
+        """, (permanent, max_attempts, file_unique_id))
+        self._commit()
+
+    # анализ аудио
+    @reads
+    def get_pending_analysis(self, limit=100):
+        """Треки, ждущие анализа: (id, file_unique_id, file_id)."""
+        cur = self._reader().execute(
+            "SELECT id, file_unique_id, file_id FROM tracks WHERE analysis_state = 'pending' ORDER BY id LIMIT ?",
+            (limit,)
+        )
+        return cur.fetchall()
+
+    def _analysis_target(self, track_id, file_unique_id):
+        # одно аудио — один анализ на все ссылающиеся треки
+        if file_unique_id:
+            return "file_unique_id = ?", file_unique_id
+        return "id = ?", track_id
+
+    @writes
+    def copy_analysis(self, file_unique_id):
+        """
+        Переносит готовый анализ того же аудио на ожидающие треки (повторная публикация).
+        Возвращает id обновлённых треков; пусто — это аудио ещё не разбиралось.
+        """
+        fields = [column for column, _ in ANALYSIS_FIELDS] + ["duplicate_of"]
+        source = self.conn.execute(
+            f"SELECT {', '.join(fields)} FROM tracks WHERE file_unique_id = ? AND analysis_state = 'done' LIMIT 1",
+            (file_unique_id,)
+        ).fetchone()
+        if source is None:
+            return []
+        track_ids = [r[0] for r in self.conn.execute(
+            "SELECT id FROM tracks WHERE file_unique_id = ? AND analysis_state = 'pending'", (file_unique_id,)
+        ).fetchall()]
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.conn.execute(
+            f"UPDATE tracks SET {assignments}, analysis_state = 'done' "
+            f"WHERE file_unique_id = ? AND analysis_state = 'pending'",
+            (*source, file_unique_id)
+        )
+        self._commit()
+        return track_ids
+
+    @writes
+    def set_analysis(self, track_id, file_unique_id, result, duplicate_of=None):
+        """Сохраняет результат анализа (словарь из utils/audio.py). Возвращает id обновлённых треков."""
+        where, key = self._analysis_target(track_id, file_unique_id)
+        track_ids = [r[0] for r in self.conn.execute(f"SELECT id FROM tracks WHERE {where}", (key,)).fetchall()]
+        values = [result.get(name) for _, name in ANALYSIS_FIELDS]
+        assignments = ", ".join(f"{column} = ?" for column, _ in ANALYSIS_FIELDS)
+        self.conn.execute(
+            f"UPDATE tracks SET {assignments}, duplicate_of = ?, analysis_state = 'done' WHERE {where}",
+            (*values, duplicate_of, key)
+        )
+        self._commit()
+        return track_ids
+
+    @writes
+    def set_analysis_state(self, track_id, file_unique_id, state):
+        """'failed' — аудио не разобралось, 'skipped' — файл не скачать (слишком большой и т.п.)."""
+        where, key = self._analysis_target(track_id, file_unique_id)
+        self.conn.execute(f"UPDATE tracks SET analysis_state = ? WHERE {where}", (state, key))
+        self._commit()
+
+    @writes
+    def fail_analysis(self, track_id, file_unique_id, max_attempts):
+        """Учитывает неудачную попытку скачать аудио; после max_attempts — 'failed'."""
+        where, key = self._analysis_target(track_id, file_unique_id)
+        self.conn.execute(f"""
+            UPDATE tracks SET analysis_attempts = analysis_attempts + 1,
+                analysis_state = CASE WHEN analysis_attempts + 1 >= ? THEN 'failed' ELSE analysis_state END
+            WHERE {where}
+        """, (max_attempts, key))
+        self._commit()
+
+    @reads
+    def get_fingerprint_candidates(self, duration, tolerance, track_id, file_unique_id, cursor=None, limit=200):
+        """
+        Пачка кандидатов в почти-дубликаты — разобранные треки с отпечатком и длительностью
+        duration ± tolerance, по одному на аудио (первый трек с ним): [(id, duration, fingerprint)]
+        в порядке (duration, id), как в индексе. cursor — (duration, id) последнего кандидата
+        предыдущей пачки; обход до пустой пачки проходит всю библиотеку.
+        """
+        low, high = duration - tolerance, duration + tolerance
+        after = cursor or (low, 0)
+        cur = self._reader().execute("""
+            SELECT id, duration, fingerprint FROM tracks
+            WHERE fingerprint IS NOT NULL AND (duration, id) > (?, ?) AND duration <= ?
+              AND id != ? AND file_unique_id IS NOT ?
+              AND (file_unique_id IS NULL
+                   OR id = (SELECT MIN(o.id) FROM tracks o WHERE o.file_unique_id = tracks.file_unique_id))
+            ORDER BY duration, id LIMIT ?
+        """, (*after, high, track_id, file_unique_id, limit))
+        return cur.fetchall()
+
+    @reads
+    def get_duplicates(self, limit=20):
+        """Последние найденные почти-дубликаты: [(id, performer, title, id оригинала, performer, title)]."""
+        cur = self._reader().execute("""
+            SELECT t.id, t.performer, t.title, d.id, d.performer, d.title
+            FROM tracks t JOIN tracks d ON d.id = t.duplicate_of
+            WHERE t.duplicate_of IS NOT NULL
+            ORDER BY t.id DESC LIMIT ?
+        """, (limit,))
+        return cur.fetchall()
+
+    # outbox
+    def _enqueue_outbox(self, kind, payload):
+        # без commit: вызывается внутри транзакции пишущего метода
+        self.conn.execute("INSERT INTO outbox (kind, payload) VALUES (?, ?)",
+                          (kind, json.dumps(payload, ensure_ascii=False)))
+
+    @reads
+    def get_pending_outbox(self, limit=10):
+        """Ожидающие события по порядку: (id, kind, payload, cursor, возраст в секундах)."""
+        cur = self._reader().execute("""
+            SELECT id, kind, payload, cursor, (julianday('now') - julianday(created_at)) * 86400
+            FROM outbox WHERE status = 'pending' ORDER BY id LIMIT ?
+        """, (limit,))
+        return [(r[0], r[1], json.loads(r[2]), r[3], r[4]) for r in cur.fetchall()]
+
+    @writes
+    def advance_outbox(self, event_ids, cursor):
+        """Сдвигает курсор сразу всем событиям одной сводки."""
+        self.conn.execute(f"UPDATE outbox SET cursor = ? WHERE id IN ({', '.join('?' * len(event_ids))})",
+                          (cursor, *event_ids))
+        self._commit()
+
+    @writes
+    def complete_outbox(self, event_ids):
+        self.conn.execute(
+            f"UPDATE outbox SET status = 'done', done_at = CURRENT_TIMESTAMP "
+            f"WHERE id IN ({', '.join('?' * len(event_ids))})",
+            tuple(event_ids)
+        )
+        self._commit()
+
+    # fsm
+    @reads
+    def fsm_load(self, key):
+        cur = self._reader().execute("SELECT state, data, updated_at FROM fsm_state WHERE key = ?", (key,))
+        row = cur.fetchone()
+        return (row[0], json.loads(row[1]) if row[1] else {}, row[2]) if row else None
+
+    @writes
+    def fsm_save_many(self, rows):
+        """rows: (key, state, data, updated_at); одна транзакция на всю пачку."""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO fsm_state (key, state, data, updated_at) VALUES (?, ?, ?, ?)",
+            [(k, st, json.dumps(d, ensure_ascii=False), ts) for k, st, d, ts in rows]
+        )
+        self._commit()
+
+    @writes
+    def fsm_delete_many(self, keys):
+        self.conn.executemany("DELETE FROM fsm_state WHERE key = ?", [(k,) for k in keys])
+        self._commit()
+
+    @writes
+    def fsm_expire(self, before):
+        cur = self.conn.execute("DELETE FROM fsm_state WHERE updated_at < ?", (before,))
+        self._commit()
+        return cur.rowcount
 
     # notifications (utility)
+    @writes
     def add_notification(self, user_id, message):
-        self.cur.execute("INSERT INTO notifications (user_id, message) VALUES (?, ?)", (user_id, message))
-        self.conn.commit()
+        self.conn.execute("INSERT INTO notifications (user_id, message) VALUES (?, ?)", (user_id, message))
+        self._commit()
+
+    @reads
+    def get_catalog_epoch(self):
+        row = self._reader().execute("SELECT value FROM bot_meta WHERE key = 'catalog_epoch'").fetchone()
+        return int(row[0]) if row else 0
+
+    @reads
+    def get_delivery_epoch(self):
+        row = self._reader().execute("SELECT value FROM bot_meta WHERE key = 'delivery_epoch'").fetchone()
+        return int(row[0]) if row else 0
 
+    @reads
     def get_bot_version(self):
-        self.cur.execute("SELECT value FROM bot_meta WHERE key = 'version'")
-        row = self.cur.fetchone()
+        row = self._reader().execute("SELECT value FROM bot_meta WHERE key = 'version'").fetchone()
         return row[0] if row else None
 
+    @writes
     def set_bot_version(self, version):
-        self.cur.execute("INSERT OR REPLACE INTO bot_meta (key, value) VALUES ('version', ?)", (version,))
-        self.conn.commit()
+        self.conn.execute("INSERT OR REPLACE INTO bot_meta (key, value) VALUES ('version', ?)", (version,))
+        self._commit()
+
+    # campaigns
+    @writes
+    def create_campaign(self, key, text, parse_mode=None):
+        """
+        Создаёт кампанию-рассылку всем доставляемым пользователям; с тем же key — ничего не делает.
+        Получатели — пользователи на момент создания: кампания заканчивается на наибольшем telegram_id.
+        """
+        self.conn.execute("""
+            INSERT OR IGNORE INTO campaigns (key, text, parse_mode, upper_bound, total)
+            VALUES (?, ?, ?, (SELECT COALESCE(MAX(telegram_id), 0) FROM users),
+                    (SELECT COUNT(*) FROM users WHERE delivery_state = 'active'))
+        """, (key, text, parse_mode))
+        self._commit()
+
+    @reads
+    def get_running_campaigns(self):
+        """[(id, key, text, parse_mode, cursor, upper_bound)] незавершённых кампаний в порядке создания."""
+        cur = self._reader().execute(
+            "SELECT id, key, text, parse_mode, cursor, upper_bound FROM campaigns WHERE status = 'running' ORDER BY id"
+        )
+        return cur.fetchall()
+
+    @writes
+    def advance_campaign(self, campaign_id, cursor, sent, failed):
+        """Сдвигает курсор кампании; sent и failed — сколько прибавить к счётчикам."""
+        self.conn.execute("""
+            UPDATE campaigns SET cursor = ?, sent = sent + ?, failed = failed + ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (cursor, sent, failed, campaign_id))
+        self._commit()
 
-        # --- version updates ---
-    def has_version_been_sent(self, version: str) -> bool:
-        self.cur.execute("SELECT version FROM sent_updates WHERE version = ?", (version,))
-        return self.cur.fetchone() is not None
+    @writes
+    def finish_campaign(self, campaign_id):
+        self.conn.execute(
+            "UPDATE campaigns SET status = 'done', finished_at = CURRENT_TIMESTAMP WHERE id = ?", (campaign_id,)
+        )
+        self._commit()
 
-    def mark_version_as_sent(self, version: str):
-        self.cur.execute("INSERT OR IGNORE INTO sent_updates (version) VALUES (?)", (version,))
-        self.conn.commit()
+    @reads
+    def get_campaigns(self, limit=10):
+        """
+        Последние кампании с прогрессом:
+        [(key, status, total, sent, failed, осталось получателей, created_at, finished_at)].
+        """
+        conn = self._reader()
+        rows = conn.execute("""
+            SELECT key, status, total, sent, failed, cursor, upper_bound, created_at, finished_at
+            FROM campaigns ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()
+        result = []
+        for key, status, total, sent, failed, cursor, upper_bound, created_at, finished_at in rows:
+            remaining = 0
+            if status == "running":
+                remaining = conn.execute(
+                    "SELECT COUNT(*) FROM users WHERE delivery_state = 'active' AND telegram_id > ? "
+                    "AND (? IS NULL OR telegram_id <= ?)", (cursor, upper_bound, upper_bound)
+                ).fetchone()[0]
+            result.append((key, status, total, sent, failed, remaining, created_at, finished_at))
+        return result
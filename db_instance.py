@@ -1,3 +1,4 @@
 # db_instance.py
-from database import Database
-db = Database()
+from async_database import AsyncDatabase
+from config import DATABASE_PATH
+db = AsyncDatabase(DATABASE_PATH)
@@ -1,2 +1,2 @@
 # handlers/__init__.py
-from . import start, upload, playlists, artist
+from . import start, upload, playlists, artist, search
@@ -0,0 +1,38 @@
+﻿# handlers/admin.py
+from aiogram import Router, F
+from aiogram.filters import Command
+from aiogram.types import Message
+from config import ADMIN_IDS
+from db_instance import db
+from utils.campaigns import campaigns
+
+router = Router(name=__name__)
+router.message.filter(F.from_user.id.in_(ADMIN_IDS))
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}ч {minutes:02d}м" if hours else f"{minutes}м {seconds:02d}с"
+
+@router.message(Command("campaigns"))
+async def campaigns_status(message: Message):
+    rows = await campaigns.progress()
+    if not rows:
+        return message.answer("📭 Рассылок ещё не было.")
+    lines = []
+    for key, status, total, sent, failed, remaining, eta in rows:
+        if status == "running":
+            lines.append(f"⏳ {key}: отправлено {sent}, ошибок {failed}, осталось {remaining} "
+                         f"из {total} — ещё ~{_duration(eta)}")
+        else:
+            lines.append(f"✅ {key}: отправлено {sent}, ошибок {failed}")
+    return message.answer("📣 Рассылки:\n\n" + "\n".join(lines))
+
+@router.message(Command("duplicates"))
+async def duplicates(message: Message):
+    rows = await db.get_duplicates()
+    if not rows:
+        return message.answer("🔍 Почти-дубликатов не найдено.")
+    lines = [f"#{tid} {performer} — {title}\n    ≈ #{oid} {o_performer} — {o_title}"
+             for tid, performer, title, oid, o_performer, o_title in rows]
+    return message.answer("🔁 Похожие треки (новые первыми):\n\n" + "\n".join(lines))
@@ -1,54 +1,164 @@
 ﻿# handlers/artist.py
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.context import FSMContext
 from db_instance import db
-from keyboards import main_menu
+from keyboards import main_menu, cached_markup
+from utils.callbacks import callbacks, ArtistsPage, ArtistPage, FollowArtist, PlayTrack, SubsPage
+from utils.pagination import (PAGE_SIZE, make_page, page_keyboard,
+                              encode_track_key, decode_track_key, encode_id_key, decode_id_key)
 
-router = Router()
+router = Router(name=__name__)
 
 class ArtistForm(StatesGroup):
     waiting_for_name = State()
 
-@router.callback_query(lambda c: c.data == "common_playlist")
-async def common_playlist(callback: CallbackQuery):
-    artists = db.get_all_artists()
-    if not artists:
-        return await callback.message.edit_text("🌍 В общем плейлисте пока нет артистов.", reply_markup=main_menu())
+async def _artists_page(data: ArtistsPage):
+    """Клавиатура страницы справочника артистов (None — артистов нет)."""
+    cursor = decode_id_key(data.key) if data.key else None
+    backward = data.nav == "p"
+    rows = await db.page_artists(cursor, backward, PAGE_SIZE)
+    if not rows and cursor:
+        cursor, backward = None, False
+        rows = await db.page_artists(limit=PAGE_SIZE)
+    if not rows:
+        return None
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=a[2], callback_data=f"artist_{a[0]}")] for a in artists
-    ])
-    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")])
-    await callback.message.edit_text("🎤 Артисты:", reply_markup=keyboard)
-
-@router.callback_query(lambda c: c.data.startswith("artist_"))
-async def view_artist(callback: CallbackQuery):
-    try:
-        artist_id = int(callback.data.split("_", 1)[1])
-    except Exception:
-        await callback.answer("Неверный артист.", show_alert=True)
-        return
-    artist = db.get_artist(artist_id)
-    if not artist:
-        return await callback.message.answer("⚠️ Артист не найден.")
+    page = make_page(rows, cursor, backward)
+    return page_keyboard(
+        page,
+        lambda a: InlineKeyboardButton(text=a.name, callback_data=ArtistPage(artist_id=a.id).pack()),
+        lambda direction, key: ArtistsPage(nav=direction, key=key).pack(),
+        lambda a: encode_id_key(a.id),
+        footer=[[InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")]]
+    )
+
+@callbacks.route(ArtistsPage, legacy="common_playlist")
+async def common_playlist(callback: CallbackQuery, callback_data: ArtistsPage):
+    keyboard = await cached_markup(("arts", callback_data.pack(), db.catalog_version),
+                                   lambda: _artists_page(callback_data))
+    if keyboard is None:
+        return callback.message.edit_text("🌍 В общем плейлисте пока нет артистов.", reply_markup=main_menu())
+    return callback.message.edit_text("🎤 Артисты:", reply_markup=keyboard)
+
+async def _artist_tracks_page(artist, data: ArtistPage):
+    """Текст и клавиатура страницы общих треков артиста."""
+    cursor = decode_track_key(data.key) if data.key else None
+    backward = data.nav == "p"
+    tracks = await db.page_artist_tracks(artist.id, cursor, backward, PAGE_SIZE)
+    if not tracks and cursor:
+        cursor, backward = None, False
+        tracks = await db.page_artist_tracks(artist.id, limit=PAGE_SIZE)
 
-    tracks = db.cur.execute("SELECT id, title, performer FROM tracks WHERE artist_id = ? AND is_common = 1 ORDER BY created_at DESC", (artist[0],)).fetchall()
-    text = f"🎤 *{artist[2]}*\n\n🎵 Треки:"
+    text = f"🎤 *{artist.name}*\n\n🎵 Треки:"
     if not tracks:
         text += "\n(У артиста пока нет треков в общем плейлисте)"
 
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"{t[2]} — {t[1]}", callback_data=f"play_{t[0]}")] for t in tracks
-    ])
-    keyboard.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="common_playlist")])
-    await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+    page = make_page(tracks, cursor, backward)
+    keyboard = page_keyboard(
+        page,
+        lambda t: InlineKeyboardButton(text=f"{t.performer} — {t.title}", callback_data=PlayTrack(track_id=t.id).pack()),
+        lambda direction, key: ArtistPage(artist_id=artist.id, nav=direction, key=key).pack(),
+        lambda t: encode_track_key(t.created_at, t.id),
+        footer=[[InlineKeyboardButton(text="⬅️ Назад", callback_data=ArtistsPage().pack())]]
+    )
+    return text, keyboard
+
+async def _followable_page(artist, data: ArtistPage, following):
+    """Страница артиста с кнопкой подписки: у каждой страницы два варианта — для подписчиков и остальных."""
+    text, keyboard = await cached_markup(("at", data.pack(), db.catalog_version),
+                                         lambda: _artist_tracks_page(artist, data))
+    return text, InlineKeyboardMarkup(inline_keyboard=[[_follow_button(artist.id, following)],
+                                                       *keyboard.inline_keyboard])
+
+@callbacks.route(ArtistPage, legacy="artist")
+async def view_artist(callback: CallbackQuery, callback_data: ArtistPage):
+    artist_id = callback_data.artist_id
+    artist = await db.get_artist(artist_id)
+    if not artist:
+        return await callback.message.answer("⚠️ Артист не найден.")
+
+    following = await db.is_following(callback.from_user.id, artist_id)
+    text, keyboard = await cached_markup(("atf", callback_data.pack(), db.catalog_version, following),
+                                         lambda: _followable_page(artist, callback_data, following))
+    return callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+
+def _follow_button(artist_id, following):
+    if following:
+        return InlineKeyboardButton(text="🔕 Отписаться",
+                                    callback_data=FollowArtist(artist_id=artist_id, follow=False).pack())
+    return InlineKeyboardButton(text="🔔 Подписаться на новинки",
+                                callback_data=FollowArtist(artist_id=artist_id, follow=True).pack())
+
+@callbacks.route(FollowArtist)
+async def toggle_follow(callback: CallbackQuery, callback_data: FollowArtist):
+    artist_id = callback_data.artist_id
+    artist = await db.get_artist(artist_id)
+    if not artist:
+        await callback.answer("⚠️ Артист не найден.", show_alert=True)
+        return
+
+    following = callback_data.follow
+    if following:
+        await db.follow_artist(callback.from_user.id, artist_id)
+        await callback.answer(f"🔔 Будем присылать новинки {artist.name}")
+    else:
+        await db.unfollow_artist(callback.from_user.id, artist_id)
+        await callback.answer(f"🔕 Ты отписан от {artist.name}")
+
+    # меняем только кнопку подписки, страница треков остаётся той же
+    rows = callback.message.reply_markup.inline_keyboard if callback.message.reply_markup else []
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[[_follow_button(artist_id, following)], *rows[1:]])
+    return callback.message.edit_reply_markup(reply_markup=keyboard)
+
+async def _subscriptions_page(callback: CallbackQuery, data: SubsPage, follow_all):
+    """Страница подписок пользователя с переключателем «все новинки»."""
+    user_id = callback.from_user.id
+    cursor = decode_id_key(data.key) if data.key else None
+    backward = data.nav == "p"
+    rows = await db.page_user_follows(user_id, cursor, backward, PAGE_SIZE)
+    if not rows and cursor:
+        cursor, backward = None, False
+        rows = await db.page_user_follows(user_id, limit=PAGE_SIZE)
+
+    page = make_page(rows, cursor, backward)
+    kb = page_keyboard(
+        page,
+        lambda a: InlineKeyboardButton(text=f"🎤 {a.name}", callback_data=ArtistPage(artist_id=a.id).pack()),
+        lambda direction, key: SubsPage(nav=direction, key=key).pack(),
+        lambda a: encode_id_key(a.id),
+        footer=[
+            [InlineKeyboardButton(text="📣 Все новинки: вкл" if follow_all else "📣 Все новинки: выкл",
+                                  callback_data="subs_all")],
+            [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")],
+        ]
+    )
+
+    if follow_all:
+        text = "🔔 Ты получаешь уведомления обо всех новых треках в общем плейлисте."
+    elif page.rows:
+        text = "🔔 Уведомления приходят о новинках этих артистов:"
+    else:
+        text = "🔕 Ты ни на кого не подписан. Подпишись на карточку артиста или включи все новинки."
+    return callback.message.edit_text(text, reply_markup=kb)
+
+@callbacks.route(SubsPage, legacy="subscriptions")
+async def subscriptions(callback: CallbackQuery, callback_data: SubsPage):
+    follow_all = await db.get_follow_all(callback.from_user.id)
+    return await _subscriptions_page(callback, callback_data, follow_all)
+
+@callbacks.route("subs_all")
+async def toggle_follow_all(callback: CallbackQuery):
+    user_id = callback.from_user.id
+    follow_all = not await db.get_follow_all(user_id)
+    await db.set_follow_all(user_id, follow_all)
+    return await _subscriptions_page(callback, SubsPage(), follow_all)
 
-@router.callback_query(lambda c: c.data == "my_artist")
+@callbacks.route("my_artist")
 async def my_artist(callback: CallbackQuery):
     user_id = callback.from_user.id
-    artists = db.get_user_artists(user_id)
+    artists = await db.get_user_artists(user_id)
     if not artists:
         kb = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="🆕 Создать карточку", callback_data="create_artist_card")],
@@ -57,13 +167,13 @@ async def my_artist(callback: CallbackQuery):
         return await callback.message.edit_text("🎤 У тебя ещё нет карточек артиста.", reply_markup=kb)
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=a[1], callback_data=f"artist_{a[0]}")] for a in artists
+        [InlineKeyboardButton(text=a.name, callback_data=ArtistPage(artist_id=a.id).pack())] for a in artists
     ])
     kb.inline_keyboard.append([InlineKeyboardButton(text="➕ Создать новую", callback_data="create_artist_card")])
     kb.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")])
     await callback.message.edit_text("🎤 Твои карточки артистов:", reply_markup=kb)
 
-@router.callback_query(lambda c: c.data == "create_artist_card")
+@callbacks.route("create_artist_card")
 async def start_artist_creation(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text("Введите имя нового артиста:")
     await state.set_state(ArtistForm.waiting_for_name)
@@ -74,6 +184,6 @@ async def process_artist_name(message: Message, state: FSMContext):
     if not name:
         await message.answer("Имя не может быть пустым. Введи ещё раз:")
         return
-    db.add_artist(message.from_user.id, name)
+    await db.add_artist(message.from_user.id, name)
     await message.answer(f"✅ Карточка артиста '{name}' создана!", reply_markup=main_menu())
     await state.clear()
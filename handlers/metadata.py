@@ -1,19 +1,20 @@
 ﻿# handlers/metadata.py
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from keyboards import main_menu
 from db_instance import db
+from utils.callbacks import callbacks, MetadataArtist
 
-router = Router()
+router = Router(name=__name__)
 
 class MetadataForm(StatesGroup):
     waiting_for_title = State()
     waiting_for_performer_choice = State()
 
 # === Начало редактирования метаданных ===
-@router.callback_query(F.data == "edit_metadata")
+@callbacks.route("edit_metadata")
 async def start_metadata_edit(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer("🎵 Введи новое название трека:")
     await state.set_state(MetadataForm.waiting_for_title)
@@ -29,7 +30,7 @@ async def set_new_title(message: Message, state: FSMContext):
     await state.update_data(title=title)
 
     user_id = message.from_user.id
-    artists = db.get_user_artists(user_id)
+    artists = await db.get_user_artists(user_id)
 
     if not artists:
         kb = InlineKeyboardMarkup(inline_keyboard=[
@@ -41,7 +42,7 @@ async def set_new_title(message: Message, state: FSMContext):
         return
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=a[1], callback_data=f"meta_artist_{a[0]}")] for a in artists
+        [InlineKeyboardButton(text=a.name, callback_data=MetadataArtist(artist_id=a.id).pack())] for a in artists
     ])
     kb.inline_keyboard.append([InlineKeyboardButton(text="➕ Создать новую", callback_data="create_artist_card")])
     kb.inline_keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_metadata")])
@@ -51,23 +52,17 @@ async def set_new_title(message: Message, state: FSMContext):
 
 
 # === Обработка выбора карточки артиста ===
-@router.callback_query(F.data.startswith("meta_artist_"))
-async def set_metadata_artist(callback: CallbackQuery, state: FSMContext):
-    try:
-        artist_id = int(callback.data.split("_", 2)[2])
-    except Exception:
-        await callback.answer("Неверный выбор.", show_alert=True)
-        return
-
-    artist = db.get_artist(artist_id)
+@callbacks.route(MetadataArtist)
+async def set_metadata_artist(callback: CallbackQuery, state: FSMContext, callback_data: MetadataArtist):
+    artist = await db.get_artist(callback_data.artist_id)
     if not artist:
         await callback.answer("Карточка не найдена.", show_alert=True)
         return
 
-    await state.update_data(performer=artist[2])
+    await state.update_data(performer=artist.name)
     data = await state.get_data()
     title = data.get("title", "Без названия")
-    performer = artist[2]
+    performer = artist.name
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Сохранить", callback_data="confirm_metadata")],
@@ -83,7 +78,7 @@ async def set_metadata_artist(callback: CallbackQuery, state: FSMContext):
 
 # === Подтверждение изменения метаданных ===
 # === Подтверждение изменения метаданных ===
-@router.callback_query(F.data == "confirm_metadata")
+@callbacks.route("confirm_metadata")
 async def confirm_metadata(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     title = data.get("title", "Без названия")
@@ -107,7 +102,7 @@ async def confirm_metadata(callback: CallbackQuery, state: FSMContext):
 
 
 # === Отмена редактирования ===
-@router.callback_query(F.data == "cancel_metadata")
+@callbacks.route("cancel_metadata")
 async def cancel_metadata(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text("❌ Редактирование отменено.", reply_markup=main_menu())
     await state.clear()
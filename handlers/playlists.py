@@ -1,21 +1,33 @@
 ﻿# handlers/playlists.py
 from aiogram import Router
-from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import CallbackQuery, InlineKeyboardButton
 from db_instance import db
 from keyboards import main_menu
+from utils.callbacks import callbacks, CatalogPage, PlayTrack
+from utils.pagination import PAGE_SIZE, make_page, page_keyboard, encode_track_key, decode_track_key
 
-router = Router()
+router = Router(name=__name__)
 
-@router.callback_query(lambda c: c.data == "my_catalog")
-async def my_catalog(callback: CallbackQuery):
+@callbacks.route(CatalogPage, legacy="my_catalog")
+async def my_catalog(callback: CallbackQuery, callback_data: CatalogPage):
     user_id = callback.from_user.id
-    tracks = db.get_user_tracks(user_id)
-    if not tracks:
-        return await callback.message.edit_text("📭 В твоём каталоге пока нет треков.", reply_markup=main_menu())
-
-    kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"{t[4] or 'NoName'} — {t[3] or 'NoArtist'}", callback_data=f"play_{t[0]}")] for t in tracks
-    ])
-    kb.inline_keyboard.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")])
-    await callback.message.edit_text("🎧 Твои треки:", reply_markup=kb)
+    cursor = decode_track_key(callback_data.key) if callback_data.key else None
+    backward = callback_data.nav == "p"
+    rows = await db.page_user_tracks(user_id, cursor, backward, PAGE_SIZE)
+    if not rows and cursor:
+        # граничный трек удалён — начинаем сначала
+        cursor, backward = None, False
+        rows = await db.page_user_tracks(user_id, limit=PAGE_SIZE)
+    if not rows:
+        return callback.message.edit_text("📭 В твоём каталоге пока нет треков.", reply_markup=main_menu())
 
+    page = make_page(rows, cursor, backward)
+    kb = page_keyboard(
+        page,
+        lambda t: InlineKeyboardButton(text=f"{t.performer or 'NoArtist'} — {t.title or 'NoName'}",
+                                       callback_data=PlayTrack(track_id=t.id).pack()),
+        lambda direction, key: CatalogPage(nav=direction, key=key).pack(),
+        lambda t: encode_track_key(t.created_at, t.id),
+        footer=[[InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")]]
+    )
+    return callback.message.edit_text("🎧 Твои треки:", reply_markup=kb)
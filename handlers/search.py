@@ -0,0 +1,76 @@
+﻿# handlers/search.py
+from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import StatesGroup, State
+from aiogram.types import (Message, CallbackQuery, InlineQuery, InlineKeyboardMarkup, InlineKeyboardButton,
+                           InlineQueryResultCachedAudio)
+from config import SEARCH_CACHE_TIME
+from db_instance import db
+from keyboards import main_menu
+from utils.callbacks import callbacks, ArtistPage, PlayTrack
+
+router = Router(name=__name__)
+
+INLINE_PAGE_SIZE = 20  # Telegram принимает до 50 результатов за один ответ
+
+
+class SearchForm(StatesGroup):
+    waiting_for_query = State()
+
+
+def _track_label(t):
+    return f"{t.performer or 'NoName'} — {t.title or 'Без названия'}"
+
+
+async def _search(message: Message, query, user_id):
+    tracks = await db.search_tracks(query, user_id, limit=10)
+    artists = await db.search_artists(query, limit=5)
+    if not tracks and not artists:
+        return message.answer("🔍 Ничего не нашлось.",
+                              reply_markup=main_menu())
+
+    rows = [[InlineKeyboardButton(text=f"🎤 {a.name}", callback_data=ArtistPage(artist_id=a.id).pack())] for a in artists]
+    rows += [[InlineKeyboardButton(text=_track_label(t), callback_data=PlayTrack(track_id=t.id).pack())] for t in tracks]
+    # полный список с прокруткой — в инлайн-режиме, там результаты сразу можно отправить
+    rows.append([InlineKeyboardButton(text="🔎 Все результаты", switch_inline_query_current_chat=query)])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")])
+    return message.answer(f"🔍 Результаты по запросу «{query}»:",
+                          reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext):
+    if command.args:
+        return await _search(message, command.args.strip(), message.from_user.id)
+    await state.set_state(SearchForm.waiting_for_query)
+    return message.answer("🔍 Напиши название трека или имя артиста:")
+
+
+@callbacks.route("search")
+async def search_button(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(SearchForm.waiting_for_query)
+    return callback.message.answer("🔍 Напиши название трека или имя артиста:")
+
+
+@router.message(SearchForm.waiting_for_query, F.text)
+async def search_query(message: Message, state: FSMContext):
+    await state.clear()
+    return await _search(message, message.text.strip(), message.from_user.id)
+
+
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    # offset — сколько результатов уже отдано; Telegram присылает его обратно при прокрутке
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    tracks = await db.search_tracks(inline_query.query, inline_query.from_user.id, offset, INLINE_PAGE_SIZE)
+    results = [
+        InlineQueryResultCachedAudio(id=str(t.id), audio_file_id=t.file_id, caption=_track_label(t))
+        for t in tracks
+    ]
+    return inline_query.answer(
+        results,
+        cache_time=SEARCH_CACHE_TIME,
+        is_personal=True,  # в выдаче есть личные треки пользователя
+        next_offset=str(offset + len(tracks)) if len(tracks) == INLINE_PAGE_SIZE else "",
+    )
@@ -1,63 +1,71 @@
 ﻿# handlers/start.py
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ChatMemberUpdated
+from aiogram.filters import Command, ChatMemberUpdatedFilter, KICKED, MEMBER
 from keyboards import main_menu
 from db_instance import db
 from config import STORAGE_CHAT_ID
-import asyncio
+from utils.callbacks import callbacks, PlayTrack, ListenTrack, DeleteTrack, PublishTrack
+from utils.outbox import outbox
+from utils.analysis import analyzer
+from utils.storage_queue import archiver
 
 
-router = Router()
+router = Router(name=__name__)
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
-    db.add_user(message.from_user.id, message.from_user.full_name or message.from_user.first_name)
-    await message.answer(
-        f"👋 Привет, {message.from_user.first_name}!\nДобро пожаловать в GarageLib.\n\n📦 Версия бота: *{db.get_user(message.from_user.id) and 'v1.1' or 'v1.1'}*",
+    await db.add_user(message.from_user.id, message.from_user.full_name or message.from_user.first_name)
+    # метод возвращается, а не вызывается: в режиме вебхука он уйдёт прямо в ответе
+    return message.answer(
+        f"👋 Привет, {message.from_user.first_name}!\nДобро пожаловать в GarageLib.\n\n📦 Версия бота: *{await db.get_user(message.from_user.id) and 'v1.1' or 'v1.1'}*",
         reply_markup=main_menu(),
         parse_mode="Markdown"
     )
 
-@router.callback_query(F.data == "about_bot")
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=KICKED))
+async def bot_blocked(event: ChatMemberUpdated):
+    # пользователь заблокировал бота — не тратим на него лимит рассылок
+    await db.set_delivery_blocked(event.from_user.id, True)
+
+@router.my_chat_member(F.chat.type == "private", ChatMemberUpdatedFilter(member_status_changed=MEMBER))
+async def bot_unblocked(event: ChatMemberUpdated):
+    await db.set_delivery_blocked(event.from_user.id, False)
+
+@callbacks.route("about_bot")
 async def about_bot(callback: CallbackQuery):
     text = (
         "🤖 GarageLib Bot v1.2\n\n"
         "Бот для артистов: загружай демо, управляй личным каталогом и делись треками в общем плейлисте.\n\n"
-        "Функции:\n• Личный каталог\n• Общий плейлист с карточками артистов\n• Уведомления при добавлении трека в общий плейлист\n• Улучшенная версия изменения метаданных\n"
+        "Функции:\n• Личный каталог\n• Общий плейлист с карточками артистов\n• Уведомления при добавлении трека в общий плейлист\n• Поиск по трекам и артистам (/search или @бот в любом чате)\n• Подписки на артистов: уведомления только о тех, кто интересен\n• Улучшенная версия изменения метаданных\n"
     )
     try:
         await callback.message.edit_text(text, reply_markup=main_menu())
     except Exception:
         await callback.message.answer(text, reply_markup=main_menu())
 
-@router.callback_query(F.data == "back_main")
+@callbacks.route("back_main")
 async def back_main(callback: CallbackQuery):
     try:
         await callback.message.edit_text("🏠 Главное меню:", reply_markup=main_menu())
     except Exception:
         await callback.message.answer("🏠 Главное меню:", reply_markup=main_menu())
 
-@router.callback_query(F.data.startswith("play_"))
-async def play_track(callback: CallbackQuery):
-    try:
-        tid = int(callback.data.split("_", 1)[1])
-    except Exception:
-        await callback.answer("Неверный трек.", show_alert=True)
-        return
-
-    track = db.get_track(tid)
+@callbacks.route(PlayTrack, legacy="play")
+async def play_track(callback: CallbackQuery, callback_data: PlayTrack):
+    tid = callback_data.track_id
+    track = await db.get_track(tid)
     if not track:
         await callback.answer("⚠️ Трек не найден.", show_alert=True)
         return
 
-    title = track[3] or "Без названия"
-    performer = track[4] or "Неизвестен"
+    title = track.title or "Без названия"
+    performer = track.performer or "Неизвестен"
 
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🎧 Послушать", callback_data=f"listen_{tid}")],
-        [InlineKeyboardButton(text="🗑 Удалить", callback_data=f"delete_{tid}")],
-        [InlineKeyboardButton(text="🌍 Сделать общедоступным", callback_data=f"make_public_{tid}")],
+        [InlineKeyboardButton(text="🎧 Послушать", callback_data=ListenTrack(track_id=tid).pack())],
+        [InlineKeyboardButton(text="🗑 Удалить", callback_data=DeleteTrack(track_id=tid).pack())],
+        [InlineKeyboardButton(text="🌍 Сделать общедоступным", callback_data=PublishTrack(track_id=tid).pack())],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_main")]
     ])
 
@@ -68,147 +76,100 @@ async def play_track(callback: CallbackQuery):
         await callback.message.answer(text, reply_markup=kb)
 
 
-@router.callback_query(F.data.startswith("listen_"))
-async def listen_track(callback: CallbackQuery):
-    try:
-        tid = int(callback.data.split("_", 1)[1])
-    except Exception:
-        await callback.answer("Неверный трек.", show_alert=True)
-        return
-
-    track = db.get_track(tid)
+@callbacks.route(ListenTrack, legacy="listen")
+async def listen_track(callback: CallbackQuery, callback_data: ListenTrack):
+    track = await db.get_track(callback_data.track_id)
     if not track:
         await callback.answer("⚠️ Трек не найден.", show_alert=True)
         return
 
-    file_id = track[5]  # file_id в БД
-    title = track[3] or "Без названия"
-    performer = track[4] or "Неизвестен"
+    file_id = track.file_id
+    title = track.title or "Без названия"
+    performer = track.performer or "Неизвестен"
     try:
         await callback.message.answer_audio(audio=file_id, caption=f"{performer} — {title}")
     except Exception:
         await callback.answer("Не удалось отправить трек.", show_alert=True)
 
 
-@router.callback_query(F.data.startswith("delete_"))
-async def delete_track(callback: CallbackQuery, bot: Bot):
-    try:
-        tid = int(callback.data.split("_", 1)[1])
-    except Exception:
-        await callback.answer("Неверный трек.", show_alert=True)
-        return
-
-    track = db.get_track(tid)
+@callbacks.route(DeleteTrack, legacy="delete")
+async def delete_track(callback: CallbackQuery, bot: Bot, callback_data: DeleteTrack):
+    tid = callback_data.track_id
+    track = await db.get_track(tid)
     if not track:
         await callback.answer("⚠️ Трек не найден.", show_alert=True)
         return
 
-    owner_id = track[1]  # user_id владельца
-    if callback.from_user.id != owner_id:
+    if callback.from_user.id != track.user_id:
         await callback.answer("🚫 Ты не можешь удалить чужой трек.", show_alert=True)
         return
 
-    # Попытаться удалить из канала-хранилища (если есть message_id)
-    storage_msg_id = track[6]  # storage_message_id
+    # Удаляем запись из БД; сообщение в канале-хранилище удаляем, только если
+    # на это аудио больше не ссылается ни один трек
+    storage_msg_id = await db.delete_track(tid)
     if storage_msg_id:
         try:
             await bot.delete_message(chat_id=STORAGE_CHAT_ID, message_id=storage_msg_id)
         except Exception:
             pass
 
-    # Удаляем запись из БД
-    db.delete_track(tid)
-
     try:
         await callback.message.edit_text("🗑 Трек удалён.", reply_markup=main_menu())
     except Exception:
         await callback.message.answer("🗑 Трек удалён.", reply_markup=main_menu())
 
-@router.callback_query(F.data.startswith("make_public_"))
-async def make_public(callback: CallbackQuery, bot: Bot):
-    try:
-        tid = int(callback.data.split("_", 2)[2])
-    except Exception:
-        await callback.answer("Неверный трек.", show_alert=True)
-        return
-
-    track = db.get_track(tid)
+@callbacks.route(PublishTrack, legacy="make_public")
+async def make_public(callback: CallbackQuery, bot: Bot, callback_data: PublishTrack):
+    tid = callback_data.track_id
+    track = await db.get_track(tid)
     if not track:
         await callback.answer("⚠️ Трек не найден.", show_alert=True)
         return
 
     user_id = callback.from_user.id
-    file_id = track[5]
-    title = track[3] or "Без названия"
-    performer = track[4] or "Неизвестен"
+    file_id = track.file_id
+    title = track.title or "Без названия"
+    performer = track.performer or "Неизвестен"
+
+    # карточка выбрана на предыдущем шаге
+    if callback_data.artist_id is not None:
+        artist = await db.get_artist(callback_data.artist_id)
+        if not artist:
+            await callback.answer("Карточка не найдена.", show_alert=True)
+            return
+        await publish_track(bot, callback, tid, file_id, title, artist.name, artist.id, user_id, track.file_unique_id)
+        return
 
-    user_artists = db.get_user_artists(user_id)
+    user_artists = await db.get_user_artists(user_id)
     if not user_artists:
-        artist_id, artist_name = db.get_or_create_first_artist(user_id, performer)
-        chosen_artist_id = artist_id
-        chosen_artist_name = artist_name
+        await publish_track(bot, callback, tid, file_id, title, performer, None, user_id, track.file_unique_id,
+                            new_artist=True)
     elif len(user_artists) == 1:
-        chosen_artist_id = user_artists[0][0]
-        chosen_artist_name = user_artists[0][1]
+        await publish_track(bot, callback, tid, file_id, title, user_artists[0].name, user_artists[0].id, user_id,
+                            track.file_unique_id)
     else:
         kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=a[1], callback_data=f"make_public_choose_{tid}_{a[0]}")] for a in user_artists
+            [InlineKeyboardButton(text=a.name, callback_data=PublishTrack(track_id=tid, artist_id=a.id).pack())]
+            for a in user_artists
         ])
         kb.inline_keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="back_main")])
         await callback.message.answer("Выбери карточку артиста:", reply_markup=kb)
-        return
-
-    await publish_track(bot, callback, tid, file_id, title, chosen_artist_name, chosen_artist_id, user_id)
-
-@router.callback_query(F.data.startswith("make_public_choose_"))
-async def make_public_choose(callback: CallbackQuery, bot: Bot):
-    try:
-        _, _, tid, artist_id = callback.data.split("_")
-        tid = int(tid)
-        artist_id = int(artist_id)
-    except Exception:
-        await callback.answer("Ошибка выбора.", show_alert=True)
-        return
 
-    track = db.get_track(tid)
-    if not track:
-        await callback.answer("⚠️ Трек не найден.", show_alert=True)
-        return
-
-    artist = db.get_artist(artist_id)
-    if not artist:
-        await callback.answer("Карточка не найдена.", show_alert=True)
-        return
-
-    await publish_track(bot, callback, tid, track[5], track[3], artist[2], artist_id, callback.from_user.id)
-
-async def publish_track(bot, callback, tid, file_id, title, artist_name, artist_id, user_id):
-    from config import STORAGE_CHAT_ID
-
-    # Отправляем в хранилище
-    storage_msg_id = None
-    try:
-        sent = await bot.send_audio(chat_id=STORAGE_CHAT_ID, audio=file_id, caption=f"{artist_name} — {title}")
-        if hasattr(sent, "audio") and getattr(sent.audio, "file_id", None):
-            file_id = sent.audio.file_id
-        storage_msg_id = sent.message_id
-    except Exception as e:
-        print(f"[make_public storage error] {e}")
-
-    # Сохраняем в БД как общий трек
-    db.add_common_track(user_id=user_id, file_id=file_id, title=title,
-                        performer=artist_name, artist_id=artist_id, storage_message_id=storage_msg_id)
-
-    # Рассылка уведомлений
-    users = db.get_all_users()
-    note = f"🎵 {artist_name} выложил новый трек: «{title}»"
-    for uid in users:
-        if uid == user_id:
-            continue
-        try:
-            await bot.send_message(uid, note)
-            await asyncio.sleep(0.03)
-        except Exception:
-            pass
+async def publish_track(bot, callback, tid, file_id, title, artist_name, artist_id, user_id, file_unique_id=None,
+                        new_artist=False):
+    # Сохраняем в БД как общий трек. Аудио с известным file_unique_id уже лежит
+    # в хранилище и повторно не загружается; иначе его перешлёт фоновый архиватор.
+    # new_artist — первая карточка пользователя с именем artist_name создаётся в той же транзакции
+    async with db.transaction():
+        if new_artist:
+            artist_id, artist_name = await db.get_or_create_first_artist(user_id, artist_name)
+        track_id = await db.add_common_track(user_id=user_id, file_id=file_id, title=title,
+                                             performer=artist_name, artist_id=artist_id,
+                                             file_unique_id=file_unique_id)
+    archiver.enqueue_track(track_id, file_unique_id, file_id, f"{artist_name} — {title}")
+    analyzer.enqueue_track(track_id, file_unique_id, file_id)
+
+    # Уведомления разошлёт фоновый воркер outbox
+    outbox.wake()
 
     await callback.message.answer(f"✅ Трек «{title}» опубликован от имени {artist_name}!", reply_markup=main_menu())
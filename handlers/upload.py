@@ -1,14 +1,17 @@
-﻿from aiogram import Router, F, Bot
+﻿from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from keyboards import track_save_menu, main_menu
-from config import STORAGE_CHAT_ID
+from keyboards import track_save_menu, album_save_menu, main_menu
 from db_instance import db
-import asyncio
-from utils.notify import broadcast
+from utils.albums import albums
+from utils.callbacks import callbacks, UploadArtist
+from utils.outbox import outbox
+from utils.analysis import analyzer
+from utils.storage_queue import archiver
+from utils.scheduler import scheduler
 
-router = Router()
+router = Router(name=__name__)
 
 
 class UploadForm(StatesGroup):
@@ -28,26 +31,64 @@ async def safe_edit_or_answer(message_obj, text, reply_markup=None, parse_mode=N
 
 
 # === Шаг 1. Пользователь нажал “Добавить трек” ===
-@router.callback_query(F.data == "add_track")
+@callbacks.route("add_track")
 async def add_track_menu(callback: CallbackQuery, state: FSMContext):
-    db.add_user(callback.from_user.id, callback.from_user.full_name or callback.from_user.first_name)
+    await db.add_user(callback.from_user.id, callback.from_user.full_name or callback.from_user.first_name)
     await callback.message.answer("🎵 Отправь мне аудиофайл (mp3/ogg), чтобы добавить его.")
     await state.clear()
     await state.set_state(UploadForm.waiting_for_audio)
 
 
+# === Шаг 2а. Пользователь отправил альбом — собираем его целиком ===
+@router.message(F.audio, F.media_group_id)
+async def on_album_audio(message: Message, state: FSMContext):
+    # метка сотрётся, если следующий апдейт пользователя начнёт другой сценарий (новый трек, отмена)
+    await state.update_data(album_pending=message.media_group_id)
+    albums.add(message, lambda messages: offer_album(messages, state))
+
+
+async def offer_album(messages, state: FSMContext):
+    """Вызывается из фоновой задачи сборщика — в очереди пользователя, как его апдейты."""
+    first = messages[0]
+    async with scheduler.user_turn(first.from_user.id):
+        if (await state.get_data()).get("album_pending") != first.media_group_id:
+            return  # пользователь уже занят другим — альбом не перезаписывает его данные
+        await _offer_album(messages, state)
+
+
+async def _offer_album(messages, state: FSMContext):
+    first = messages[0]
+    fallback = first.from_user.full_name or first.from_user.first_name
+    await db.add_user(first.from_user.id, fallback)
+
+    album = [{
+        "file_id": m.audio.file_id,
+        "file_unique_id": m.audio.file_unique_id,
+        "title": m.audio.title or "Без названия",
+        "performer": m.audio.performer or fallback,
+    } for m in messages]
+    # альбом заменяет данные брошенной загрузки одного трека (file_id, title, pending_save)
+    await state.set_data({"album": album})
+    lines = "\n".join(f"{i}. {t['performer']} — {t['title']}" for i, t in enumerate(album, 1))
+    await first.answer(f"💿 Альбом из {len(album)} треков:\n{lines}\n\nКуда сохранить?",
+                       reply_markup=album_save_menu())
+    await state.set_state(UploadForm.waiting_for_meta_edit)
+
+
 # === Шаг 2. Пользователь отправил аудиофайл ===
 @router.message(F.audio)
 async def on_audio(message: Message, state: FSMContext):
     audio = message.audio
     user_id = message.from_user.id
 
-    db.add_user(user_id, message.from_user.full_name or message.from_user.first_name)
+    await db.add_user(user_id, message.from_user.full_name or message.from_user.first_name)
 
     title = audio.title or "Без названия"
     performer = audio.performer or (message.from_user.full_name or message.from_user.first_name)
 
-    await state.update_data(file_id=audio.file_id, title=title, performer=performer)
+    # новый трек заменяет всё, что осталось от брошенной загрузки: альбом, pending_save
+    await state.set_data({"file_id": audio.file_id, "file_unique_id": audio.file_unique_id,
+                          "title": title, "performer": performer})
     await message.answer(
         f"📀 Трек: *{title}*\nИсполнитель: *{performer}*\n\nКуда сохранить?",
         reply_markup=track_save_menu(),
@@ -57,57 +98,73 @@ async def on_audio(message: Message, state: FSMContext):
 
 
 # === Отмена ===
-@router.callback_query(F.data == "cancel_upload")
+@callbacks.route("cancel_upload")
 async def cancel_upload(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await safe_edit_or_answer(callback.message, "❌ Отменено. Возвращаю в главное меню.", reply_markup=main_menu())
 
 
+async def save_album(callback: CallbackQuery, state: FSMContext, album, artist_id=None, artist_name=None,
+                     new_artist=False):
+    """
+    Альбом — одной транзакцией; с artist_id — в общий плейлист одним релизом с одним уведомлением.
+    new_artist — сначала создать первую карточку пользователя с именем artist_name (в той же транзакции).
+    """
+    async with db.transaction():
+        if new_artist:
+            artist_id, artist_name = await db.get_or_create_first_artist(callback.from_user.id, artist_name)
+        tracks = [(t["file_id"], t["title"], artist_name or t["performer"], t["file_unique_id"]) for t in album]
+        track_ids = await db.add_album(callback.from_user.id, tracks, artist_id)
+    archiver.enqueue_album([(tid, uid, file_id, f"{performer} — {title}")
+                            for tid, (file_id, title, performer, uid) in zip(track_ids, tracks)])
+    for tid, (file_id, _, _, uid) in zip(track_ids, tracks):
+        analyzer.enqueue_track(tid, uid, file_id)
+    if artist_id is None:
+        text = f"✅ Альбом из {len(tracks)} треков сохранён в личном каталоге."
+    else:
+        outbox.wake()
+        text = f"🌍 Альбом из {len(tracks)} треков добавлен в общий плейлист от «{artist_name}»."
+    await safe_edit_or_answer(callback.message, text, reply_markup=main_menu())
+    await state.clear()
+
+
 # === Шаг 3. Сохранение трека ===
-@router.callback_query(F.data.in_(["save_personal", "save_common"]))
-async def save_track(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callbacks.route("save_personal")
+@callbacks.route("save_common")
+async def save_track(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     file_id = data.get("file_id")
+    file_unique_id = data.get("file_unique_id")
     title = data.get("title") or "Без названия"
     performer = data.get("performer") or (callback.from_user.full_name or callback.from_user.first_name)
+    album = data.get("album")
     user_id = callback.from_user.id
 
-    if not file_id:
+    if not file_id and not album:
         await safe_edit_or_answer(callback.message, "⚠️ Ошибка: файл не найден в сессии.", reply_markup=main_menu())
         await state.clear()
         return
 
     # === Сохранение в личный каталог ===
     if callback.data == "save_personal":
-        storage_msg_id = None
-        saved_file_id = file_id
-        try:
-            sent = await bot.send_audio(chat_id=STORAGE_CHAT_ID, audio=file_id, caption=f"{performer} — {title}")
-            if hasattr(sent, "audio") and getattr(sent.audio, "file_id", None):
-                saved_file_id = sent.audio.file_id
-            storage_msg_id = sent.message_id
-        except Exception as e:
-            print(f"[storage send error personal] {e}")
-
-        db.add_user_track(user_id=user_id, file_id=saved_file_id, title=title, performer=performer,
-                          artist_id=None, storage_message_id=storage_msg_id)
+        if album:
+            await save_album(callback, state, album)
+            return
+        # в канал-хранилище трек перешлёт фоновый архиватор
+        track_id = await db.add_user_track(user_id=user_id, file_id=file_id, title=title, performer=performer,
+                                           artist_id=None, file_unique_id=file_unique_id)
+        archiver.enqueue_track(track_id, file_unique_id, file_id, f"{performer} — {title}")
+        analyzer.enqueue_track(track_id, file_unique_id, file_id)
 
         await safe_edit_or_answer(callback.message, f"✅ Трек «{title}» сохранён в личном каталоге.", reply_markup=main_menu())
         await state.clear()
         return
 
     # === Сохранение в общий плейлист ===
-    user_artists = db.get_user_artists(user_id)
-    if not user_artists:
-        artist_id, artist_name = db.get_or_create_first_artist(user_id, performer)
-        chosen_artist_id = artist_id
-        chosen_artist_name = artist_name
-    elif len(user_artists) == 1:
-        chosen_artist_id = user_artists[0][0]
-        chosen_artist_name = user_artists[0][1]
-    else:
+    user_artists = await db.get_user_artists(user_id)
+    if len(user_artists) > 1:
         kb = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=a[1], callback_data=f"choose_artist_{a[0]}")] for a in user_artists
+            [InlineKeyboardButton(text=a.name, callback_data=UploadArtist(artist_id=a.id).pack())] for a in user_artists
         ])
         kb.inline_keyboard.append([InlineKeyboardButton(text="➕ Создать новую", callback_data="create_artist_card")])
         kb.inline_keyboard.append([InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_upload")])
@@ -115,31 +172,27 @@ async def save_track(callback: CallbackQuery, state: FSMContext, bot: Bot):
         await state.update_data(pending_save="save_common")
         return
 
-    storage_msg_id = None
-    saved_file_id = file_id
-    try:
-        sent = await bot.send_audio(chat_id=STORAGE_CHAT_ID, audio=file_id, caption=f"{chosen_artist_name} — {title}")
-        if hasattr(sent, "audio") and getattr(sent.audio, "file_id", None):
-            saved_file_id = sent.audio.file_id
-        storage_msg_id = sent.message_id
-    except Exception as e:
-        print(f"[storage send error common] {e}")
-
-    db.add_common_track(user_id=user_id, file_id=saved_file_id, title=title, performer=chosen_artist_name,
-                        artist_id=chosen_artist_id, storage_message_id=storage_msg_id)
-
-    # Рассылка уведомлений
-    users = db.get_all_users()
-    note = f"🎵 {chosen_artist_name} выложил новый трек: «{title}»"
-
-
-    # исключаем загрузившего
-    failed = await broadcast(bot, users, note, parse_mode="Markdown", exclude={user_id}, delay=0.05)
+    if album:
+        if user_artists:
+            await save_album(callback, state, album, user_artists[0].id, user_artists[0].name)
+        else:
+            await save_album(callback, state, album, artist_name=performer, new_artist=True)
+        return
 
-    # лог — кто не получил (можно потом удалить этих юзеров из БД или пометить)
-    if failed:
-        logger = __import__("logging").getLogger(__name__)
-        logger.info("Failed sends on publish: %s", failed)
+    # новая карточка и трек фиксируются вместе: если вставка трека упадёт, пустой карточки не останется
+    async with db.transaction():
+        if user_artists:
+            chosen_artist_id, chosen_artist_name = user_artists[0].id, user_artists[0].name
+        else:
+            chosen_artist_id, chosen_artist_name = await db.get_or_create_first_artist(user_id, performer)
+        track_id = await db.add_common_track(user_id=user_id, file_id=file_id, title=title,
+                                             performer=chosen_artist_name, artist_id=chosen_artist_id,
+                                             file_unique_id=file_unique_id)
+    archiver.enqueue_track(track_id, file_unique_id, file_id, f"{chosen_artist_name} — {title}")
+    analyzer.enqueue_track(track_id, file_unique_id, file_id)
+
+    # Уведомления разошлёт фоновый воркер outbox
+    outbox.wake()
 
     await safe_edit_or_answer(callback.message, f"🌍 Трек «{title}» добавлен в общий плейлист от «{chosen_artist_name}».",
                               reply_markup=main_menu())
@@ -147,13 +200,9 @@ async def save_track(callback: CallbackQuery, state: FSMContext, bot: Bot):
 
 
 # === Выбор артиста (если у пользователя несколько карточек) ===
-@router.callback_query(F.data.startswith("choose_artist_"))
-async def choose_artist(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    try:
-        artist_id = int(callback.data.split("_", 2)[2])
-    except Exception:
-        await callback.answer("Неверный выбор.", show_alert=True)
-        return
+@callbacks.route(UploadArtist)
+async def choose_artist(callback: CallbackQuery, state: FSMContext, callback_data: UploadArtist):
+    artist_id = callback_data.artist_id
 
     data = await state.get_data()
     pending = data.get("pending_save")
@@ -162,39 +211,27 @@ async def choose_artist(callback: CallbackQuery, state: FSMContext, bot: Bot):
         return
 
     file_id = data.get("file_id")
+    file_unique_id = data.get("file_unique_id")
     title = data.get("title") or "Без названия"
     user_id = callback.from_user.id
 
-    artist = db.get_artist(artist_id)
+    artist = await db.get_artist(artist_id)
     if not artist:
         await callback.answer("Карточка не найдена.", show_alert=True)
         await state.clear()
         return
 
-    artist_name = artist[2]
-    storage_msg_id = None
-    saved_file_id = file_id
-    try:
-        sent = await bot.send_audio(chat_id=STORAGE_CHAT_ID, audio=file_id, caption=f"{artist_name} — {title}")
-        if hasattr(sent, "audio") and getattr(sent.audio, "file_id", None):
-            saved_file_id = sent.audio.file_id
-        storage_msg_id = sent.message_id
-    except Exception as e:
-        print(f"[storage send error choose_artist] {e}")
-
-    db.add_common_track(user_id=user_id, file_id=saved_file_id, title=title, performer=artist_name,
-                        artist_id=artist_id, storage_message_id=storage_msg_id)
-
-    users = db.get_all_users()
-    note = f"🎵 {artist_name} выложил новый трек: «{title}»"
-    for uid in users:
-        if uid == user_id:
-            continue
-        try:
-            await bot.send_message(uid, note)
-            await asyncio.sleep(0.03)
-        except Exception:
-            pass
+    artist_name = artist.name
+    if data.get("album"):
+        await save_album(callback, state, data["album"], artist_id, artist_name)
+        return
+
+    track_id = await db.add_common_track(user_id=user_id, file_id=file_id, title=title, performer=artist_name,
+                                         artist_id=artist_id, file_unique_id=file_unique_id)
+    archiver.enqueue_track(track_id, file_unique_id, file_id, f"{artist_name} — {title}")
+    analyzer.enqueue_track(track_id, file_unique_id, file_id)
+
+    outbox.wake()
 
     await callback.message.answer(f"🌍 Трек «{title}» добавлен в общий плейлист от «{artist_name}».", reply_markup=main_menu())
     await state.clear()
@@ -1,15 +1,44 @@
 ﻿# keyboards.py
+from functools import cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.cache import TTLCache, MISSING
+from utils.callbacks import CatalogPage, ArtistsPage, SubsPage
 
+# готовые клавиатуры для меню, зависящих от данных; ключ включает версию каталога,
+# так что устаревшие варианты просто вытесняются из LRU
+_markups = TTLCache(maxsize=512, ttl=3600)
+
+
+async def cached_markup(key, build):
+    """
+    Возвращает закешированный результат build() по ключу key.
+    Разметка из кеша общая для всех вызовов — её нельзя изменять после получения.
+    """
+    value = _markups.get(key)
+    if value is MISSING:
+        value = await build()
+        _markups.set(key, value)
+    return value
+
+
+def markup_cache_stats():
+    return _markups.stats()
+
+
+# статические меню собираются один раз
+@cache
 def main_menu():
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🎧 Мой каталог", callback_data="my_catalog")],
-        [InlineKeyboardButton(text="🌍 Общий плейлист", callback_data="common_playlist")],
+        [InlineKeyboardButton(text="🎧 Мой каталог", callback_data=CatalogPage().pack())],
+        [InlineKeyboardButton(text="🌍 Общий плейлист", callback_data=ArtistsPage().pack())],
         [InlineKeyboardButton(text="🎤 Мои карточки артиста", callback_data="my_artist")],
+        [InlineKeyboardButton(text="🔍 Поиск", callback_data="search")],
+        [InlineKeyboardButton(text="🔔 Подписки", callback_data=SubsPage().pack())],
         [InlineKeyboardButton(text="➕ Добавить трек", callback_data="add_track")],
         [InlineKeyboardButton(text="ℹ️ О боте", callback_data="about_bot")]
     ])
 
+@cache
 def track_save_menu():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✏️ Изменить метаданные", callback_data="edit_metadata")],
@@ -17,3 +46,11 @@ def track_save_menu():
         [InlineKeyboardButton(text="🌍 Общий плейлист", callback_data="save_common")],
         [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_upload")]
     ])
+
+@cache
+def album_save_menu():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💾 Личный каталог", callback_data="save_personal")],
+        [InlineKeyboardButton(text="🌍 Общий плейлист", callback_data="save_common")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_upload")]
+    ])
@@ -0,0 +1,389 @@
+# migrations.py
+"""
+Версионированные миграции схемы.
+Каждая миграция — функция с номером, выполняется ровно один раз в своей транзакции.
+Текущая версия схемы хранится в bot_meta под ключом 'schema_version'.
+"""
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_KEY = "schema_version"
+
+MIGRATIONS = []
+
+
+def search_key(text):
+    """Ключ для поиска по префиксу: casefold понимает и кириллицу, в отличие от lower() в SQLite."""
+    return text.casefold() if text else None
+
+
+def migration(version, description):
+    """Регистрирует функцию fn(conn) как миграцию с номером version."""
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def _columns(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def get_schema_version(conn):
+    try:
+        row = conn.execute("SELECT value FROM bot_meta WHERE key = ?", (SCHEMA_VERSION_KEY,)).fetchone()
+    except sqlite3.OperationalError:
+        # bot_meta ещё нет — совсем новая база
+        return 0
+    return int(row[0]) if row else 0
+
+
+def migrate(conn):
+    """Применяет все миграции новее текущей версии. Возвращает итоговую версию."""
+    current = get_schema_version(conn)
+    pending = [m for m in MIGRATIONS if m[0] > current]
+    if not pending:
+        return current
+
+    for version, description, fn in pending:
+        # IMMEDIATE и повторная проверка: процессы, стартующие одновременно, не применят миграцию дважды
+        conn.execute("BEGIN IMMEDIATE")
+        if get_schema_version(conn) >= version:
+            conn.rollback()
+            current = version
+            continue
+        logger.info("Применяю миграцию %s: %s", version, description)
+        try:
+            fn(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO bot_meta (key, value) VALUES (?, ?)",
+                (SCHEMA_VERSION_KEY, str(version))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
+
+
+@migration(1, "базовая схема")
+def _initial_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE,
+            name TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS artists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tracks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            artist_id INTEGER,
+            title TEXT,
+            performer TEXT,
+            file_id TEXT,
+            storage_message_id INTEGER,
+            is_common INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sent_updates (
+            version TEXT PRIMARY KEY
+        )
+    ''')
+
+    # старые базы создавались без этих колонок
+    cols = _columns(conn, "tracks")
+    if "artist_id" not in cols:
+        conn.execute("ALTER TABLE tracks ADD COLUMN artist_id INTEGER")
+    if "storage_message_id" not in cols:
+        conn.execute("ALTER TABLE tracks ADD COLUMN storage_message_id INTEGER")
+
+
+@migration(2, "индексы под запросы каталога и артистов")
+def _browse_indexes(conn):
+    # get_user_tracks: WHERE user_id = ? ORDER BY created_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_user_created ON tracks (user_id, created_at)")
+    # get_common_tracks: WHERE is_common = 1 ORDER BY created_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_common_created ON tracks (is_common, created_at)")
+    # get_artist_common_tracks: WHERE artist_id = ? AND is_common = 1 ORDER BY created_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_artist_common_created ON tracks (artist_id, is_common, created_at)")
+    # get_user_artists: WHERE user_id = ?
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_artists_user ON artists (user_id)")
+    # get_all_artists: ORDER BY name
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_artists_name ON artists (name)")
+
+
+@migration(3, "outbox уведомлений")
+def _outbox(conn):
+    # cursor — telegram_id последнего получателя, которому событие уже разослано
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            cursor INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            done_at TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (status, id)")
+
+
+@migration(4, "хранилище состояний FSM")
+def _fsm_state(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS fsm_state (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state (updated_at)")
+
+
+@migration(5, "состояние архивации трека в канале-хранилище")
+def _storage_state(conn):
+    cols = _columns(conn, "tracks")
+    if "storage_state" not in cols:
+        conn.execute("ALTER TABLE tracks ADD COLUMN storage_state TEXT DEFAULT 'pending'")
+    if "storage_attempts" not in cols:
+        conn.execute("ALTER TABLE tracks ADD COLUMN storage_attempts INTEGER DEFAULT 0")
+    # раньше неудачная отправка просто оставляла storage_message_id пустым — такие треки дозаархивируем
+    conn.execute("""
+        UPDATE tracks SET storage_state = CASE WHEN storage_message_id IS NULL THEN 'pending' ELSE 'stored' END
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_storage_pending ON tracks (id) WHERE storage_state = 'pending'")
+
+
+@migration(6, "объекты хранилища с дедупликацией по file_unique_id")
+def _storage_objects(conn):
+    # одно сообщение в канале-хранилище на уникальное аудио; refcount — число ссылающихся треков
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS storage_objects (
+            file_unique_id TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            storage_message_id INTEGER,
+            state TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_storage_objects_pending ON storage_objects (file_unique_id) "
+                 "WHERE state = 'pending'")
+    if "file_unique_id" not in _columns(conn, "tracks"):
+        conn.execute("ALTER TABLE tracks ADD COLUMN file_unique_id TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_file_unique ON tracks (file_unique_id)")
+
+
+@migration(7, "полнотекстовый поиск по трекам и артистам")
+def _search_index(conn):
+    # триграммы дают поиск по подстроке (а значит, и по префиксу) в любом месте названия;
+    # индексы внешние: текст хранится только в tracks/artists, FTS держит лишь токены
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5(
+            title, performer, content='tracks', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS artists_fts USING fts5(
+            name, content='artists', content_rowid='id', tokenize='trigram'
+        )
+    """)
+    triggers = [
+        """CREATE TRIGGER IF NOT EXISTS tracks_fts_ai AFTER INSERT ON tracks BEGIN
+            INSERT INTO tracks_fts (rowid, title, performer) VALUES (new.id, new.title, new.performer);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS tracks_fts_ad AFTER DELETE ON tracks BEGIN
+            INSERT INTO tracks_fts (tracks_fts, rowid, title, performer)
+            VALUES ('delete', old.id, old.title, old.performer);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS tracks_fts_au AFTER UPDATE OF title, performer ON tracks BEGIN
+            INSERT INTO tracks_fts (tracks_fts, rowid, title, performer)
+            VALUES ('delete', old.id, old.title, old.performer);
+            INSERT INTO tracks_fts (rowid, title, performer) VALUES (new.id, new.title, new.performer);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS artists_fts_ai AFTER INSERT ON artists BEGIN
+            INSERT INTO artists_fts (rowid, name) VALUES (new.id, new.name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS artists_fts_ad AFTER DELETE ON artists BEGIN
+            INSERT INTO artists_fts (artists_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS artists_fts_au AFTER UPDATE OF name ON artists BEGIN
+            INSERT INTO artists_fts (artists_fts, rowid, name) VALUES ('delete', old.id, old.name);
+            INSERT INTO artists_fts (rowid, name) VALUES (new.id, new.name);
+        END""",
+    ]
+    # executescript закоммитил бы транзакцию миграции, поэтому по одному
+    for sql in triggers:
+        conn.execute(sql)
+    # проиндексировать уже существующие строки
+    conn.execute("INSERT INTO tracks_fts (tracks_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO artists_fts (artists_fts) VALUES ('rebuild')")
+
+
+@migration(8, "подписки на артистов")
+def _follows(conn):
+    # первичный ключ (artist_id, user_id) — для рассылки подписчикам артиста,
+    # обратный индекс — для списка подписок пользователя
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS follows (
+            artist_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (artist_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_follows_user ON follows (user_id, artist_id)")
+    if "follow_all" not in _columns(conn, "users"):
+        conn.execute("ALTER TABLE users ADD COLUMN follow_all INTEGER NOT NULL DEFAULT 0")
+        # до подписок новинки получали все — уже зарегистрированные пользователи их и получают дальше
+        conn.execute("UPDATE users SET follow_all = 1")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_follow_all ON users (telegram_id) WHERE follow_all = 1")
+
+
+@migration(9, "состояние доставки сообщений пользователям")
+def _delivery_state(conn):
+    # delivery_state: active — доставляем, blocked — бот заблокирован или аккаунт удалён,
+    # unreachable — подряд failure_count постоянных ошибок (чат не найден и т.п.)
+    columns = _columns(conn, "users")
+    if "delivery_state" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN delivery_state TEXT NOT NULL DEFAULT 'active'")
+    if "failure_count" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN failure_count INTEGER NOT NULL DEFAULT 0")
+    if "last_failure_at" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN last_failure_at TIMESTAMP")
+    if "last_failure_error" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN last_failure_error TEXT")
+    # обходы получателей идут только по тем, кому можно доставить
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_deliverable ON users (telegram_id) "
+                 "WHERE delivery_state = 'active'")
+    conn.execute("DROP INDEX IF EXISTS idx_users_follow_all")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_follow_all ON users (telegram_id) "
+                 "WHERE follow_all = 1 AND delivery_state = 'active'")
+
+
+@migration(10, "рассылки-кампании с сохраняемым прогрессом")
+def _campaigns(conn):
+    # cursor — telegram_id, до которого (включительно) все получатели обработаны;
+    # upper_bound — наибольший telegram_id на момент создания: зарегистрировавшимся позже кампания не идёт
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL UNIQUE,
+            text TEXT NOT NULL,
+            parse_mode TEXT,
+            status TEXT NOT NULL DEFAULT 'running',
+            cursor INTEGER NOT NULL DEFAULT 0,
+            upper_bound INTEGER,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    # уже разосланные объявления о версиях — завершённые кампании, чтобы не повторить их
+    conn.execute('''
+        INSERT OR IGNORE INTO campaigns (key, text, status, finished_at)
+        SELECT 'version:' || version, '', 'done', CURRENT_TIMESTAMP FROM sent_updates
+    ''')
+
+
+@migration(11, "счётчик изменений каталога для нескольких процессов")
+def _catalog_epoch(conn):
+    # каждый процесс держит свои кеши треков и артистов; по этому счётчику
+    # он узнаёт, что каталог поменял другой процесс
+    conn.execute("INSERT OR IGNORE INTO bot_meta (key, value) VALUES ('catalog_epoch', '0')")
+    bump = "UPDATE bot_meta SET value = value + 1 WHERE key = 'catalog_epoch';"
+    # file_id в списке нет: архивация меняет его у каждого трека, и обход хранилища сбрасывал бы
+    # все кеши всех процессов на каждом треке; прежний file_id остаётся рабочим, а запись
+    # в кеше другого процесса устареет по TTL
+    events = {
+        "artists_epoch_ai": "AFTER INSERT ON artists",
+        "artists_epoch_ad": "AFTER DELETE ON artists",
+        "artists_epoch_au": "AFTER UPDATE ON artists",
+        "tracks_epoch_ai": "AFTER INSERT ON tracks",
+        "tracks_epoch_ad": "AFTER DELETE ON tracks",
+        "tracks_epoch_au": "AFTER UPDATE OF title, performer, artist_id, is_common ON tracks",
+    }
+    for name, event in events.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {bump} END")
+
+
+@migration(12, "результаты анализа аудио и акустические отпечатки")
+def _audio_analysis(conn):
+    cols = _columns(conn, "tracks")
+    for name, kind in (("audio_format", "TEXT"), ("duration", "REAL"), ("bitrate", "INTEGER"),
+                       ("sample_rate", "INTEGER"), ("channels", "INTEGER"), ("loudness", "REAL"),
+                       ("tag_title", "TEXT"), ("tag_artist", "TEXT"), ("tag_album", "TEXT"),
+                       ("fingerprint", "BLOB"), ("duplicate_of", "INTEGER"),
+                       ("analysis_state", "TEXT DEFAULT 'pending'"), ("analysis_attempts", "INTEGER NOT NULL DEFAULT 0")):
+        if name not in cols:
+            conn.execute(f"ALTER TABLE tracks ADD COLUMN {name} {kind}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_analysis_pending ON tracks (id) "
+                 "WHERE analysis_state = 'pending'")
+    # кандидаты в почти-дубликаты ищутся среди треков близкой длительности с отпечатком
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_fingerprint_duration ON tracks (duration) "
+                 "WHERE fingerprint IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tracks_duplicates ON tracks (id) WHERE duplicate_of IS NOT NULL")
+
+
+@migration(13, "ключи поиска по префиксу для коротких запросов")
+def _search_keys(conn):
+    # триграммный индекс не ищет запросы короче 3 символов; для них — диапазон по индексу
+    # на приведённом к одному регистру названии (заполняет Database при вставке)
+    for table, names in (("tracks", ("title", "performer")), ("artists", ("name",))):
+        cols = _columns(conn, table)
+        for name in names:
+            if f"{name}_key" not in cols:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name}_key TEXT")
+        rows = conn.execute(f"SELECT id, {', '.join(names)} FROM {table}").fetchall()
+        assignments = ", ".join(f"{name}_key = ?" for name in names)
+        conn.executemany(f"UPDATE {table} SET {assignments} WHERE id = ?",
+                         ((*map(search_key, values), row_id) for row_id, *values in rows))
+        for name in names:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{name}_key ON {table} ({name}_key)")
+
+
+@migration(14, "счётчик изменений доставки для нескольких процессов")
+def _delivery_epoch(conn):
+    # кеш доступных для рассылок пользователей (AsyncDatabase.reachable_users) у каждого процесса
+    # свой, а блокировки пишут и рассылки других процессов; по этому счётчику кеш сбрасывается
+    conn.execute("INSERT OR IGNORE INTO bot_meta (key, value) VALUES ('delivery_epoch', '0')")
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_delivery_epoch_au AFTER UPDATE OF delivery_state, failure_count ON users
+        WHEN OLD.delivery_state IS NOT NEW.delivery_state OR OLD.failure_count IS NOT NEW.failure_count
+        BEGIN UPDATE bot_meta SET value = value + 1 WHERE key = 'delivery_epoch'; END
+    """)
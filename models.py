@@ -0,0 +1,75 @@
+# models.py
+"""
+Строки, которые Database отдаёт хендлерам: dataclass со __slots__ вместо
+кортежей — поля по именам, без словаря атрибутов на каждый объект.
+Каждая модель — своя проекция таблицы: запрос выбирает ровно columns(модель)
+и ничего лишнего (ни file_id в списках, ни отпечаток аудио в карточке трека).
+Объекты из кешей AsyncDatabase общие для всех хендлеров — их не изменяют.
+"""
+from dataclasses import dataclass, fields
+from functools import cache
+from typing import Optional
+
+
+@cache
+def columns(model, alias=None):
+    """Список колонок модели для SELECT: "id, title" или с псевдонимом таблицы "t.id, t.title"."""
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(prefix + f.name for f in fields(model))
+
+
+@dataclass(slots=True)
+class User:
+    id: int
+    telegram_id: int
+    name: Optional[str]
+    follow_all: int
+    delivery_state: str
+
+
+@dataclass(slots=True)
+class Artist:
+    id: int
+    user_id: int
+    name: str
+
+
+@dataclass(slots=True)
+class TrackListItem:
+    """Строка списка треков (каталог, страница артиста): created_at нужен для курсора страниц."""
+    id: int
+    title: Optional[str]
+    performer: Optional[str]
+    created_at: str
+
+
+@dataclass(slots=True)
+class TrackPlayback:
+    """Трек для прослушивания, удаления и публикации."""
+    id: int
+    user_id: int
+    artist_id: Optional[int]
+    title: Optional[str]
+    performer: Optional[str]
+    file_id: str
+    file_unique_id: Optional[str]
+
+
+@dataclass(slots=True)
+class Track(TrackPlayback):
+    """Полная запись трека: хранилище и результат анализа аудио (без отпечатка)."""
+    is_common: int
+    created_at: str
+    storage_message_id: Optional[int]
+    storage_state: Optional[str]
+    audio_format: Optional[str]
+    duration: Optional[float]
+    bitrate: Optional[int]
+    sample_rate: Optional[int]
+    channels: Optional[int]
+    loudness: Optional[float]
+    tag_title: Optional[str]
+    tag_artist: Optional[str]
+    tag_album: Optional[str]
+    duplicate_of: Optional[int]
+    analysis_state: Optional[str]
@@ -0,0 +1,118 @@
+# tests/test_audio_probe.py
+import struct
+import unittest
+
+from utils.audio import probe
+
+
+def id3v2(**frames):
+    """Тег ID3v2.3 с текстовыми кадрами в UTF-8."""
+    body = b""
+    for frame_id, value in frames.items():
+        text = b"\x03" + value.encode()
+        body += frame_id.encode() + struct.pack(">I", len(text)) + b"\x00\x00" + text
+    size = len(body)
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + synchsafe + body
+
+
+# MPEG-1 Layer III, 128 кбит/с, 44.1 кГц, joint stereo: кадр 144 * 128000 / 44100 = 417 байт
+MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+
+
+def vorbis_comments(**fields):
+    vendor = b"test"
+    items = [f"{key.upper()}={value}".encode() for key, value in fields.items()]
+    return (struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(items))
+            + b"".join(struct.pack("<I", len(item)) + item for item in items))
+
+
+def ogg_page(packets, granule, sequence):
+    table = b""
+    for packet in packets:
+        table += b"\xff" * (len(packet) // 255) + bytes([len(packet) % 255])
+    return (b"OggS\x00\x00" + struct.pack("<qII", granule, 1, sequence) + bytes(4)
+            + bytes([len(table)]) + table + b"".join(packets))
+
+
+def atom(kind, *children):
+    body = b"".join(children)
+    return struct.pack(">I4s", 8 + len(body), kind) + body
+
+
+class ProbeTest(unittest.TestCase):
+    """Разбор контейнеров на маленьких собранных вручную файлах."""
+
+    def test_mp3_constant_bitrate_with_id3v2(self):
+        data = id3v2(TIT2="Песня", TPE1="Артист") + MP3_FRAME * 100
+        info = probe(data)
+        self.assertEqual((info["format"], info["sample_rate"], info["channels"]), ("mp3", 44100, 2))
+        self.assertEqual((info["title"], info["artist"]), ("Песня", "Артист"))
+        self.assertAlmostEqual(info["duration"], 100 * 417 * 8 / 128000)
+
+    def test_mp3_xing_frame_count(self):
+        # Xing после 32 байт side info стерео-кадра MPEG-1; флаг 1 — есть число кадров
+        xing = MP3_FRAME[:4] + bytes(32) + b"Xing" + struct.pack(">II", 1, 1000)
+        data = xing + MP3_FRAME[len(xing):] + MP3_FRAME * 3
+        self.assertAlmostEqual(probe(data)["duration"], 1000 * 1152 / 44100)
+
+    def test_mp3_id3v1_and_junk_before_first_frame(self):
+        tag = b"TAG" + b"Title".ljust(30, b"\x00") + b"Artist".ljust(30, b"\x00") + bytes(65)
+        info = probe(b"\x00\xff\x01" + MP3_FRAME * 10 + tag)
+        self.assertEqual((info["title"], info["artist"], info["album"]), ("Title", "Artist", None))
+        self.assertAlmostEqual(info["duration"], 10 * 417 * 8 / 128000)
+
+    def test_wav(self):
+        rate, channels = 8000, 2
+        samples = bytes(rate * channels * 2 * 3)
+        fmt = struct.pack("<HHIIHH", 1, channels, rate, rate * channels * 2, channels * 2, 16)
+        data = (b"RIFF" + struct.pack("<I", 36 + len(samples)) + b"WAVE" + b"fmt " + struct.pack("<I", 16) + fmt
+                + b"data" + struct.pack("<I", len(samples)) + samples)
+        info = probe(data)
+        self.assertEqual((info["format"], info["sample_rate"], info["channels"]), ("wav", 8000, 2))
+        self.assertAlmostEqual(info["duration"], 3.0)
+
+    def test_flac(self):
+        # STREAMINFO: 20 бит частоты, 3 бита каналов - 1, 5 бит разрядности - 1, 36 бит сэмплов
+        bits = (44100 << 44) | (1 << 41) | (15 << 36) | (44100 * 4)
+        streaminfo = bytes(10) + bits.to_bytes(8, "big") + bytes(16)
+        comments = vorbis_comments(title="Трек", album="Альбом")
+        data = (b"fLaC" + b"\x00" + len(streaminfo).to_bytes(3, "big") + streaminfo
+                + b"\x84" + len(comments).to_bytes(3, "big") + comments)
+        info = probe(data)
+        self.assertEqual((info["format"], info["sample_rate"], info["channels"]), ("flac", 44100, 2))
+        self.assertEqual((info["title"], info["album"]), ("Трек", "Альбом"))
+        self.assertAlmostEqual(info["duration"], 4.0)
+
+    def test_ogg_opus(self):
+        head = b"OpusHead" + bytes([1, 2]) + struct.pack("<HIhB", 312, 44100, 0, 0)
+        tags = b"OpusTags" + vorbis_comments(artist="Артист", title="x" * 300)
+        data = (ogg_page([head], 0, 0) + ogg_page([tags], 0, 1)
+                + ogg_page([bytes(100)], 48000 * 3 + 312, 2))
+        info = probe(data)
+        self.assertEqual((info["format"], info["sample_rate"], info["channels"]), ("opus", 44100, 2))
+        self.assertEqual((info["artist"], info["title"]), ("Артист", "x" * 300))
+        self.assertAlmostEqual(info["duration"], 3.0)
+
+    def test_m4a(self):
+        mvhd = atom(b"mvhd", bytes(12), struct.pack(">II", 1000, 5500), bytes(80))
+        entry = (struct.pack(">I", 36) + b"mp4a" + bytes(16)
+                 + struct.pack(">HHII", 2, 16, 0, 48000 << 16))  # каналы, разрядность, частота 16.16
+        stsd = atom(b"stsd", bytes(4), struct.pack(">I", 1), entry)
+        trak = atom(b"trak", atom(b"mdia", atom(b"minf", atom(b"stbl", stsd))))
+        title = atom(b"\xa9nam", atom(b"data", bytes(8), "Название".encode()))
+        udta = atom(b"udta", atom(b"meta", bytes(4), atom(b"ilst", title)))
+        data = atom(b"ftyp", b"M4A ", bytes(4)) + atom(b"moov", mvhd, trak, udta)
+        info = probe(data)
+        self.assertEqual((info["format"], info["sample_rate"], info["channels"]), ("m4a", 48000, 2))
+        self.assertEqual(info["title"], "Название")
+        self.assertAlmostEqual(info["duration"], 5.5)
+
+    def test_unknown_and_truncated(self):
+        self.assertEqual(probe(b""), {})
+        self.assertEqual(probe(b"not audio at all" * 10), {})
+        self.assertEqual(probe(MP3_FRAME[:100]), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# tests/test_cache.py
+import unittest
+from unittest import mock
+
+from utils.cache import TTLCache, MISSING
+
+
+class TTLCacheTest(unittest.TestCase):
+    """Время жизни, сброс и вытеснение записей кеша."""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("utils.cache.time.monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = TTLCache(maxsize=3, ttl=10.0)
+
+    def test_value_lives_until_ttl(self):
+        self.cache.set("a", 1)
+        self.now += 9.9
+        self.assertEqual(self.cache.get("a"), 1)
+        self.now += 0.1
+        self.assertIs(self.cache.get("a"), MISSING)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_set_restarts_ttl(self):
+        self.cache.set("a", 1)
+        self.now += 8
+        self.cache.set("a", 2)
+        self.now += 8
+        self.assertEqual(self.cache.get("a"), 2)
+
+    def test_cached_falsy_value_is_not_a_miss(self):
+        self.cache.set("none", None)
+        self.assertIsNone(self.cache.get("none"))
+        self.assertIs(self.cache.get("other"), MISSING)
+        self.assertEqual(self.cache.get("other", 0), 0)
+
+    def test_invalidate_and_clear(self):
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.invalidate("a")
+        self.cache.invalidate("missing")
+        self.assertIs(self.cache.get("a"), MISSING)
+        self.assertEqual(self.cache.get("b"), 2)
+        self.cache.clear()
+        self.assertIs(self.cache.get("b"), MISSING)
+
+    def test_least_recently_used_is_evicted(self):
+        for key in "abc":
+            self.cache.set(key, key)
+        self.cache.get("a")
+        self.cache.set("d", "d")
+        self.assertIs(self.cache.get("b"), MISSING)
+        self.assertEqual([self.cache.get(k) for k in "acd"], ["a", "c", "d"])
+
+    def test_stats(self):
+        self.cache.set("a", 1)
+        self.cache.get("a")
+        self.cache.get("b")
+        self.now += 10
+        self.cache.get("a")
+        self.assertEqual(self.cache.stats(), {"size": 0, "hits": 1, "misses": 2, "hit_ratio": 0.333})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+# tests/test_callbacks.py
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from utils.callbacks import CallbackTable, CatalogPage, ListenTrack, PlayTrack, STALE_TEXT
+
+
+class CallbackTableTest(unittest.IsolatedAsyncioTestCase):
+    """Маршрутизация по префиксу и перевод старого формата callback_data в фабрики."""
+
+    def setUp(self):
+        self.table = CallbackTable()
+        self.calls = []
+
+        @self.table.route(ListenTrack, legacy="listen")
+        async def listen(callback, callback_data: ListenTrack):
+            self.calls.append(("listen", callback_data))
+
+        @self.table.route(CatalogPage, legacy="my_catalog")
+        async def catalog(callback, callback_data: CatalogPage):
+            self.calls.append(("catalog", callback_data))
+
+        @self.table.route(PlayTrack)
+        async def play(callback, callback_data: PlayTrack):
+            self.calls.append(("play", callback_data))
+
+        @self.table.route("back_main")
+        async def back(callback):
+            self.calls.append(("back", None))
+
+    async def dispatch(self, data):
+        # ответ «кнопка устарела» возвращается методом для ответа хендлера, а не вызывается
+        callback = SimpleNamespace(data=data, answer=mock.Mock())
+        await self.table._dispatch(callback)
+        return callback
+
+    async def test_routes_by_prefix(self):
+        await self.dispatch(ListenTrack(track_id=7).pack())
+        await self.dispatch(CatalogPage(nav="n", key="k1.2").pack())
+        await self.dispatch("back_main")
+        self.assertEqual(self.calls, [("listen", ListenTrack(track_id=7)),
+                                      ("catalog", CatalogPage(nav="n", key="k1.2")),
+                                      ("back", None)])
+
+    async def test_legacy_with_id(self):
+        await self.dispatch("listen_12")
+        self.assertEqual(self.calls, [("listen", ListenTrack(track_id=12))])
+
+    async def test_legacy_without_id(self):
+        await self.dispatch("my_catalog")
+        self.assertEqual(self.calls, [("catalog", CatalogPage())])
+
+    async def test_unknown_and_malformed_are_stale(self):
+        for data in ("listen_x", "play_12", "nothing", "p:abc", ""):
+            callback = await self.dispatch(data)
+            callback.answer.assert_called_once_with(STALE_TEXT)
+        self.assertEqual(self.calls, [])
+
+    def test_resolve(self):
+        self.assertEqual(self.table.resolve("l:3"), "l")
+        self.assertEqual(self.table.resolve("listen_3"), "l")
+        self.assertEqual(self.table.resolve("my_catalog"), "c")
+        self.assertEqual(self.table.resolve("back_main"), "back_main")
+        self.assertIsNone(self.table.resolve("play_3"))
+
+    def test_prefix_taken_twice(self):
+        with self.assertRaises(ValueError):
+            self.table.route(PlayTrack)(lambda callback: None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# tests/test_campaigns.py
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+# db_instance открывает базу при импорте: не трогаем рабочую database.db
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(prefix="test-campaigns-"), "bot.db"))
+
+from async_database import AsyncDatabase  # noqa: E402
+from utils import campaigns  # noqa: E402
+from utils.notify import BroadcastReport, DeliveryResult, SENT  # noqa: E402
+
+
+class Crash(Exception):
+    pass
+
+
+class CampaignResumeTest(unittest.IsolatedAsyncioTestCase):
+    """Курсор кампании: после падения рассылка продолжается с первого необработанного получателя."""
+
+    async def asyncSetUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = AsyncDatabase(os.path.join(self.dir.name, "test.db"))
+        for uid in range(1, 8):
+            await self.db.add_user(uid, f"user{uid}")
+        await self.db.create_campaign("news", "Новости")
+        self.delivered = []
+        patches = [mock.patch.object(campaigns, "db", self.db),
+                   mock.patch.object(campaigns, "record_report", mock.AsyncMock()),
+                   mock.patch.object(campaigns, "broadcast", self.broadcast)]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.runner = campaigns.CampaignRunner(rate=1000, batch_size=3)
+        self.crash_after = None
+
+    async def asyncTearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    async def broadcast(self, bot, user_ids, text, on_result=None, **kwargs):
+        report = BroadcastReport()
+        # доставки завершаются не по порядку: последний в пачке раньше первого
+        for uid in [*user_ids[1:], user_ids[0]]:
+            if self.crash_after is not None and len(self.delivered) >= self.crash_after:
+                raise Crash
+            self.delivered.append(uid)
+            report.results[uid] = result = DeliveryResult(uid, SENT)
+            await on_result(result)
+        return report
+
+    async def run_campaign(self):
+        for campaign in await self.db.get_running_campaigns():
+            await self.runner._process(None, campaign)
+
+    async def test_resume_after_crash(self):
+        self.crash_after = 5
+        with self.assertRaises(Crash):
+            await self.run_campaign()
+        # 2, 3, 1 — первая пачка целиком, 5 из второй: курсор стоит на 3, пока не доставлен 4
+        self.assertEqual(self.delivered, [2, 3, 1, 5, 6])
+        (_, _, _, _, cursor, _), = await self.db.get_running_campaigns()
+        self.assertEqual(cursor, 3)
+
+        self.crash_after = None
+        self.delivered.clear()
+        await self.run_campaign()
+        self.assertEqual(sorted(self.delivered), [4, 5, 6, 7])
+        self.assertEqual(await self.db.get_running_campaigns(), [])
+        (key, status, total, sent, failed, remaining, _, _), = await self.db.get_campaigns()
+        self.assertEqual((key, status, total, sent, failed, remaining), ("news", "done", 7, 7, 0, 0))
+
+    async def test_users_registered_later_are_not_included(self):
+        await self.db.add_user(100, "late")
+        (_, _, _, _, _, remaining, _, _), = await self.db.get_campaigns()
+        self.assertEqual(remaining, 7)
+        await self.run_campaign()
+        self.assertEqual(sorted(self.delivered), list(range(1, 8)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+# tests/test_outbox.py
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from database import Database
+
+
+class CommonTrackOutboxTest(unittest.TestCase):
+    """Трек в общем плейлисте и его событие в outbox пишутся вместе или не пишутся вовсе."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.dir.name, "test.db"))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def count(self, table):
+        return self.db.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def failing_outbox(self):
+        return mock.patch.object(self.db, "_enqueue_outbox", side_effect=RuntimeError("outbox"))
+
+    def test_outbox_failure_leaves_no_track(self):
+        with self.failing_outbox(), self.assertRaises(RuntimeError):
+            self.db.add_common_track(1, "file", "Title", "Artist", artist_id=1, file_unique_id="u1")
+        self.assertFalse(self.db.conn.in_transaction)
+        # следующая запись не должна зафиксировать остатки упавшей
+        self.db.add_user(2, "user")
+        self.assertEqual(self.count("tracks"), 0)
+        self.assertEqual(self.count("storage_objects"), 0)
+        self.assertEqual(self.count("outbox"), 0)
+
+    def test_outbox_failure_inside_transaction(self):
+        with self.db.transaction():
+            self.db.add_user(2, "user")
+            with self.failing_outbox(), self.assertRaises(RuntimeError):
+                self.db.add_common_track(1, "file", "Title", "Artist", artist_id=1)
+        self.assertEqual(self.count("tracks"), 0)
+        self.assertEqual(self.count("users"), 1)
+
+    def test_outbox_failure_in_group_commit(self):
+        with self.failing_outbox():
+            results = self.db.run_group([(self.db.add_user, (2, "user"), {}),
+                                         (self.db.add_common_track, (1, "file", "Title", "Artist", 1), {})])
+        self.assertEqual([ok for ok, _ in results], [True, False])
+        self.assertEqual(self.count("tracks"), 0)
+        self.assertEqual(self.count("users"), 1)
+
+    def test_album_outbox_failure_leaves_no_tracks(self):
+        with self.failing_outbox(), self.assertRaises(RuntimeError):
+            self.db.add_album(1, [("f1", "One", "Artist", "u1"), ("f2", "Two", "Artist", None)], artist_id=1)
+        self.assertEqual(self.count("tracks"), 0)
+        self.assertEqual(self.count("storage_objects"), 0)
+
+    def test_track_and_event_committed_together(self):
+        track_id = self.db.add_common_track(1, "file", "Title", "Artist", artist_id=1)
+        self.assertEqual(self.count("tracks"), 1)
+        events = self.db.get_pending_outbox()
+        self.assertEqual([(kind, payload["track_id"]) for _, kind, payload, _, _ in events], [("new_track", track_id)])
+
+
+if __name__ == "__main__":
+    unittest.main()
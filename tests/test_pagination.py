@@ -0,0 +1,105 @@
+# tests/test_pagination.py
+import os
+import tempfile
+import unittest
+
+from database import Database
+from utils.pagination import make_page, encode_track_key, decode_track_key, encode_id_key, decode_id_key
+
+LIMIT = 10
+
+
+class MakePageTest(unittest.TestCase):
+    """Страница из limit + 1 строк: лишняя строка означает, что в этом направлении есть ещё."""
+
+    def test_first_page(self):
+        page = make_page(list(range(11)), None, False, LIMIT)
+        self.assertEqual((page.rows, page.has_prev, page.has_next), (list(range(10)), False, True))
+
+    def test_exactly_full_last_page(self):
+        page = make_page(list(range(10)), 5, False, LIMIT)
+        self.assertEqual((len(page.rows), page.has_prev, page.has_next), (10, True, False))
+
+    def test_backward_keeps_rows_nearest_to_cursor(self):
+        page = make_page(list(range(11)), 99, True, LIMIT)
+        self.assertEqual((page.rows, page.has_prev, page.has_next), (list(range(1, 11)), True, True))
+
+    def test_backward_to_first_page(self):
+        page = make_page(list(range(4)), 99, True, LIMIT)
+        self.assertEqual((page.rows, page.has_prev, page.has_next), (list(range(4)), False, True))
+
+    def test_keys_roundtrip(self):
+        self.assertEqual(decode_track_key(encode_track_key("2024-02-29 23:59:59", 123456)),
+                         ("2024-02-29 23:59:59", 123456))
+        self.assertEqual(decode_id_key(encode_id_key(0)), 0)
+        self.assertEqual(decode_id_key(encode_id_key(36 ** 5)), 36 ** 5)
+
+
+class KeysetPageTest(unittest.TestCase):
+    """Keyset-страницы справочника артистов и треков артиста на границах и при равных ключах."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.dir.name, "test.db"))
+
+    def tearDown(self):
+        self.db.close()
+        self.dir.cleanup()
+
+    def walk(self, fetch, key, total_pages):
+        """Проходит все страницы вперёд, затем назад; возвращает строки в обоих порядках."""
+        forward, pages, cursor = [], [], None
+        while True:
+            page = make_page(fetch(cursor, False), cursor, False, LIMIT)
+            forward += page.rows
+            pages.append(page)
+            if not page.has_next:
+                break
+            cursor = key(page.rows[-1])
+        self.assertEqual(len(pages), total_pages)
+        self.assertFalse(pages[0].has_prev)
+        backward = list(pages[-1].rows)
+        cursor = key(pages[-1].rows[0])
+        while True:
+            page = make_page(fetch(cursor, True), cursor, True, LIMIT)
+            backward = page.rows + backward
+            if not page.has_prev:
+                break
+            cursor = key(page.rows[0])
+        return forward, backward
+
+    def test_artists_with_equal_names(self):
+        # одинаковые имена на стыке страниц: порядок держит второй ключ, id
+        ids = [self.db.add_artist(1, name) for name in ["B"] * 12 + ["A"] * 5 + ["C"] * 3]
+        rows, back = self.walk(lambda cursor, backward: self.db.page_artists(cursor, backward, LIMIT),
+                               lambda a: a.id, 2)
+        self.assertEqual([a.id for a in rows], ids[12:17] + ids[:12] + ids[17:])
+        self.assertEqual([a.id for a in back], [a.id for a in rows])
+
+    def test_exactly_one_page_of_artists(self):
+        for i in range(LIMIT):
+            self.db.add_artist(1, f"Artist {i}")
+        page = make_page(self.db.page_artists(None, False, LIMIT), None, False, LIMIT)
+        self.assertEqual((len(page.rows), page.has_prev, page.has_next), (LIMIT, False, False))
+
+    def test_unknown_artist_cursor_starts_from_first_page(self):
+        self.db.add_artist(1, "Only")
+        self.assertEqual([a.name for a in self.db.page_artists(10 ** 6, False, LIMIT)], ["Only"])
+
+    def test_artist_tracks_with_equal_timestamps(self):
+        artist_id = self.db.add_artist(1, "Artist")
+        ids = [self.db.add_common_track(1, f"f{i}", f"Song {i}", "Artist", artist_id=artist_id) for i in range(25)]
+        self.db.add_common_track(1, "other", "Other", "Other", artist_id=artist_id + 1)
+        # треки одной секунды: created_at совпадает, порядок держит id
+        self.db.conn.execute("UPDATE tracks SET created_at = '2024-01-01 00:00:00' WHERE id <= ?", (ids[14],))
+        self.db.conn.commit()
+        rows, back = self.walk(
+            lambda cursor, backward: self.db.page_artist_tracks(artist_id, cursor, backward, LIMIT),
+            lambda t: (t.created_at, t.id), 3)
+        self.assertEqual(sorted(t.id for t in rows), ids)
+        self.assertEqual([t.id for t in back], [t.id for t in rows])
+        self.assertEqual([t.id for t in rows[-15:]], ids[14::-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
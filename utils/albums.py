@@ -0,0 +1,52 @@
+# utils/albums.py
+import asyncio
+import logging
+import time
+from config import ALBUM_WINDOW
+
+logger = logging.getLogger(__name__)
+
+
+class _Group:
+    __slots__ = ("messages", "last_seen")
+
+    def __init__(self):
+        self.messages = []
+        self.last_seen = 0.0
+
+
+class AlbumCollector:
+    """
+    Собирает сообщения одного альбома (media_group_id): Telegram присылает их
+    отдельными апдейтами почти одновременно. Когда window секунд новых
+    сообщений группы нет, вызывается on_complete(messages) в фоновой задаче —
+    хендлер не ждёт окно и не держит апдейт.
+    """
+
+    def __init__(self, window=ALBUM_WINDOW):
+        self.window = window
+        self._groups = {}
+
+    def add(self, message, on_complete):
+        """Добавляет сообщение; on_complete первого сообщения группы получит весь альбом."""
+        key = (message.chat.id, message.media_group_id)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group()
+            asyncio.create_task(self._complete(key, group, on_complete))
+        group.messages.append(message)
+        group.last_seen = time.monotonic()
+
+    async def _complete(self, key, group, on_complete):
+        try:
+            while (delay := group.last_seen + self.window - time.monotonic()) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            self._groups.pop(key, None)
+        try:
+            await on_complete(sorted(group.messages, key=lambda m: m.message_id))
+        except Exception:
+            logger.exception("Ошибка обработки альбома %s", key)
+
+
+albums = AlbumCollector()
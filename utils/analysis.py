@@ -0,0 +1,197 @@
+# utils/analysis.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from config import (ANALYSIS_QUEUE_SIZE, ANALYSIS_PROCESSES, ANALYSIS_MAX_BYTES, ANALYSIS_MAX_ATTEMPTS,
+                    FFMPEG_PATH, FPCALC_PATH, DUPLICATE_THRESHOLD)
+from db_instance import db
+from utils import audio, metrics
+
+logger = logging.getLogger(__name__)
+
+DURATION_TOLERANCE = 3.0  # секунд: кандидаты в дубликаты ищутся среди треков близкой длительности
+CANDIDATE_BATCH = 200     # кандидатов в дубликаты на одно сравнение в пуле
+
+
+class AudioAnalyzer:
+    """
+    Фоновый анализ загруженного аудио: формат, длительность, битрейт, теги,
+    громкость и акустический отпечаток для поиска почти-дубликатов.
+    Файл скачивается во временный файл на диске (кусками, без копии в памяти),
+    а разбор и сравнение отпечатков идут в пуле процессов (не больше processes
+    одновременно) — хендлеры не ждут CPU; процессу передаётся только путь.
+    Задания — ("object", file_unique_id) или ("track", id), как у архивации:
+    одно аудио разбирается один раз, повторные публикации получают готовый результат.
+    Очередь ограничена: если она заполнена, трек подберёт периодический обход БД.
+    Файл, который не скачивается из-за сетевых ошибок, после max_attempts попыток
+    помечается failed; при флуд-лимите скачивание ждёт retry_after.
+    """
+
+    def __init__(self, queue_size=ANALYSIS_QUEUE_SIZE, processes=ANALYSIS_PROCESSES,
+                 max_bytes=ANALYSIS_MAX_BYTES, max_attempts=ANALYSIS_MAX_ATTEMPTS, sweep_interval=60.0):
+        self.processes = processes
+        self.max_bytes = max_bytes
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._queued = set()
+        self._pool = None
+        self._paused_until = 0.0
+
+    @staticmethod
+    def _track_key(track_id, file_unique_id):
+        return ("object", file_unique_id) if file_unique_id else ("track", track_id)
+
+    def enqueue_track(self, track_id, file_unique_id, file_id):
+        """Ставит трек в очередь анализа без ожидания. False — очередь полна, трек подберёт обход."""
+        key = self._track_key(track_id, file_unique_id)
+        if key in self._queued:
+            return True
+        try:
+            self._queue.put_nowait((key, track_id, file_unique_id, file_id))
+        except asyncio.QueueFull:
+            return False
+        self._queued.add(key)
+        return True
+
+    def stats(self):
+        return {"queued": len(self._queued)}
+
+    def _new_pool(self):
+        # spawn: дочерние процессы не наследуют цикл событий и соединения с БД
+        self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                         mp_context=multiprocessing.get_context("spawn"))
+
+    async def run(self, bot, sweep=True):
+        """sweep=False — только своя очередь, без обхода БД (его делает один из процессов)."""
+        if self.processes <= 0:
+            logger.info("ANALYSIS_PROCESSES=0 — анализ аудио отключён")
+            return
+        if not FFMPEG_PATH or not FPCALC_PATH:
+            logger.info("ffmpeg: %s, fpcalc: %s — без них громкость и поиск дубликатов недоступны",
+                        FFMPEG_PATH or "нет", FPCALC_PATH or "нет")
+        self._new_pool()
+        workers = [asyncio.create_task(self._worker(bot)) for _ in range(self.processes)]
+        try:
+            if not sweep:
+                await asyncio.gather(*workers)
+            while True:
+                await self._sweep()
+                await asyncio.sleep(self.sweep_interval)
+        finally:
+            for w in workers:
+                w.cancel()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _sweep(self):
+        """Подбирает из БД треки, ждущие анализа (загруженные до включения анализа или не влезшие в очередь)."""
+        try:
+            for track_id, file_unique_id, file_id in await db.get_pending_analysis(self._queue.maxsize):
+                if not self.enqueue_track(track_id, file_unique_id, file_id):
+                    return
+        except Exception:
+            logger.exception("Ошибка обхода треков, ожидающих анализа")
+
+    async def _worker(self, bot):
+        while True:
+            key, track_id, file_unique_id, file_id = await self._queue.get()
+            try:
+                await self._analyze(bot, track_id, file_unique_id, file_id)
+            except Exception:
+                logger.exception("Ошибка анализа %s", key)
+            finally:
+                self._queued.discard(key)
+                self._queue.task_done()
+
+    async def _in_pool(self, stage, fn, *args):
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            metrics.analysis_seconds.observe(time.perf_counter() - started, stage)
+
+    async def _download(self, bot, file_id, path):
+        """Скачивает файл в path. False — файл не скачать через Bot API (слишком большой или недоступен)."""
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        started = time.perf_counter()
+        try:
+            file = await bot.get_file(file_id)
+            if file.file_size and file.file_size > self.max_bytes:
+                return False
+            await bot.download_file(file.file_path, destination=path)
+            return True
+        except TelegramBadRequest as e:
+            logger.info("Файл %s не скачать для анализа: %s", file_id, e)
+            return False
+        finally:
+            metrics.analysis_seconds.observe(time.perf_counter() - started, "download")
+
+    async def _analyze(self, bot, track_id, file_unique_id, file_id):
+        if file_unique_id and await db.copy_analysis(file_unique_id):
+            return
+        fd, path = tempfile.mkstemp(prefix="garage-audio-")
+        os.close(fd)
+        try:
+            try:
+                downloaded = await self._download(bot, file_id, path)
+            except TelegramRetryAfter as e:
+                # флуд-лимит общий: все воркеры ждут, трек остаётся pending до следующего обхода
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                return
+            except TelegramNetworkError:
+                await db.fail_analysis(track_id, file_unique_id, self.max_attempts)
+                return
+            if not downloaded:
+                await db.set_analysis_state(track_id, file_unique_id, "skipped")
+                return
+            try:
+                result = await self._in_pool("analyze", audio.analyze, path, FFMPEG_PATH, FPCALC_PATH)
+            except BrokenProcessPool:
+                # процесс пула упал (например, по памяти) — пересоздаём пул, трек разберётся на обходе
+                logger.warning("Пул анализа аудио сломан, пересоздаю")
+                self._new_pool()
+                return
+            except Exception:
+                logger.exception("Не удалось разобрать аудио трека %s", track_id)
+                result = None
+        finally:
+            os.unlink(path)
+        if not result or "format" not in result:
+            # контейнер не распознан ни разбором, ни ffmpeg
+            await db.set_analysis_state(track_id, file_unique_id, "failed")
+            return
+
+        duplicate_of = None
+        if result.get("fingerprint") and result.get("duration"):
+            match = await self._best_match(track_id, file_unique_id, result)
+            if match is not None:
+                duplicate_of = match[0]
+                logger.info("Трек %s похож на %s (%.2f)", track_id, *match)
+        await db.set_analysis(track_id, file_unique_id, result, duplicate_of)
+
+    async def _best_match(self, track_id, file_unique_id, result):
+        """Самый похожий трек близкой длительности во всей библиотеке — кандидаты читаются пачками."""
+        best, cursor = None, None
+        while True:
+            batch = await db.get_fingerprint_candidates(result["duration"], DURATION_TOLERANCE, track_id,
+                                                        file_unique_id, cursor, CANDIDATE_BATCH)
+            if not batch:
+                return best
+            match = await self._in_pool("match", audio.best_match, result["fingerprint"],
+                                        [(tid, fingerprint) for tid, _, fingerprint in batch], DUPLICATE_THRESHOLD)
+            if match is not None and (best is None or match[1] > best[1]):
+                best = match
+            if len(batch) < CANDIDATE_BATCH:
+                return best
+            cursor = batch[-1][1], batch[-1][0]
+
+
+analyzer = AudioAnalyzer()
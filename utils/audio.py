@@ -0,0 +1,374 @@
+# utils/audio.py
+"""
+Разбор аудиофайла — выполняется в процессах пула (utils/analysis.py), поэтому
+модуль не импортирует ничего из бота. Контейнеры MP3 (ID3v1/v2, Xing/VBRI),
+FLAC, Ogg (Vorbis/Opus), MP4/M4A и WAV разбираются на чистом Python: формат,
+длительность, средний битрейт, частота дискретизации, каналы и теги.
+Громкость EBU R128 считает ffmpeg (фильтр ebur128), акустический отпечаток —
+fpcalc (Chromaprint); без них эти поля остаются пустыми.
+"""
+import mmap
+import os
+import re
+import struct
+import subprocess
+
+FINGERPRINT_SECONDS = 60  # отпечаток снимается с начала трека
+MAX_SHIFT = 40            # сдвиг при сравнении отпечатков: элементов Chromaprint, ~5 с
+MIN_OVERLAP = 40          # меньше совпавших элементов — сравнение не засчитывается
+TOOL_TIMEOUT = 120
+
+_MPEG_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MPEG_BITRATES[(2, 3)] = _MPEG_BITRATES[(2, 2)]
+_MPEG_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+
+_ID3_FIELDS = {"TIT2": "title", "TT2": "title", "TPE1": "artist", "TP1": "artist", "TALB": "album", "TAL": "album"}
+_COMMENT_FIELDS = {"TITLE": "title", "ARTIST": "artist", "ALBUM": "album"}
+_MP4_FIELDS = {b"\xa9nam": "title", b"\xa9ART": "artist", b"\xa9alb": "album"}
+
+_LOUDNESS_RE = re.compile(r"I:\s+(-?\d+(?:\.\d+)?) LUFS")
+_FFMPEG_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_FFMPEG_STREAM_RE = re.compile(r"Audio: (\w+)[^,]*, (\d+) Hz, (\w+)")
+
+
+def _text(raw, encoding):
+    codec = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}.get(encoding, "latin-1")
+    return raw.decode(codec, "replace").split("\x00")[0].strip() or None
+
+
+def _synchsafe(b):
+    return (b[0] << 21) | (b[1] << 14) | (b[2] << 7) | b[3]
+
+
+# --- MP3 ---
+def _id3v2(data, info):
+    """Теги ID3v2 в начале файла; возвращает смещение первого аудиокадра."""
+    if data[:3] != b"ID3" or len(data) < 10:
+        return 0
+    major, flags = data[3], data[5]
+    end = 10 + _synchsafe(data[6:10]) + (10 if flags & 0x10 else 0)
+    pos = 10
+    if flags & 0x40 and major >= 3:  # расширенный заголовок
+        pos += _synchsafe(data[10:14]) if major == 4 else 4 + struct.unpack(">I", data[10:14])[0]
+    id_len, head = (3, 6) if major == 2 else (4, 10)
+    while pos + head <= end:
+        frame_id = data[pos:pos + id_len].decode("latin-1")
+        if not frame_id.strip("\x00"):
+            break
+        if major == 2:
+            size = int.from_bytes(data[pos + 3:pos + 6], "big")
+        elif major == 4:
+            size = _synchsafe(data[pos + 4:pos + 8])
+        else:
+            size = struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        body = data[pos + head:pos + head + size]
+        field = _ID3_FIELDS.get(frame_id)
+        if field and body and field not in info:
+            info[field] = _text(body[1:], body[0])
+        pos += head + size
+    return end
+
+
+def _id3v1(data, info):
+    tag = data[-128:]
+    if len(tag) == 128 and tag[:3] == b"TAG":
+        for field, start in (("title", 3), ("artist", 33), ("album", 63)):
+            if field not in info:
+                info[field] = _text(tag[start:start + 30], 0)
+
+
+def _mpeg_header(data, pos):
+    """(версия, слой, битрейт кбит/с, частота, каналы, длина кадра, сэмплов в кадре) или None."""
+    if pos + 4 > len(data) or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = {3: 1, 2: 2, 0: 2.5}.get((b1 >> 3) & 3)
+    layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MPEG_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    rate = _MPEG_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    channels = 1 if b3 >> 6 == 3 else 2
+    if layer == 1:
+        samples, length = 384, (12 * bitrate * 1000 // rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        length = samples // 8 * bitrate * 1000 // rate + padding
+    return version, layer, bitrate, rate, channels, length, samples
+
+
+def _mp3(data, info):
+    start = _id3v2(data, info)
+    _id3v1(data, info)
+    end = len(data) - (128 if data[-128:-125] == b"TAG" else 0)
+    pos, header = start, None
+    # первый кадр — там, где следующий заголовок стоит ровно через длину кадра
+    while pos < min(end, start + 65536):
+        header = _mpeg_header(data, pos)
+        if header and _mpeg_header(data, pos + header[5]):
+            break
+        header = None
+        pos += 1
+    if header is None:
+        return False
+    version, layer, bitrate, rate, channels, _, samples = header
+    info.update(format="mp3", sample_rate=rate, channels=channels)
+    side = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+    xing = pos + 4 + side
+    frames = None
+    if data[xing:xing + 4] in (b"Xing", b"Info") and data[xing + 7] & 1:
+        frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+    elif data[pos + 36:pos + 40] == b"VBRI":
+        frames = struct.unpack(">I", data[pos + 50:pos + 54])[0]
+    if frames:
+        info["duration"] = frames * samples / rate
+    else:
+        info["duration"] = (end - pos) * 8 / (bitrate * 1000)
+    return True
+
+
+# --- FLAC, Ogg: комментарии Vorbis ---
+def _vorbis_comments(block, info):
+    vendor = struct.unpack("<I", block[:4])[0]
+    pos = 4 + vendor
+    count = struct.unpack("<I", block[pos:pos + 4])[0]
+    pos += 4
+    for _ in range(count):
+        length = struct.unpack("<I", block[pos:pos + 4])[0]
+        key, _, value = block[pos + 4:pos + 4 + length].decode("utf-8", "replace").partition("=")
+        field = _COMMENT_FIELDS.get(key.upper())
+        if field and field not in info:
+            info[field] = value.strip() or None
+        pos += 4 + length
+
+
+def _flac(data, info):
+    pos, last = 4, False
+    while not last and pos + 4 <= len(data):
+        last = bool(data[pos] & 0x80)
+        kind = data[pos] & 0x7F
+        size = int.from_bytes(data[pos + 1:pos + 4], "big")
+        block = data[pos + 4:pos + 4 + size]
+        if kind == 0:
+            bits = int.from_bytes(block[10:18], "big")
+            rate = bits >> 44
+            total = bits & ((1 << 36) - 1)
+            info.update(format="flac", sample_rate=rate, channels=((bits >> 41) & 7) + 1)
+            if rate and total:
+                info["duration"] = total / rate
+        elif kind == 4:
+            _vorbis_comments(block, info)
+        pos += 4 + size
+    return "format" in info
+
+
+def _ogg_packets(data, count):
+    """Первые count пакетов потока Ogg."""
+    packets, current, pos = [], b"", 0
+    while len(packets) < count and data[pos:pos + 4] == b"OggS":
+        segments = data[pos + 26]
+        table = data[pos + 27:pos + 27 + segments]
+        pos += 27 + segments
+        for size in table:
+            current += data[pos:pos + size]
+            pos += size
+            if size < 255:
+                packets.append(current)
+                current = b""
+    return packets
+
+
+def _ogg(data, info):
+    packets = _ogg_packets(data, 2)
+    if not packets:
+        return False
+    head = packets[0]
+    last = data.rfind(b"OggS")
+    granule = struct.unpack("<q", data[last + 6:last + 14])[0] if last >= 0 else 0
+    if head[:7] == b"\x01vorbis":
+        channels, rate = head[11], struct.unpack("<I", head[12:16])[0]
+        info.update(format="vorbis", sample_rate=rate, channels=channels)
+        if granule > 0 and rate:
+            info["duration"] = granule / rate
+        if len(packets) > 1 and packets[1][:7] == b"\x03vorbis":
+            _vorbis_comments(packets[1][7:], info)
+    elif head[:8] == b"OpusHead":
+        pre_skip = struct.unpack("<H", head[10:12])[0]
+        info.update(format="opus", sample_rate=struct.unpack("<I", head[12:16])[0] or 48000, channels=head[9])
+        if granule > pre_skip:
+            info["duration"] = (granule - pre_skip) / 48000  # гранулы Opus всегда в 48 кГц
+        if len(packets) > 1 and packets[1][:8] == b"OpusTags":
+            _vorbis_comments(packets[1][8:], info)
+    else:
+        return False
+    return True
+
+
+# --- MP4/M4A ---
+def _atoms(data, start, end):
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        head = 8
+        if size == 1:
+            size, head = struct.unpack(">Q", data[pos + 8:pos + 16])[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < head:
+            return
+        yield kind, pos + head, min(pos + size, end)
+        pos += size
+
+
+def _mp4_walk(data, start, end, info):
+    for kind, body, stop in _atoms(data, start, end):
+        if kind in (b"moov", b"trak", b"mdia", b"minf", b"stbl", b"udta", b"ilst"):
+            _mp4_walk(data, body, stop, info)
+        elif kind == b"meta":
+            _mp4_walk(data, body + 4, stop, info)  # у meta 4 байта версии и флагов
+        elif kind == b"mvhd":
+            if data[body] == 1:
+                scale, duration = struct.unpack(">IQ", data[body + 20:body + 32])
+            else:
+                scale, duration = struct.unpack(">II", data[body + 12:body + 20])
+            if scale:
+                info["duration"] = duration / scale
+        elif kind == b"stsd" and "sample_rate" not in info:
+            entry = body + 8
+            if data[entry + 4:entry + 8] in (b"mp4a", b"alac", b"Opus", b"fLaC"):
+                info["channels"] = struct.unpack(">H", data[entry + 24:entry + 26])[0]
+                info["sample_rate"] = struct.unpack(">I", data[entry + 32:entry + 36])[0] >> 16
+        elif kind in _MP4_FIELDS and info.get(_MP4_FIELDS[kind]) is None:
+            for child, value, value_end in _atoms(data, body, stop):
+                if child == b"data":
+                    info[_MP4_FIELDS[kind]] = data[value + 8:value_end].decode("utf-8", "replace").strip() or None
+
+
+def _mp4(data, info):
+    _mp4_walk(data, 0, len(data), info)
+    if "duration" not in info:
+        return False
+    info["format"] = "m4a"
+    return True
+
+
+def _atoms_le(data):
+    pos = 12
+    while pos + 8 <= len(data):
+        kind, size = struct.unpack("<4sI", data[pos:pos + 8])
+        yield kind, pos + 8, min(pos + 8 + size, len(data))
+        pos += 8 + size + (size & 1)
+
+
+def _wav(data, info):
+    byte_rate = 0
+    for kind, body, stop in _atoms_le(data):
+        if kind == b"fmt ":
+            channels, rate = struct.unpack("<HI", data[body + 2:body + 8])
+            byte_rate = struct.unpack("<I", data[body + 8:body + 12])[0]
+            info.update(format="wav", sample_rate=rate, channels=channels)
+        elif kind == b"data" and byte_rate:
+            info["duration"] = (stop - body) / byte_rate
+    return "duration" in info
+
+
+def probe(data):
+    """
+    Свойства контейнера: {format, duration, bitrate, sample_rate, channels, title, artist, album}.
+    data — bytes или mmap файла.
+    """
+    info = {}
+    if data[:4] == b"fLaC":
+        ok = _flac(data, info)
+    elif data[:4] == b"OggS":
+        ok = _ogg(data, info)
+    elif data[4:8] == b"ftyp":
+        ok = _mp4(data, info)
+    elif data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        ok = _wav(data, info)
+    else:
+        ok = _mp3(data, info)
+    if not ok:
+        return {}
+    if info.get("duration"):
+        info["bitrate"] = round(len(data) * 8 / info["duration"] / 1000)
+    return info
+
+
+# --- внешние инструменты ---
+def _ffmpeg(path, ffmpeg, info):
+    """Громкость EBU R128; заодно длительность и поток, если контейнер не разобрался."""
+    result = subprocess.run([ffmpeg, "-hide_banner", "-nostats", "-i", path, "-map", "0:a:0",
+                             "-af", "ebur128=framelog=quiet", "-f", "null", "-"],
+                            capture_output=True, text=True, errors="replace", timeout=TOOL_TIMEOUT)
+    loudness = _LOUDNESS_RE.findall(result.stderr)
+    if loudness:
+        info["loudness"] = float(loudness[-1])  # последнее значение — итог в Summary
+    if "duration" not in info and (match := _FFMPEG_DURATION_RE.search(result.stderr)):
+        hours, minutes, seconds = match.groups()
+        info["duration"] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    if "format" not in info and (match := _FFMPEG_STREAM_RE.search(result.stderr)):
+        info.update(format=match.group(1), sample_rate=int(match.group(2)),
+                    channels={"mono": 1, "stereo": 2}.get(match.group(3)))
+
+
+def _fpcalc(path, fpcalc, info):
+    result = subprocess.run([fpcalc, "-raw", "-length", str(FINGERPRINT_SECONDS), path],
+                            capture_output=True, text=True, timeout=TOOL_TIMEOUT)
+    for line in result.stdout.splitlines():
+        if line.startswith("FINGERPRINT=") and len(line) > 12:
+            items = [int(v) & 0xFFFFFFFF for v in line[12:].split(",")]
+            info["fingerprint"] = struct.pack(f"<{len(items)}I", *items)
+
+
+def analyze(path, ffmpeg=None, fpcalc=None):
+    """
+    Полный разбор файла на диске: свойства контейнера, громкость (ffmpeg) и
+    отпечаток (fpcalc). Выполняется в процессе пула; файл отображается в память
+    (mmap), а не читается целиком — копии содержимого в процессе нет.
+    """
+    size = os.path.getsize(path)
+    info = {}
+    if size:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            info = probe(data)
+    if ffmpeg:
+        _ffmpeg(path, ffmpeg, info)
+    if fpcalc:
+        _fpcalc(path, fpcalc, info)
+    if info.get("duration") and "bitrate" not in info:
+        info["bitrate"] = round(size * 8 / info["duration"] / 1000)
+    return info
+
+
+# --- сравнение отпечатков ---
+def similarity(a, b, max_shift=MAX_SHIFT):
+    """Доля совпадающих бит двух отпечатков при лучшем сдвиге (0.5 — случайные, 1.0 — одинаковые)."""
+    best = 0.0
+    for shift in range(-max_shift, max_shift + 1):
+        x, y = (a[shift * 4:], b) if shift >= 0 else (a, b[-shift * 4:])
+        overlap = min(len(x), len(y)) // 4
+        if overlap < MIN_OVERLAP:
+            continue
+        # перекрытие целиком как одно большое число: XOR и подсчёт бит на стороне C
+        diff = (int.from_bytes(x[:overlap * 4], "little") ^ int.from_bytes(y[:overlap * 4], "little")).bit_count()
+        best = max(best, 1 - diff / (32 * overlap))
+    return best
+
+
+def best_match(fingerprint, candidates, threshold):
+    """Самый похожий из candidates [(track_id, отпечаток)] не ниже threshold: (track_id, похожесть) или None."""
+    best = None
+    for track_id, other in candidates:
+        score = similarity(fingerprint, other)
+        if score >= threshold and (best is None or score > best[1]):
+            best = (track_id, score)
+    return best
@@ -0,0 +1,137 @@
+# utils/callbacks.py
+"""
+callback_data кнопок: типизированные фабрики aiogram CallbackData с короткими
+префиксами ("p:12", "a:5:n:kx3f1a.2s") и таблица префикс -> хендлер.
+Callback маршрутизируется одним поиском в словаре по префиксу (до первого ":")
+вместо перебора фильтров всех роутеров; хендлер получает разобранные данные
+аргументом callback_data. Кнопки без параметров регистрируются строкой ("back_main").
+"""
+from typing import Optional
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+
+SEP = ":"
+STALE_TEXT = "⚠️ Кнопка устарела, открой меню заново: /start"
+
+
+# --- треки ---
+class PlayTrack(CallbackData, prefix="p"):
+    track_id: int
+
+
+class ListenTrack(CallbackData, prefix="l"):
+    track_id: int
+
+
+class DeleteTrack(CallbackData, prefix="d"):
+    track_id: int
+
+
+class PublishTrack(CallbackData, prefix="pub"):
+    track_id: int
+    artist_id: Optional[int] = None  # None — выбрать карточку автоматически или спросить
+
+
+# --- списки с постраничной навигацией: nav "n"/"p" и курсор key (см. utils/pagination.py) ---
+class CatalogPage(CallbackData, prefix="c"):
+    nav: Optional[str] = None
+    key: Optional[str] = None
+
+
+class ArtistsPage(CallbackData, prefix="as"):
+    nav: Optional[str] = None
+    key: Optional[str] = None
+
+
+class ArtistPage(CallbackData, prefix="a"):
+    artist_id: int
+    nav: Optional[str] = None
+    key: Optional[str] = None
+
+
+class SubsPage(CallbackData, prefix="sb"):
+    nav: Optional[str] = None
+    key: Optional[str] = None
+
+
+# --- артисты ---
+class FollowArtist(CallbackData, prefix="f"):
+    artist_id: int
+    follow: bool
+
+
+class UploadArtist(CallbackData, prefix="ua"):
+    artist_id: int
+
+
+class MetadataArtist(CallbackData, prefix="ma"):
+    artist_id: int
+
+
+class CallbackTable:
+    """Маршрутизатор callback_query: префикс callback_data -> (фабрика, хендлер)."""
+
+    def __init__(self, name="callbacks"):
+        self.router = Router(name=name)
+        self.router.callback_query.register(self._dispatch)
+        self._routes = {}
+        # старый формат "listen_12" / "my_catalog" в уже отправленных сообщениях -> фабрика
+        self._legacy = {}
+
+    def route(self, target, legacy=None):
+        """
+        Декоратор хендлера для фабрики CallbackData или строки-кнопки без параметров.
+        legacy — префикс старого формата callback_data ("listen" для "listen_12").
+        """
+        prefix = target if isinstance(target, str) else target.__prefix__
+        factory = None if isinstance(target, str) else target
+
+        def decorator(handler):
+            if prefix in self._routes:
+                raise ValueError(f"Префикс callback_data {prefix!r} уже занят")
+            self._routes[prefix] = (factory, CallableObject(handler))
+            if legacy is not None:
+                self._legacy[legacy] = factory
+            return handler
+
+        return decorator
+
+    def resolve(self, data):
+        """Префикс маршрута, которому достанется callback_data (старый формат — после перевода); None — нет такого."""
+        prefix = data.partition(SEP)[0]
+        if prefix in self._routes:
+            return prefix
+        parsed = self._from_legacy(data)
+        return parsed.__prefix__ if parsed is not None else None
+
+    def _from_legacy(self, data):
+        name, _, tail = data.rpartition("_")
+        factory = self._legacy.get(name)
+        if factory is not None and tail.isdigit():
+            return factory(**{next(iter(factory.model_fields)): int(tail)})
+        factory = self._legacy.get(data)
+        return factory() if factory is not None else None
+
+    async def _dispatch(self, callback: CallbackQuery, **data):
+        value = callback.data or ""
+        route = self._routes.get(value.partition(SEP)[0])
+        if route is not None:
+            factory, handler = route
+            if factory is not None:
+                try:
+                    data["callback_data"] = factory.unpack(value)
+                except (TypeError, ValueError):
+                    return callback.answer(STALE_TEXT)
+            return await handler.call(callback, **data)
+
+        parsed = self._from_legacy(value)
+        if parsed is None:
+            return callback.answer(STALE_TEXT)
+        _, handler = self._routes[parsed.__prefix__]
+        data["callback_data"] = parsed
+        return await handler.call(callback, **data)
+
+
+callbacks = CallbackTable()
@@ -0,0 +1,103 @@
+# utils/campaigns.py
+import asyncio
+import logging
+import time
+from config import CAMPAIGN_RATE
+from db_instance import db
+from utils.delivery import record_report
+from utils.notify import broadcast, TokenBucket, SENT
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignRunner:
+    """
+    Фоновая рассылка кампаний (например, объявлений о новой версии) параллельно
+    с обработкой апдейтов, не быстрее rate сообщений в секунду.
+    Получатели — доставляемые пользователи по возрастанию telegram_id до
+    upper_bound кампании (зарегистрировавшиеся после её создания не входят). Курсор
+    кампании сдвигается после каждого получателя, как только все до него
+    обработаны, — после рестарта рассылка продолжается с того же места.
+    """
+
+    def __init__(self, rate=CAMPAIGN_RATE, batch_size=100, poll_interval=60.0):
+        self.rate = rate
+        # один ограничитель на все пачки и кампании
+        self.bucket = TokenBucket(rate)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        # key -> (время начала в этом процессе, обработано с тех пор) для оценки скорости
+        self._speed = {}
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def run(self, bot):
+        while True:
+            try:
+                for campaign in await db.get_running_campaigns():
+                    await self._process(bot, campaign)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка рассылки кампании")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _process(self, bot, campaign):
+        campaign_id, key, text, parse_mode, cursor, upper_bound = campaign
+        logger.info("Кампания %s: рассылка с telegram_id > %s", key, cursor)
+        self._speed[key] = (time.monotonic(), 0)
+        while True:
+            batch = await db.get_deliverable_after(cursor, self.batch_size, upper_bound)
+            if not batch:
+                break
+            results = {}
+            position = 0
+
+            async def on_result(result):
+                # доставки завершаются не по порядку: курсор двигается по непрерывному префиксу пачки
+                nonlocal position
+                results[result.user_id] = result.status
+                start = position
+                while position < len(batch) and batch[position] in results:
+                    position += 1
+                if position == start:
+                    return
+                done = [results[uid] for uid in batch[start:position]]
+                sent = sum(status == SENT for status in done)
+                await db.advance_campaign(campaign_id, batch[position - 1], sent, len(done) - sent)
+                started, processed = self._speed[key]
+                self._speed[key] = (started, processed + len(done))
+
+            report = await broadcast(bot, batch, text, parse_mode=parse_mode, rate=self.rate, on_result=on_result,
+                                     bucket=self.bucket)
+            await record_report(report)
+            if position < len(batch):
+                # broadcast пропускает повторы id — без результата, но они тоже обработаны
+                await db.advance_campaign(campaign_id, batch[-1], 0, 0)
+            cursor = batch[-1]
+        await db.finish_campaign(campaign_id)
+        self._speed.pop(key, None)
+        logger.info("Кампания %s завершена", key)
+
+    def eta(self, key, remaining):
+        """Оценка оставшегося времени, секунд: по скорости в этом процессе, а до первых замеров — по rate."""
+        started, processed = self._speed.get(key, (None, 0))
+        elapsed = time.monotonic() - started if started else 0
+        speed = processed / elapsed if processed and elapsed > 5 else self.rate
+        return remaining / speed
+
+    async def progress(self):
+        """Последние кампании: [(key, status, total, sent, failed, осталось, ETA в секундах или None)]."""
+        rows = await db.get_campaigns()
+        return [(key, status, total, sent, failed, remaining,
+                 self.eta(key, remaining) if status == "running" else None)
+                for key, status, total, sent, failed, remaining, _, _ in rows]
+
+
+campaigns = CampaignRunner()
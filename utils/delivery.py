@@ -0,0 +1,27 @@
+# utils/delivery.py
+from aiogram import BaseMiddleware
+from db_instance import db
+from utils.notify import BLOCKED, UNREACHABLE
+
+
+async def record_report(report):
+    """
+    Сохраняет итоги рассылки в состояние доставки пользователей одной транзакцией.
+    Ошибки самого сообщения (BAD_REQUEST) и временные сбои (FAILED) получателю не засчитываются.
+    """
+    if report.results:
+        await db.record_delivery(report.sent, report.errors(BLOCKED), report.errors(UNREACHABLE))
+
+
+class ReachabilityMiddleware(BaseMiddleware):
+    """
+    Внешний middleware апдейтов: пользователь, исключённый из рассылок, при любом
+    своём апдейте возвращается в них. Для уже активных — только проверка кеша.
+    """
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        # о блокировке/разблокировке бота сообщает my_chat_member, его разбирает хендлер
+        if user is not None and not user.is_bot and event.my_chat_member is None:
+            await db.ensure_reachable(user.id)
+        return await handler(event, data)
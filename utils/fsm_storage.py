@@ -0,0 +1,143 @@
+# utils/fsm_storage.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StorageKey, StateType
+from config import FSM_TTL, FSM_HOT_SIZE, FSM_FLUSH_INTERVAL
+from db_instance import db
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    __slots__ = ("state", "data", "updated_at", "dirty")
+
+    def __init__(self, state=None, data=None, updated_at=0.0):
+        self.state = state
+        self.data = data or {}
+        self.updated_at = updated_at
+        self.dirty = False
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в SQLite с горячим слоем в памяти.
+    Изменения копятся в памяти и раз в flush_interval одной транзакцией
+    записываются в таблицу fsm_state (несколько set_state/set_data подряд —
+    одна запись). В памяти держится не больше hot_size сессий, сессии без
+    изменений дольше ttl секунд удаляются. Незаконченные загрузки переживают рестарт.
+    """
+
+    def __init__(self, ttl=FSM_TTL, hot_size=FSM_HOT_SIZE, flush_interval=FSM_FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.hot_size = hot_size
+        self.flush_interval = flush_interval
+        self.key_builder = DefaultKeyBuilder(with_destiny=True)
+        self._hot = OrderedDict()
+        self._flusher = None
+        self._last_expire = 0.0
+
+    async def _record(self, key: StorageKey) -> _Record:
+        k = self.key_builder.build(key)
+        record = self._hot.get(k)
+        if record is None:
+            row = await db.fsm_load(k)
+            record = self._hot.get(k)  # пока ждали БД, запись могла появиться
+            if record is None:
+                record = _Record()
+                if row and row[2] >= time.time() - self.ttl:
+                    record = _Record(row[0], row[1], row[2])
+                self._hot[k] = record
+                self._evict()
+        self._hot.move_to_end(k)
+        return record
+
+    def _touch(self, record: _Record):
+        record.updated_at = time.time()
+        record.dirty = True
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    def _evict(self):
+        # вытесняем только уже записанные в БД сессии; грязные уйдут после ближайшего flush
+        if len(self._hot) <= self.hot_size:
+            return
+        for k in list(self._hot)[:-1]:  # последнюю (только что запрошенную) не трогаем
+            if len(self._hot) <= self.hot_size:
+                break
+            if not self._hot[k].dirty:
+                del self._hot[k]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(record)
+
+    async def get_state(self, key: StorageKey):
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data) -> None:
+        record = await self._record(key)
+        record.data = data.copy()
+        self._touch(record)
+
+    async def get_data(self, key: StorageKey):
+        return (await self._record(key)).data.copy()
+
+    async def flush(self):
+        """Записывает все изменённые сессии в БД одной пачкой."""
+        save, delete = [], []
+        for k, record in self._hot.items():
+            if not record.dirty:
+                continue
+            record.dirty = False
+            if record.state is None and not record.data:
+                delete.append(k)
+            else:
+                save.append((k, record.state, record.data, record.updated_at))
+        try:
+            if save:
+                await db.fsm_save_many(save)
+            if delete:
+                await db.fsm_delete_many(delete)
+        except Exception:
+            # вернём флаг, чтобы попробовать снова на следующем цикле
+            for k, *_ in save:
+                if k in self._hot:
+                    self._hot[k].dirty = True
+            for k in delete:
+                if k in self._hot:
+                    self._hot[k].dirty = True
+            raise
+        self._evict()
+
+    async def expire(self):
+        """Удаляет брошенные сессии из памяти и из БД."""
+        deadline = time.time() - self.ttl
+        for k in [k for k, r in self._hot.items() if r.updated_at < deadline and not r.dirty]:
+            del self._hot[k]
+        removed = await db.fsm_expire(deadline)
+        if removed:
+            logger.info("FSM: удалено просроченных сессий: %s", removed)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_expire > min(self.ttl, 600):
+                    self._last_expire = time.monotonic()
+                    await self.expire()
+            except Exception:
+                logger.exception("Ошибка записи FSM в БД")
+
+    def stats(self):
+        return {"hot": len(self._hot), "dirty": sum(1 for r in self._hot.values() if r.dirty)}
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
@@ -0,0 +1,133 @@
+# utils/instrumentation.py
+import re
+import time
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.exceptions import (TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError,
+                                TelegramRetryAfter)
+from aiogram.types import CallbackQuery, InlineQuery, Message
+from db_instance import db
+from keyboards import markup_cache_stats
+from utils import metrics
+from utils.analysis import analyzer
+from utils.callbacks import callbacks
+from utils.scheduler import scheduler
+from utils.storage_queue import archiver
+
+# "p:12" -> p, "a:5:n:..." -> a, "back_main" -> back_main, старый формат "listen_12" -> listen
+_CALLBACK_PREFIX = re.compile(r"[a-z_]*?[a-z](?=_?\d|:|$)")
+
+
+def event_label(event):
+    """Короткая метка апдейта для метрик: префикс callback_data, команда или тип сообщения."""
+    if isinstance(event, CallbackQuery):
+        match = _CALLBACK_PREFIX.match(event.data or "")
+        return "cb:" + (match.group(0) if match else "other")
+    if isinstance(event, Message):
+        if event.text and event.text.startswith("/"):
+            return event.text.split()[0].split("@")[0][:32]
+        return "msg:" + event.content_type
+    if isinstance(event, InlineQuery):
+        return "inline"
+    return type(event).__name__
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware роутера: время обработки и исключения по роутеру и метке апдейта.
+    Апдейты, которые роутер не обработал (UNHANDLED), не учитываются.
+    resolve(callback_data) — для роутера таблицы callback'ов: в метку роутера идёт префикс
+    маршрута, который выберет таблица, а не общее имя "callbacks".
+    """
+
+    def __init__(self, router_name, resolve=None):
+        self.router_name = router_name
+        self.resolve = resolve
+
+    def _router_label(self, event):
+        if self.resolve is None:
+            return self.router_name
+        return f"{self.router_name}:{self.resolve(event.data or '') or 'stale'}"
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+        except Exception:
+            label = event_label(event)
+            router = self._router_label(event)
+            metrics.handler_errors.inc(router, label)
+            metrics.handler_seconds.observe(time.perf_counter() - started, router, label)
+            raise
+        if result is not UNHANDLED:
+            metrics.handler_seconds.observe(time.perf_counter() - started, self._router_label(event),
+                                            event_label(event))
+        return result
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время и результат каждого вызова Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        outcome = "ok"
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            outcome = "retry_after"
+            raise
+        except TelegramForbiddenError:
+            outcome = "forbidden"
+            raise
+        except TelegramBadRequest:
+            outcome = "bad_request"
+            raise
+        except TelegramNetworkError:
+            outcome = "network"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            metrics.api_seconds.observe(time.perf_counter() - started, name)
+            metrics.api_calls.inc(name, outcome)
+
+
+def instrument_dispatcher(dp):
+    """Вешает HandlerMetricsMiddleware на все наблюдатели с хендлерами во вложенных роутерах."""
+    for router in dp.sub_routers:
+        resolve = callbacks.resolve if router is callbacks.router else None
+        for event_name, observer in router.observers.items():
+            if event_name not in ("update", "error") and observer.handlers:
+                observer.outer_middleware(HandlerMetricsMiddleware(router.name, resolve))
+
+
+def instrument_bot(bot):
+    bot.session.middleware(ApiMetricsMiddleware())
+
+
+def register_runtime_gauges(storage):
+    """
+    Размеры кешей, FSM-сессий в памяти, планировщика апдейтов, очередей архивации и анализа —
+    считаются при каждом запросе /metrics.
+    """
+    @metrics.collector
+    def runtime_gauges():
+        caches = {f"db_{name}": stats for name, stats in db.cache_stats().items()}
+        caches["markups"] = markup_cache_stats()
+        return [
+            ("bot_cache_entries", "Записей в кеше",
+             {(("cache", name),): s["size"] for name, s in caches.items()}),
+            ("bot_cache_hit_ratio", "Доля попаданий в кеш",
+             {(("cache", name),): s["hit_ratio"] for name, s in caches.items()}),
+            ("bot_fsm_sessions", "FSM-сессий в памяти",
+             {(("kind", k),): v for k, v in storage.stats().items()}),
+            ("bot_scheduler_updates", "Апдейты в планировщике",
+             {(("kind", k),): v for k, v in scheduler.stats().items()}),
+            ("bot_storage_queue", "Задания архивации в очереди",
+             {(("kind", k),): v for k, v in archiver.stats().items()}),
+            ("bot_analysis_queue", "Треки в очереди анализа аудио",
+             {(("kind", k),): v for k, v in analyzer.stats().items()}),
+        ]
@@ -0,0 +1,163 @@
+# utils/metrics.py
+"""
+Метрики в текстовом формате Prometheus без внешних зависимостей.
+Счётчики и гистограммы потокобезопасны: время запросов к БД пишется из
+потоков пула. Число комбинаций меток у метрики ограничено — лишние сводятся
+в "other", чтобы произвольный callback_data не раздувал память.
+"""
+import bisect
+import logging
+import threading
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SERIES = 500
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, values):
+        key = tuple(str(v) for v in values)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            key = ("other",) * len(self.labels)
+        return key
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = list(self._series.items())
+        for values, value in series:
+            lines.extend(self._render_series(values, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            key = self._key(values)
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, values, value):
+        return [f"{self.name}{_format_labels(self.labels, values)} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds, *values):
+        with self._lock:
+            key = self._key(values)
+            series = self._series.get(key)
+            if series is None:
+                # счётчики по корзинам (последняя — +Inf), сумма, количество
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def _render_series(self, values, value):
+        counts, total, count = value
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            labels = _format_labels(self.labels, values, f'le="{le}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labels, values)
+        lines.append(f"{self.name}_sum{labels} {total}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def collector(fn):
+    """
+    Регистрирует источник gauge-метрик (размеры очередей, кешей и т.п.).
+    fn() вызывается при каждом запросе /metrics и возвращает список
+    (name, help, series), где series — {((метка, значение), ...): число}.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for fn in _collectors:
+        try:
+            gauges = fn()
+        except Exception:
+            logger.exception("Ошибка сбора метрик %s", fn.__name__)
+            continue
+        for name, help_text, series in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in series.items():
+                names = [k for k, _ in labels]
+                values = [v for _, v in labels]
+                lines.append(f"{name}{_format_labels(names, values)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def _metrics_view(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(host, port):
+    """Поднимает отдельный aiohttp-сервер с GET /metrics. Возвращает runner для cleanup()."""
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
+
+
+# --- метрики бота ---
+handler_seconds = Histogram("bot_handler_seconds", "Время обработки апдейта хендлером",
+                            ("router", "event"))
+handler_errors = Counter("bot_handler_errors_total", "Исключения в хендлерах", ("router", "event"))
+db_seconds = Histogram("bot_db_seconds", "Время выполнения метода Database", ("method",))
+db_wait_seconds = Histogram("bot_db_wait_seconds", "Ожидание свободного потока БД", ("kind",))
+db_group_size = Histogram("bot_db_group_commit_size", "Записей в одном групповом коммите", (),
+                          buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+db_errors = Counter("bot_db_errors_total", "Исключения в методах Database", ("method",))
+api_seconds = Histogram("bot_api_seconds", "Время вызова Telegram Bot API", ("method",))
+api_calls = Counter("bot_api_calls_total", "Вызовы Telegram Bot API по результату", ("method", "outcome"))
+scheduler_wait_seconds = Histogram("bot_scheduler_wait_seconds", "Ожидание апдейта в очереди планировщика")
+scheduler_dropped = Counter("bot_scheduler_dropped_total", "Апдейты, отброшенные планировщиком", ("reason",))
+analysis_seconds = Histogram("bot_analysis_seconds", "Этапы анализа аудио", ("stage",),
+                            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
@@ -1,21 +1,173 @@
 ﻿# utils/notify.py
 import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+from config import BROADCAST_RATE
 
-async def broadcast(bot, user_ids: list[int], message: str, parse_mode: str = None, delay: float = 0.05):
+logger = logging.getLogger(__name__)
+
+# статусы доставки
+SENT = "sent"
+BLOCKED = "blocked"          # пользователь заблокировал бота / удалил аккаунт
+UNREACHABLE = "unreachable"  # чат не найден: аккаунт удалён или пользователь не писал боту
+BAD_REQUEST = "bad_request"  # неверная разметка, слишком длинный текст и т.п. — ошибка самого сообщения
+FAILED = "failed"            # исчерпаны повторы после сетевых ошибок / RetryAfter
+
+# ответы на BadRequest, которые говорят о получателе, а не о сообщении
+_UNREACHABLE_ERRORS = ("chat not found", "user not found", "peer_id_invalid")
+
+
+class TokenBucket:
+    """
+    Глобальный ограничитель скорости: rate токенов в секунду, запас до capacity.
+    pause() останавливает выдачу токенов для всех отправителей сразу (для RetryAfter).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class DeliveryResult:
+    user_id: int
+    status: str
+    attempts: int = 0
+    error: str = None
+
+
+@dataclass
+class BroadcastReport:
+    results: dict = field(default_factory=dict)
+
+    def _with_status(self, *statuses):
+        return [uid for uid, r in self.results.items() if r.status in statuses]
+
+    @property
+    def sent(self) -> list[int]:
+        return self._with_status(SENT)
+
+    @property
+    def blocked(self) -> list[int]:
+        return self._with_status(BLOCKED)
+
+    @property
+    def failed(self) -> list[int]:
+        """Все, кому сообщение не доставлено (включая заблокировавших)."""
+        return self._with_status(BLOCKED, UNREACHABLE, BAD_REQUEST, FAILED)
+
+    def errors(self, *statuses) -> list[tuple]:
+        """[(user_id, текст ошибки)] для получателей с указанными статусами."""
+        return [(uid, r.error) for uid, r in self.results.items() if r.status in statuses]
+
+    def __len__(self):
+        return len(self.results)
+
+
+async def _deliver(bot, bucket, uid, text, send_kwargs, max_retries, reply_markup=None):
+    attempts = 0
+    if reply_markup is not None:
+        send_kwargs = {**send_kwargs, "reply_markup": reply_markup}
+    while True:
+        attempts += 1
+        await bucket.acquire()
+        try:
+            await bot.send_message(uid, text, **send_kwargs)
+            return DeliveryResult(uid, SENT, attempts)
+        except TelegramRetryAfter as e:
+            # флуд-лимит общий для бота: тормозим весь конвейер и пробуем снова
+            logger.warning("RetryAfter %ss при рассылке, пауза", e.retry_after)
+            bucket.pause(e.retry_after)
+            if attempts > max_retries:
+                return DeliveryResult(uid, FAILED, attempts, str(e))
+        except TelegramForbiddenError as e:
+            return DeliveryResult(uid, BLOCKED, attempts, str(e))
+        except TelegramBadRequest as e:
+            status = UNREACHABLE if any(s in str(e).lower() for s in _UNREACHABLE_ERRORS) else BAD_REQUEST
+            return DeliveryResult(uid, status, attempts, str(e))
+        except TelegramNetworkError as e:
+            if attempts > max_retries:
+                return DeliveryResult(uid, FAILED, attempts, str(e))
+            await asyncio.sleep(0.5 * 2 ** (attempts - 1))
+        except Exception as e:
+            return DeliveryResult(uid, FAILED, attempts, str(e))
+
+
+async def _iterate(user_ids):
+    if hasattr(user_ids, "__aiter__"):
+        async for uid in user_ids:
+            yield uid
+    else:
+        for uid in user_ids:
+            yield uid
+
+
+async def broadcast(bot, user_ids, message, parse_mode: str = None, exclude=None,
+                    rate: float = BROADCAST_RATE, concurrency: int = None, max_retries: int = 3,
+                    on_result=None, bucket: TokenBucket = None, **send_kwargs) -> BroadcastReport:
     """
-    Рассылает сообщение всем пользователям.
-    Возвращает список ID пользователей, которым не удалось отправить сообщение.
+    Рассылает сообщение пользователям параллельно, не быстрее rate сообщений в секунду.
+    user_ids — список или асинхронный итератор (например, db.iter_deliverable_users()).
+    message — строка или функция uid -> текст либо (текст, reply_markup);
+    None — не отправлять этому пользователю.
+    on_result — корутина-функция (DeliveryResult), вызывается после каждой доставки.
+    bucket — общий TokenBucket для рассылки пачками: иначе у каждого вызова свой запас в rate сообщений.
+    Возвращает BroadcastReport с результатом по каждому получателю.
     """
-    failed = []
+    exclude = set(exclude or ())
+    bucket = bucket or TokenBucket(rate)
+    limit = asyncio.Semaphore(concurrency or max(1, int(rate)))
+    send_kwargs["parse_mode"] = parse_mode
+    report = BroadcastReport()
+    seen = set()
+    tasks = set()
 
-    for uid in user_ids:
+    async def run(uid, text, markup):
         try:
-            await bot.send_message(uid, message, parse_mode=parse_mode)
-            await asyncio.sleep(delay)
-        except (TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter):
-            failed.append(uid)
-        except Exception:
-            failed.append(uid)
-
-    return failed
+            result = report.results[uid] = await _deliver(bot, bucket, uid, text, send_kwargs, max_retries, markup)
+            if on_result is not None:
+                await on_result(result)
+        finally:
+            limit.release()
+
+    async for uid in _iterate(user_ids):
+        if uid in exclude or uid in seen:
+            continue
+        seen.add(uid)
+        text = message(uid) if callable(message) else message
+        if text is None:
+            continue
+        text, markup = text if isinstance(text, tuple) else (text, None)
+        await limit.acquire()
+        task = asyncio.create_task(run(uid, text, markup))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    return report
@@ -0,0 +1,143 @@
+# utils/outbox.py
+import asyncio
+import logging
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from config import NOTIFY_MODE, DIGEST_WINDOW, DIGEST_MAX_ITEMS, BROADCAST_RATE
+from db_instance import db
+from utils.callbacks import ArtistPage, ListenTrack
+from utils.notify import broadcast, TokenBucket
+from utils.delivery import record_report
+
+logger = logging.getLogger(__name__)
+
+
+def render_event(kind, payload):
+    """Текст уведомления для события outbox."""
+    if kind == "new_track":
+        return f"🎵 {payload['artist_name']} выложил новый трек: «{payload['title']}»"
+    if kind == "new_release":
+        titles = payload["titles"]
+        shown = ", ".join(f"«{t}»" for t in titles[:3])
+        more = f" и ещё {len(titles) - 3}" if len(titles) > 3 else ""
+        return f"💿 {payload['artist_name']} выложил релиз из {len(titles)} треков: {shown}{more}"
+    raise ValueError(f"Неизвестный тип события outbox: {kind}")
+
+
+def _event_button(kind, payload):
+    if kind == "new_track":
+        return InlineKeyboardButton(text=f"▶️ {payload['artist_name']} — {payload['title']}",
+                                    callback_data=ListenTrack(track_id=payload["track_id"]).pack())
+    return InlineKeyboardButton(text=f"💿 {payload['artist_name']}",
+                                callback_data=ArtistPage(artist_id=payload["artist_id"]).pack())
+
+
+def render_digest(events):
+    """Одно сообщение со всеми событиями [(kind, payload)] и кнопкой на каждое: (текст, клавиатура)."""
+    if len(events) == 1:
+        text = render_event(*events[0])
+    else:
+        lines = [f"• {render_event(kind, payload)}" for kind, payload in events]
+        text = "🔔 Новое в общем плейлисте:\n\n" + "\n".join(lines)
+    markup = InlineKeyboardMarkup(inline_keyboard=[[_event_button(kind, payload)] for kind, payload in events])
+    return text, markup
+
+
+class OutboxWorker:
+    """
+    Фоновая рассылка событий из таблицы outbox.
+    В режиме digest события копятся digest_window секунд от самого старого
+    (или пока их не наберётся digest_max_items) и уходят каждому получателю
+    одним сообщением со списком и кнопками; в режиме instant — по одному.
+    Получатели — подписчики артистов из событий и пользователи с follow_all;
+    они обходятся пачками по возрастанию telegram_id, после каждой пачки
+    курсор всех событий сводки сохраняется в БД — после рестарта рассылка
+    продолжается с того же места и в том же составе.
+    """
+
+    def __init__(self, batch_size=100, poll_interval=5.0, mode=NOTIFY_MODE,
+                 digest_window=DIGEST_WINDOW, digest_max_items=DIGEST_MAX_ITEMS):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.mode = mode
+        self.digest_window = digest_window
+        self.digest_max_items = digest_max_items
+        self.bucket = TokenBucket(BROADCAST_RATE)
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Сообщить воркеру, что появились новые события (иначе он заметит их по таймеру)."""
+        self._wakeup.set()
+
+    def _next_group(self, events):
+        """События, которые пора разослать одним сообщением, и пауза до следующей проверки (None — ждать событий)."""
+        if not events:
+            return [], None
+        cursor = events[0][3]
+        if cursor:
+            # сводка, начатая до рестарта
+            return [e for e in events if e[3] == cursor], 0
+        if self.mode == "instant":
+            return events[:1], 0
+        fresh = [e for e in events if not e[3]][:self.digest_max_items]
+        age = events[0][4]
+        if len(fresh) >= self.digest_max_items or age >= self.digest_window:
+            return fresh, 0
+        return [], self.digest_window - age
+
+    async def run(self, bot):
+        while True:
+            delay = None
+            try:
+                events = await db.get_pending_outbox(max(self.digest_max_items, 1))
+                group, delay = self._next_group(events)
+                if group:
+                    await self._process(bot, group)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ошибка обработки outbox")
+                delay = None
+            if delay != 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval if delay is None else delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _process(self, bot, group):
+        event_ids = [e[0] for e in group]
+        events = [(e[1], e[2]) for e in group]
+        cursor = group[0][3]
+        artist_ids = sorted({payload["artist_id"] for _, payload in events if payload.get("artist_id")})
+        rendered = {}
+
+        while True:
+            batch = await db.get_subscribers_after(artist_ids, cursor, self.batch_size)
+            if not batch:
+                break
+            wanted = {}
+            for uid, everything, followed in batch:
+                # только подписки получателя и не его собственные треки
+                wanted[uid] = tuple(
+                    i for i, (_, payload) in enumerate(events)
+                    if payload.get("sender") != uid and (everything or payload.get("artist_id") in followed)
+                )
+
+            def message(uid):
+                items = wanted[uid]
+                if not items:
+                    return None
+                if items not in rendered:
+                    rendered[items] = render_digest([events[i] for i in items])
+                return rendered[items]
+
+            report = await broadcast(bot, list(wanted), message, bucket=self.bucket)
+            await record_report(report)
+            if report.failed:
+                logger.info("Outbox %s: не доставлено %s", event_ids, report.failed)
+            cursor = batch[-1][0]
+            await db.advance_outbox(event_ids, cursor)
+        await db.complete_outbox(event_ids)
+
+
+outbox = OutboxWorker()
@@ -0,0 +1,78 @@
+# utils/pagination.py
+"""
+Постраничные списки в inline-клавиатурах на keyset-курсорах.
+Курсор зашивается в callback_data кнопок навигации (поля nav и key фабрик
+из utils/callbacks.py): n — следующая страница после key, p — предыдущая перед key.
+"""
+import calendar
+import time
+from dataclasses import dataclass
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+PAGE_SIZE = 10
+
+_B36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+_TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def b36(n: int) -> str:
+    if n == 0:
+        return "0"
+    out = []
+    while n:
+        n, r = divmod(n, 36)
+        out.append(_B36[r])
+    return "".join(reversed(out))
+
+
+def encode_track_key(created_at, track_id) -> str:
+    """(created_at, id) -> компактная строка 'ts36.id36' для callback_data."""
+    ts = calendar.timegm(time.strptime(created_at, _TS_FORMAT)) if created_at else 0
+    return f"{b36(ts)}.{b36(track_id)}"
+
+
+def decode_track_key(key: str):
+    ts, tid = key.split(".")
+    return time.strftime(_TS_FORMAT, time.gmtime(int(ts, 36))), int(tid, 36)
+
+
+def encode_id_key(row_id) -> str:
+    return b36(row_id)
+
+
+def decode_id_key(key: str) -> int:
+    return int(key, 36)
+
+
+@dataclass
+class Page:
+    rows: list
+    has_prev: bool
+    has_next: bool
+
+
+def make_page(rows, cursor, backward, limit=PAGE_SIZE) -> Page:
+    """Строит страницу из результата запроса на limit + 1 строк."""
+    more = len(rows) > limit
+    if backward:
+        rows = rows[-limit:] if more else rows
+        return Page(rows, has_prev=more, has_next=cursor is not None)
+    return Page(rows[:limit], has_prev=cursor is not None, has_next=more)
+
+
+def page_keyboard(page: Page, button, nav, key, footer=()) -> InlineKeyboardMarkup:
+    """
+    Клавиатура страницы: по кнопке на строку (button(row)), ряд навигации
+    и дополнительные ряды footer. key(row) — курсор строки, nav(direction, cursor) —
+    callback_data кнопки навигации.
+    """
+    rows = [[button(r)] for r in page.rows]
+    buttons = []
+    if page.has_prev and page.rows:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=nav("p", key(page.rows[0]))))
+    if page.has_next and page.rows:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=nav("n", key(page.rows[-1]))))
+    if buttons:
+        rows.append(buttons)
+    rows.extend(footer)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
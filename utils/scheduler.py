@@ -0,0 +1,167 @@
+# utils/scheduler.py
+import asyncio
+import contextlib
+import time
+from collections import Counter
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.methods import GetUpdates
+from config import SCHEDULER_CONCURRENCY, SCHEDULER_USER_QUEUE, SCHEDULER_MAX_PENDING
+from utils import metrics
+
+OVERLOAD_TEXT = "⏳ Бот перегружен, попробуй чуть позже."
+RESEND_TEXT = "⏳ Бот перегружен, и это сообщение не обработано. Отправь его ещё раз чуть позже."
+# сообщения не отбрасываются по max_pending, а ждут; предел на случай, когда источник не умеет ждать (вебхук)
+HARD_LIMIT_FACTOR = 4
+
+
+class _UserQueue:
+    __slots__ = ("lock", "pending", "callbacks")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+        # (сообщение, callback_data) -> сколько таких нажатий ждут или обрабатываются
+        self.callbacks = Counter()
+
+
+class UpdateScheduler(BaseMiddleware):
+    """
+    Внешний middleware апдейтов, стоит до FSM: апдейты одного пользователя
+    обрабатываются строго по очереди (FSM-состояние читается уже в очереди),
+    всего одновременно — не больше concurrency.
+    Повторное нажатие той же кнопки, пока предыдущее ещё ждёт или обрабатывается,
+    схлопывается. Нажатия кнопок сверх user_queue у одного пользователя или сверх
+    max_pending всего отбрасываются с ответом «попробуй позже» — их легко повторить.
+    Сообщения (загрузки, ввод в FSM-сценариях) встают в очередь: источник апдейтов
+    притормаживается через wait_room() (PollingBackpressure, процессы кластера), и
+    только сверх max_pending * HARD_LIMIT_FACTOR сообщение отбрасывается с просьбой
+    отправить его ещё раз.
+    """
+
+    def __init__(self, concurrency=SCHEDULER_CONCURRENCY, user_queue=SCHEDULER_USER_QUEUE,
+                 max_pending=SCHEDULER_MAX_PENDING):
+        self.concurrency = concurrency
+        self.user_queue = user_queue
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(concurrency)
+        self._users = {}
+        self._pending = 0
+        self._running = 0
+        self._room = asyncio.Event()
+        self._room.set()
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        callback = event.callback_query
+        key = None
+        if callback is not None:
+            message_id = callback.message.message_id if callback.message else callback.inline_message_id
+            key = (message_id, callback.data)
+
+        queue = self._users.get(user.id) if user is not None else None
+        if callback is not None:
+            if queue is not None and queue.callbacks[key]:
+                return self._drop(event, "duplicate")
+            if self._pending >= self.max_pending:
+                return self._drop(event, "overload")
+            if queue is not None and queue.pending >= self.user_queue:
+                return self._drop(event, "user_queue")
+        elif self._pending >= self.max_pending * HARD_LIMIT_FACTOR:
+            return self._drop(event, "overflow")
+
+        # место в очереди занимается до первого await — порядок апдейтов пользователя сохраняется
+        if queue is None and user is not None:
+            queue = self._users[user.id] = _UserQueue()
+        self._admit(queue, key)
+        queued_at = time.perf_counter()
+        try:
+            async with queue.lock if queue is not None else contextlib.nullcontext(), self._slots:
+                metrics.scheduler_wait_seconds.observe(time.perf_counter() - queued_at)
+                self._running += 1
+                try:
+                    return await handler(event, data)
+                finally:
+                    self._running -= 1
+        finally:
+            self._release(user.id if user is not None else None, queue, key)
+
+    @contextlib.asynccontextmanager
+    async def user_turn(self, user_id):
+        """
+        Место в очереди пользователя для работы вне апдейта (альбом, собранный в фоне):
+        тело выполняется между его апдейтами, а не параллельно с ними.
+        """
+        queue = self._users.get(user_id)
+        if queue is None:
+            queue = self._users[user_id] = _UserQueue()
+        self._admit(queue, None)
+        try:
+            async with queue.lock, self._slots:
+                self._running += 1
+                try:
+                    yield
+                finally:
+                    self._running -= 1
+        finally:
+            self._release(user_id, queue, None)
+
+    def _admit(self, queue, key):
+        self._pending += 1
+        if self._pending >= self.max_pending:
+            self._room.clear()
+        if queue is not None:
+            queue.pending += 1
+            if key is not None:
+                queue.callbacks[key] += 1
+
+    def _release(self, user_id, queue, key):
+        self._pending -= 1
+        if self._pending < self.max_pending:
+            self._room.set()
+        if queue is None:
+            return
+        queue.pending -= 1
+        if key is not None:
+            queue.callbacks[key] -= 1
+            if not queue.callbacks[key]:
+                del queue.callbacks[key]
+        if not queue.pending:
+            del self._users[user_id]
+
+    @staticmethod
+    def _drop(event, reason):
+        metrics.scheduler_dropped.inc(reason)
+        # метод уйдёт как ответ хендлера
+        if event.callback_query is not None:
+            # без ответа на кнопке крутятся часики
+            return event.callback_query.answer(None if reason == "duplicate" else OVERLOAD_TEXT)
+        if event.message is not None:
+            return event.message.answer(RESEND_TEXT)
+        return UNHANDLED
+
+    async def wait_room(self):
+        """Ждёт, пока число ожидающих апдейтов меньше max_pending (для источников, которые умеют ждать)."""
+        await self._room.wait()
+
+    def stats(self):
+        return {"queued": self._pending - self._running, "running": self._running, "users": len(self._users)}
+
+
+class PollingBackpressure(BaseRequestMiddleware):
+    """
+    Middleware сессии бота для long polling: следующий getUpdates уходит, только
+    когда в планировщике есть место, — при перегрузке апдейты ждут у Telegram, а не в памяти.
+    """
+
+    def __init__(self, update_scheduler):
+        self.scheduler = update_scheduler
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, GetUpdates):
+            await self.scheduler.wait_room()
+        return await make_request(bot, method)
+
+
+scheduler = UpdateScheduler()
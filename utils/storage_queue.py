@@ -0,0 +1,206 @@
+# utils/storage_queue.py
+import asyncio
+import logging
+import time
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from aiogram.types import InputMediaAudio
+from config import STORAGE_CHAT_ID, STORAGE_QUEUE_SIZE, STORAGE_WORKERS, STORAGE_MAX_ATTEMPTS
+from db_instance import db
+
+logger = logging.getLogger(__name__)
+
+MEDIA_GROUP_SIZE = 10  # send_media_group принимает от 2 до 10 элементов
+
+
+class StorageArchiver:
+    """
+    Фоновая архивация треков в канал-хранилище.
+    Трек сохраняется в БД сразу, а воркеры пересылают аудио в STORAGE_CHAT_ID
+    (не больше workers одновременно, с повторами и учётом RetryAfter) и
+    дописывают file_id/storage_message_id.
+    Задания бывают двух видов: ("object", file_unique_id) — одно сообщение на
+    уникальное аудио, сколько бы треков на него ни ссылалось, и ("track", id) —
+    для старых треков без file_unique_id.
+    Треки альбома уходят группами до MEDIA_GROUP_SIZE через send_media_group.
+    Очередь ограничена: если она заполнена, задание подберёт периодический обход БД.
+    """
+
+    def __init__(self, queue_size=STORAGE_QUEUE_SIZE, workers=STORAGE_WORKERS,
+                 max_attempts=STORAGE_MAX_ATTEMPTS, sweep_interval=60.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._queued = set()
+        self._paused_until = 0.0
+
+    def _put(self, jobs):
+        """Кладёт в очередь группу заданий (key, file_id, caption), пропуская уже стоящие."""
+        fresh, keys = [], set()
+        for job in jobs:
+            if job[0] not in self._queued and job[0] not in keys:
+                fresh.append(job)
+                keys.add(job[0])
+        if not fresh:
+            return True
+        try:
+            self._queue.put_nowait(fresh)
+        except asyncio.QueueFull:
+            return False
+        self._queued.update(keys)
+        return True
+
+    def enqueue(self, key, file_id, caption):
+        """Ставит задание в очередь без ожидания. False — очередь полна, задание подберёт обход."""
+        return self._put([(key, file_id, caption)])
+
+    @staticmethod
+    def _track_key(track_id, file_unique_id):
+        return ("object", file_unique_id) if file_unique_id else ("track", track_id)
+
+    def enqueue_track(self, track_id, file_unique_id, file_id, caption):
+        """Архивирует аудио трека: по объекту хранилища, если известен file_unique_id."""
+        return self.enqueue(self._track_key(track_id, file_unique_id), file_id, caption)
+
+    def enqueue_album(self, tracks):
+        """Архивирует альбом; tracks — список (track_id, file_unique_id, file_id, caption)."""
+        jobs = [(self._track_key(tid, uid), file_id, caption) for tid, uid, file_id, caption in tracks]
+        ok = True
+        for i in range(0, len(jobs), MEDIA_GROUP_SIZE):
+            ok = self._put(jobs[i:i + MEDIA_GROUP_SIZE]) and ok
+        return ok
+
+    def stats(self):
+        return {"queued": len(self._queued), "batches": self._queue.qsize()}
+
+    async def run(self, bot, sweep=True):
+        """sweep=False — только своя очередь, без обхода БД (его делает один из процессов)."""
+        if STORAGE_CHAT_ID is None:
+            logger.warning("STORAGE_CHAT_ID не задан — архивация треков отключена")
+            return
+        workers = [asyncio.create_task(self._worker(bot)) for _ in range(self.workers)]
+        try:
+            if not sweep:
+                await asyncio.gather(*workers)
+            while True:
+                await self._sweep()
+                await asyncio.sleep(self.sweep_interval)
+        finally:
+            for w in workers:
+                w.cancel()
+
+    async def _sweep(self):
+        """Подбирает из БД всё, что ждёт архивации (после рестарта или переполнения очереди)."""
+        try:
+            for file_unique_id, file_id, caption in await db.get_pending_objects(self._queue.maxsize):
+                if not self.enqueue(("object", file_unique_id), file_id, caption or ""):
+                    return
+            for track_id, file_id, title, performer in await db.get_pending_storage(self._queue.maxsize):
+                if not self.enqueue(("track", track_id), file_id, f"{performer} — {title}"):
+                    return
+        except Exception:
+            logger.exception("Ошибка обхода треков, ожидающих архивации")
+
+    async def _worker(self, bot):
+        while True:
+            jobs = await self._queue.get()
+            try:
+                if len(jobs) == 1:
+                    await self._archive(bot, *jobs[0])
+                else:
+                    await self._archive_group(bot, jobs)
+            except Exception:
+                logger.exception("Ошибка архивации %s", [job[0] for job in jobs])
+            finally:
+                self._queued.difference_update(job[0] for job in jobs)
+                self._queue.task_done()
+
+    async def _fail(self, key, permanent=False):
+        kind, ident = key
+        if kind == "object":
+            await db.fail_object_storage(ident, self.max_attempts, permanent=permanent)
+        else:
+            await db.fail_track_storage(ident, self.max_attempts, permanent=permanent)
+
+    async def _store(self, key, file_id, message_id):
+        """Записывает результат. False — ссылок на аудио уже не осталось."""
+        kind, ident = key
+        if kind == "object":
+            return await db.set_object_storage(ident, file_id, message_id) is not None
+        return await db.set_track_storage(ident, file_id, message_id)
+
+    async def _needs_upload(self, key):
+        if key[0] != "object":
+            return True
+        obj = await db.get_storage_object(key[1])
+        # уже в хранилище (повторная публикация того же аудио) или все треки удалены
+        return obj is not None and obj[3] != "stored"
+
+    async def _send(self, send):
+        """
+        Вызывает send() с повторами при сетевых ошибках и флуд-лимите.
+        None — попытки кончились; TelegramBadRequest пробрасывается.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                return await send()
+            except TelegramRetryAfter as e:
+                # флуд-лимит общий: притормаживаем все воркеры
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except TelegramNetworkError:
+                await asyncio.sleep(min(30, 2 ** attempt))
+        return None
+
+    async def _stored(self, bot, key, file_id, sent):
+        stored_file_id = file_id
+        if getattr(sent, "audio", None) and sent.audio.file_id:
+            stored_file_id = sent.audio.file_id
+        if not await self._store(key, stored_file_id, sent.message_id):
+            # трек удалили, пока он ждал в очереди — убираем осиротевшее сообщение
+            try:
+                await bot.delete_message(chat_id=STORAGE_CHAT_ID, message_id=sent.message_id)
+            except Exception:
+                pass
+
+    async def _archive(self, bot, key, file_id, caption):
+        if not await self._needs_upload(key):
+            return
+        try:
+            sent = await self._send(lambda: bot.send_audio(chat_id=STORAGE_CHAT_ID, audio=file_id, caption=caption))
+        except TelegramBadRequest as e:
+            logger.warning("%s не удалось заархивировать: %s", key, e)
+            await self._fail(key, permanent=True)
+            return
+        if sent is None:
+            # останется pending до следующего обхода, пока не кончатся попытки
+            await self._fail(key)
+            return
+        await self._stored(bot, key, file_id, sent)
+
+    async def _archive_group(self, bot, jobs):
+        jobs = [job for job in jobs if await self._needs_upload(job[0])]
+        if len(jobs) < 2:
+            for job in jobs:
+                await self._archive(bot, *job)
+            return
+        media = [InputMediaAudio(media=file_id, caption=caption) for _, file_id, caption in jobs]
+        try:
+            sent = await self._send(lambda: bot.send_media_group(chat_id=STORAGE_CHAT_ID, media=media))
+        except TelegramBadRequest as e:
+            # одно битое аудио роняет всю группу — разбираемся с каждым отдельно
+            logger.warning("Альбом не удалось заархивировать целиком (%s), архивирую по одному", e)
+            for job in jobs:
+                await self._archive(bot, *job)
+            return
+        if sent is None:
+            for key, _, _ in jobs:
+                await self._fail(key)
+            return
+        for (key, file_id, _), message in zip(jobs, sent):
+            await self._stored(bot, key, file_id, message)
+
+
+archiver = StorageArchiver()